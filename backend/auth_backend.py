@@ -2,79 +2,166 @@
 Google OAuth2 Authentication Backend
 Complete implementation with login, signup, and token refresh
 No database required - uses in-memory storage for testing
+
+The app is built by create_app(settings). Importing this module reads no
+environment and does no I/O; `app` is created on first access, so
+`uvicorn auth_backend:app` keeps working
 """
-from fastapi import FastAPI, HTTPException, Header, Depends, Request
+from fastapi import APIRouter, FastAPI, HTTPException, Header, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
-from pydantic import BaseModel, EmailStr
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
+from fastapi.responses import RedirectResponse, StreamingResponse, Response
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, Dict, Any, Union, Tuple
+from datetime import datetime
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
-from dotenv import load_dotenv
-from cryptography.fernet import Fernet
 import base64
+import gc
 import hashlib
+import hmac
 import httpx
+import json
 import secrets
+import time
 import urllib.parse
-try:
-    from supabase import create_client, Client
-except ImportError:
-    # Fallback to using httpx directly if supabase import fails
-    import httpx as _httpx
-    Client = None
-    
-    def create_client(url: str, key: str):
-        """Fallback Supabase client using httpx directly"""
-        class SimpleSupabaseClient:
-            def __init__(self, url: str, key: str):
-                self.url = url.rstrip('/')
-                self.key = key
-                self.headers = {
-                    'apikey': key,
-                    'Authorization': f'Bearer {key}',
-                    'Content-Type': 'application/json'
-                }
-            
-            def table(self, table_name: str):
-                return SimpleTable(self.url, self.headers, table_name)
-        
-        class SimpleTable:
-            def __init__(self, url: str, headers: dict, table_name: str):
-                self.url = f"{url}/rest/v1/{table_name}"
-                self.headers = headers
-                self.data_to_insert = None
-                self.conflict_column = None
-            
-            def upsert(self, data: dict, on_conflict: str = None):
-                self.data_to_insert = data
-                self.conflict_column = on_conflict
-                return self
+from settings import Settings
+from upstream import UpstreamClient
+from singleflight import SingleFlight, hash_key
+from refresh_scheduler import RefreshScheduler
+from session_store import SessionStore, create_session_store
+from session_journal import SessionJournal, JournaledSessionStore
+from session_record import SessionRecord, SCOPE_REGISTRY, to_iso, to_epoch
+from token_cipher import TokenCipher, create_token_cipher
+from oauth_state import StateSigner, InvalidStateError, pkce_challenge
+from supabase_writer import SupabaseWriteBehind
+from token_revoker import TokenRevoker
+from token_broker import AccessTokenBroker, BrokeredToken
+from session_events import SessionEventHub, Subscription, REFRESH, EXPIRY, LOGOUT
+from session_transfer import SupabaseTokenReader, SessionRehydrator, SupabaseReadError, ndjson_chunks
+from id_token import IdTokenVerifier, IdTokenError
+from login_profiles import LoginProfile, LoginProfileError, compile_profiles
+from fast_json import FastJSONResponse, dumps as json_dumps
+from resilience import ResilientUpstream, RetryBudget, UpstreamUnavailable, deadline
+from admission import AdmissionMiddleware, AdmissionRule, TokenBucketTable, IP, USER, REFRESH_TOKEN
+from metrics import Registry, HttpMetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+
+class SimpleSupabaseClient:
+    """Fallback Supabase client using httpx directly (when the SDK is not installed)"""
+
+    def __init__(self, url: str, key: str):
+        self.url = url.rstrip('/')
+        self.key = key
+        self.headers = {
+            'apikey': key,
+            'Authorization': f'Bearer {key}',
+            'Content-Type': 'application/json'
+        }
+    
+    def table(self, table_name: str):
+        return SimpleTable(self.url, self.headers, table_name)
+
+class SimpleTable:
+    def __init__(self, url: str, headers: dict, table_name: str):
+        self.url = f"{url}/rest/v1/{table_name}"
+        self.headers = headers
+        self.data_to_insert = None
+        self.conflict_column = None
+    
+    def upsert(self, data: dict, on_conflict: str = None):
+        self.data_to_insert = data
+        self.conflict_column = on_conflict
+        return self
+    
+    def execute(self):
+        params = {}
+        if self.conflict_column:
+            params['on_conflict'] = self.conflict_column
             
-            def execute(self):
-                params = {}
-                if self.conflict_column:
-                    params['on_conflict'] = self.conflict_column
-                    
-                with _httpx.Client() as client:
-                    response = client.post(
-                        self.url,
-                        json=self.data_to_insert,
-                        headers={**self.headers, 'Prefer': 'resolution=merge-duplicates'},
-                        params=params
-                    )
-                    response.raise_for_status()
-                    result = response.json()
-                    return type('Response', (), {'data': [result] if isinstance(result, dict) else result})()
-        
+        response = upstream.sync_client.post(
+            self.url,
+            json=self.data_to_insert,
+            headers={**self.headers, 'Prefer': 'resolution=merge-duplicates'},
+            params=params
+        )
+        response.raise_for_status()
+        result = response.json()
+        return type('Response', (), {'data': [result] if isinstance(result, dict) else result})()
+
+def create_supabase_client(url: str, key: str):
+    """
+    Supabase SDK client, or the httpx fallback if the SDK is not installed
+    The SDK is heavy to import, so it is only imported here, on first use
+    """
+    try:
+        from supabase import create_client
+    except ImportError:
         return SimpleSupabaseClient(url, key)
+    return create_client(url, key)
+
+# Metrics (exposed at /metrics); label children are bound once, up front
+metrics = Registry()
+HTTP_LATENCY = metrics.histogram(
+    "http_request_duration_seconds", "Request latency by route", ["route"]
+)
+HTTP_RESPONSES = metrics.counter(
+    "http_responses", "Responses by route and status class", ["route", "status"]
+)
+UPSTREAM_LATENCY = metrics.histogram(
+    "upstream_request_duration_seconds", "Upstream call latency", ["call"]
+)
+UPSTREAM_RESULTS = metrics.counter(
+    "upstream_requests", "Upstream calls by outcome", ["call", "outcome"]
+)
+CRYPTO_LATENCY = metrics.histogram(
+    "token_crypto_duration_seconds", "Token encryption/decryption time", ["op"],
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005)
+)
+ENCRYPT_TIMER = CRYPTO_LATENCY.labels("encrypt")
+DECRYPT_TIMER = CRYPTO_LATENCY.labels("decrypt")
+REFRESH_FAILURES = metrics.counter(
+    "refresh_failures", "Failed refresh token exchanges by reason", ["reason"]
+)
+REFRESH_INVALID_GRANT = REFRESH_FAILURES.labels("invalid_grant")
+REFRESH_OTHER_FAILURE = REFRESH_FAILURES.labels("other")
+TOKEN_REENCRYPTIONS = metrics.counter(
+    "token_reencryptions", "Session records re-encrypted under the current key on read"
+)
+ADMISSION_REJECTIONS = metrics.counter(
+    "admission_rejections", "Requests rejected with 429 by limiter", ["limiter"]
+)
+ADMISSION_REJECTED = {kind: ADMISSION_REJECTIONS.labels(kind) for kind in (IP, USER, REFRESH_TOKEN)}
 
-load_dotenv()
+# Scopes requested at login; registered first so they get the low mask bits
+GOOGLE_SCOPES = [
+    "openid",
+    "email",
+    "profile",
+    "https://www.googleapis.com/auth/gmail.readonly",
+    "https://www.googleapis.com/auth/gmail.modify",
+    "https://www.googleapis.com/auth/calendar",
+    "https://www.googleapis.com/auth/calendar.events"
+]
+SCOPE_REGISTRY.mask(GOOGLE_SCOPES)
 
-app = FastAPI(title="Google OAuth2 Authentication API", version="1.0.0")
+# Built-in login profiles (GET /api/auth/google/login?profile=...); LOGIN_PROFILES
+# adds to or replaces them. "default" always asks for consent so Google returns a
+# refresh token; "reauth" lets a returning user pick an account without the
+# consent screen, keeping the refresh token already stored
+DEFAULT_LOGIN_PROFILES = {
+    "default": {"scopes": GOOGLE_SCOPES, "prompt": "consent"},
+    "reauth": {
+        "scopes": ["openid", "email", "profile"],
+        "prompt": "select_account",
+        "include_granted_scopes": True,
+        "require_consent": False,
+    },
+}
 
-# CORS configuration
-origins = [
+# CORS configuration (FRONTEND_URL is added when the app is built)
+CORS_ORIGINS = [
     "http://localhost:3035",
     "http://localhost:8060",
     "http://localhost:5173",
@@ -82,54 +169,62 @@ origins = [
     "http://localhost:3033",
     "http://ai-supply-guardian.zentraid.com",
     "https://ai-supply-guardian.zentraid.com",
-    os.getenv("FRONTEND_URL", "https://yourdomain.com"),
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# In-memory storage for user sessions
-user_sessions: Dict[str, Dict[str, Any]] = {}
-
-# Encryption setup
-ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", "")
-if not ENCRYPTION_KEY:
-    raise ValueError("ENCRYPTION_KEY must be set in environment variables")
-key = base64.urlsafe_b64encode(hashlib.sha256(ENCRYPTION_KEY.encode()).digest())
-cipher_suite = Fernet(key)
-
-# Supabase configuration
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-
-if not all([SUPABASE_URL, SUPABASE_ANON_KEY]):
-    raise ValueError("Supabase credentials must be set in environment variables")
+# Admission control: token buckets per client IP, user id and refresh token
+ADMISSION_RULES = [
+    AdmissionRule("/api/auth/google/login", [IP]),
+    AdmissionRule("/api/auth/google/callback", [IP]),
+    AdmissionRule("/api/auth/refresh", [IP, REFRESH_TOKEN]),
+    # Exact rules win over prefixes: "batch" is not a user id, so batch callers
+    # are limited per client rather than sharing one "batch" user bucket
+    AdmissionRule("/api/auth/user/batch", [IP]),
+    AdmissionRule("/api/auth/user/", [USER], prefix=True),
+    AdmissionRule("/api/auth/validate", [USER]),
+    AdmissionRule("/api/auth/logout", [USER]),
+    AdmissionRule("/api/auth/session/", [USER], prefix=True),
+    AdmissionRule("/api/auth/events/", [USER], prefix=True),
+    # Broker calls can force refreshes with a high min_ttl
+    AdmissionRule("/api/auth/token/", [USER], prefix=True),
+]
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+# Upper bound for the broker's min_ttl: Google access tokens live for an hour
+MAX_TOKEN_MIN_TTL_SECONDS = 3000
 
-# Google OAuth2 configuration
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
-GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
-# GOOGLE_REDIRECT_URI = "http://localhost:8060/api/auth/google/callback"
-FRONTEND_URL = os.getenv("FRONTEND_URL", "https://ai-supply-guardian.zentraid.com")
+# Supabase rows carry no token expiry; they are written just after Google issues
+# the access token (valid 3599s), so re-hydrated tokens are assumed to expire
+# this long after `updated_at`
+SUPABASE_ACCESS_TOKEN_LIFETIME_SECONDS = 3500
 
-# Validate required environment variables
-if not all([GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_REDIRECT_URI]):
-    raise ValueError("Google OAuth credentials must be set in environment variables")
+# Process-wide components, built from Settings by configure() (see create_app)
+settings: Settings
+upstream: UpstreamClient
+user_sessions: SessionStore
+oauth_states: SessionStore
+token_cipher: Optional[TokenCipher] = None
+crypto_executor: ThreadPoolExecutor
+supabase_writer: SupabaseWriteBehind
+google_upstream: ResilientUpstream
+token_revoker: TokenRevoker
+token_broker: AccessTokenBroker
+session_events: SessionEventHub
+session_rehydrator: SessionRehydrator
+id_token_verifier: IdTokenVerifier
+refresh_flights: SingleFlight
+refresh_scheduler: RefreshScheduler
+state_signer: StateSigner
+login_profiles: Dict[str, LoginProfile] = {}
+admission_limiters: Dict[str, TokenBucketTable] = {}
+_supabase = None
 
-# OAuth2 URLs
-GOOGLE_AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth"
-GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
-GOOGLE_USERINFO_URL = "https://www.googleapis.com/oauth2/v2/userinfo"
+def get_supabase():
+    """Supabase table client, created on first use"""
+    global _supabase
+    if _supabase is None:
+        _supabase = create_supabase_client(settings.supabase_url, settings.supabase_anon_key)
+    return _supabase
 
-# Store for OAuth2 state (in production, use Redis)
-oauth_states: Dict[str, Dict[str, Any]] = {}
+router = APIRouter()
 
 # ============================================================================
 # Pydantic Models
@@ -149,6 +244,9 @@ class TokenData(BaseModel):
     expires_in: int
     token_type: str = "Bearer"
     scope: str
+    # Absolute expiry (epoch seconds) fixed when the token was issued, so a
+    # result shared after the fact never reports a later one; not serialized
+    expires_at: Optional[int] = Field(default=None, exclude=True)
 
 class AuthResponse(BaseModel):
     success: bool
@@ -159,6 +257,9 @@ class AuthResponse(BaseModel):
 class RefreshTokenRequest(BaseModel):
     refresh_token: str
 
+class BatchUserRequest(BaseModel):
+    user_ids: list[str]
+
 class UserSession(BaseModel):
     user_id: str
     email: str
@@ -175,18 +276,66 @@ class UserSession(BaseModel):
 # Helper Functions
 # ============================================================================
 
+def encrypt_token_bytes(token: str) -> bytes:
+    """Encrypt token for secure storage, keeping the ciphertext as bytes"""
+    started = time.perf_counter()
+    encrypted = token_cipher.encrypt(token.encode())
+    ENCRYPT_TIMER.time_since(started)
+    return encrypted
+
 def encrypt_token(token: str) -> str:
-    """Encrypt token for secure storage"""
-    return cipher_suite.encrypt(token.encode()).decode()
+    """Encrypt token for secure storage, as URL-safe text"""
+    return base64.urlsafe_b64encode(encrypt_token_bytes(token)).decode()
 
-def decrypt_token(encrypted_token: str) -> str:
-    """Decrypt token"""
-    return cipher_suite.decrypt(encrypted_token.encode()).decode()
+def decrypt_token(encrypted_token: Union[str, bytes]) -> str:
+    """Decrypt token (raw ciphertext bytes, or text from encrypt_token)"""
+    if isinstance(encrypted_token, str):
+        encrypted_token = base64.urlsafe_b64decode(encrypted_token)
+    started = time.perf_counter()
+    token = token_cipher.decrypt(encrypted_token).decode()
+    DECRYPT_TIMER.time_since(started)
+    return token
 
 def generate_state() -> str:
     """Generate a secure random state for OAuth2"""
     return secrets.token_urlsafe(32)
 
+async def create_oauth_state(prompt: Optional[str]) -> tuple[str, Optional[str]]:
+    """Create a login state; returns (state, PKCE code verifier or None)"""
+    if settings.oauth_state_mode == "signed":
+        return state_signer.issue(prompt=prompt, pkce=settings.oauth_pkce_enabled)
+    
+    state = generate_state()
+    code_verifier = secrets.token_urlsafe(48) if settings.oauth_pkce_enabled else None
+    
+    # Store state with timestamp for validation
+    state_data = {
+        "created_at": datetime.utcnow().isoformat(),
+        "type": "login",
+        "prompt": prompt
+    }
+    if code_verifier:
+        state_data["code_verifier"] = code_verifier
+    await oauth_states.set(state, state_data)
+    return state, code_verifier
+
+async def consume_oauth_state(state: str) -> Optional[Dict[str, Any]]:
+    """Validate a callback state and consume it so it cannot be replayed"""
+    if settings.oauth_state_mode == "signed":
+        try:
+            state_data = state_signer.verify(state)
+        except InvalidStateError as e:
+            print(f"❌ Rejected OAuth state: {str(e)}")
+            return None
+        # The signer only remembers nonces per process; recording them in the
+        # state store makes a shared backend reject replays on every worker
+        nonce = state_data.pop("nonce")
+        if not await oauth_states.add(f"used:{nonce}", {"used_at": int(time.time())}, ttl=state_signer.replay_window):
+            print("❌ Rejected OAuth state: State already used")
+            return None
+        return state_data
+    return await oauth_states.pop(state)
+
 async def store_user_session(
     user_id: str,
     email: str,
@@ -198,49 +347,176 @@ async def store_user_session(
     scopes: list[str]
 ) -> None:
     """Store user session in memory"""
-    encrypted_access_token = encrypt_token(access_token)
-    encrypted_refresh_token = encrypt_token(refresh_token) if refresh_token else None
-    
-    expires_at = (datetime.utcnow() + timedelta(seconds=expires_in)).isoformat()
-    
-    session_data = {
-        "user_id": user_id,
-        "email": email,
-        "name": name,
-        "picture": picture,
-        "access_token": encrypted_access_token,
-        "refresh_token": encrypted_refresh_token,
-        "expires_at": expires_at,
-        "scopes": scopes,
-        "created_at": datetime.utcnow().isoformat(),
-        "updated_at": datetime.utcnow().isoformat()
-    }
+    now = int(time.time())
+    session = SessionRecord(
+        user_id=user_id,
+        email=email,
+        name=name,
+        picture=picture,
+        access_token=encrypt_token_bytes(access_token),
+        refresh_token=encrypt_token_bytes(refresh_token) if refresh_token else None,
+        expires_at=now + expires_in,
+        scope_mask=SCOPE_REGISTRY.mask(scopes),
+        created_at=now,
+        updated_at=now
+    )
+    
+    await user_sessions.set(user_id, session)
+    token_broker.replace(user_id, BrokeredToken(access_token, session.expires_at, session.scopes))
+    if session_events.has_subscribers(user_id):
+        session_events.publish(
+            user_id, REFRESH,
+            session_event(session, access_token, refresh_token),
+            expires_at=session.expires_at
+        )
     
-    user_sessions[user_id] = session_data
+    # Keep the stored tokens fresh for server-side consumers
+    if refresh_token:
+        refresh_scheduler.schedule(user_id, session.expires_at)
 
 async def get_user_session(user_id: str) -> Optional[UserSession]:
     """Retrieve user session from memory"""
-    session = user_sessions.get(user_id)
+    session = await user_sessions.get(user_id)
     if not session:
         return None
     
-    # Decrypt tokens
-    access_token = decrypt_token(session["access_token"])
-    refresh_token = decrypt_token(session["refresh_token"]) if session.get("refresh_token") else None
+    model, reencrypted = open_session(session)
+    if reencrypted:
+        # Shared backends hold a copy, so write the re-encrypted record back
+        await user_sessions.set(user_id, session)
+    return model
+
+def open_session(session: SessionRecord) -> Tuple[UserSession, bool]:
+    """
+    Decrypt a session record, re-encrypting it in place if it was written
+    under an older key or cipher; returns (session, re-encrypted)
+    """
+    model = session_to_model(session)
+    if not needs_reencryption(session):
+        return model, False
+    
+    session.access_token = encrypt_token_bytes(model.access_token)
+    if model.refresh_token:
+        session.refresh_token = encrypt_token_bytes(model.refresh_token)
+    TOKEN_REENCRYPTIONS.inc()
+    return model, True
+
+def needs_reencryption(session: SessionRecord) -> bool:
+    """True if either token was written under an older key or cipher"""
+    return token_cipher.needs_rotation(session.access_token) or (
+        session.refresh_token is not None and token_cipher.needs_rotation(session.refresh_token)
+    )
+
+def reencrypt_record(session: SessionRecord) -> bool:
+    """Re-encrypt a record's tokens under the current key if needed; returns True if it did"""
+    if not needs_reencryption(session):
+        return False
+    session.access_token = encrypt_token_bytes(decrypt_token(session.access_token))
+    if session.refresh_token:
+        session.refresh_token = encrypt_token_bytes(decrypt_token(session.refresh_token))
+    TOKEN_REENCRYPTIONS.inc()
+    return True
+
+def session_to_model(session: SessionRecord) -> UserSession:
+    """Decrypt a stored session record into a UserSession"""
+    access_token = decrypt_token(session.access_token)
+    refresh_token = decrypt_token(session.refresh_token) if session.refresh_token else None
     
     return UserSession(
-        user_id=session["user_id"],
-        email=session["email"],
-        name=session["name"],
-        picture=session.get("picture"),
+        user_id=session.user_id,
+        email=session.email,
+        name=session.name,
+        picture=session.picture,
         access_token=access_token,
         refresh_token=refresh_token,
-        expires_at=session["expires_at"],
-        scopes=session.get("scopes", []),
-        created_at=session["created_at"],
-        updated_at=session["updated_at"]
+        expires_at=to_iso(session.expires_at),
+        scopes=session.scopes,
+        created_at=to_iso(session.created_at),
+        updated_at=to_iso(session.updated_at)
     )
 
+async def stored_refresh_token(user_id: str) -> Optional[str]:
+    """The refresh token of the user's stored session, if any"""
+    session = await user_sessions.get(user_id)
+    if not session or not session.refresh_token:
+        return None
+    return decrypt_token(session.refresh_token)
+
+async def get_session_profile(user_id: str) -> Optional[SessionRecord]:
+    """
+    Return the stored session record without decrypting tokens
+    Only the profile fields and `expires_at` should be read from it
+    """
+    return await user_sessions.get(user_id)
+
+def session_event(session: SessionRecord, access_token: str, refresh_token: Optional[str]) -> Dict[str, Any]:
+    """Payload of a refresh event: the new tokens and profile, shaped like UserSession"""
+    return {
+        "user_id": session.user_id,
+        "email": session.email,
+        "name": session.name,
+        "picture": session.picture,
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "expires_at": to_iso(session.expires_at),
+        "scopes": session.scopes
+    }
+
+async def publish_session_expiry(user_id: str) -> None:
+    """
+    Called by the event hub when a subscribed user's token reaches expiry
+    
+    The session may have been refreshed elsewhere (another worker) or ended
+    in the meantime, so the stored record decides which event is sent
+    """
+    session = await user_sessions.get(user_id)
+    if session is None:
+        session_events.publish(user_id, LOGOUT, {"reason": "session_ended"})
+    elif session.is_expired():
+        session_events.publish(user_id, EXPIRY, {"requires_refresh": True})
+    else:
+        model = session_to_model(session)
+        session_events.publish(
+            user_id, REFRESH,
+            session_event(session, model.access_token, model.refresh_token),
+            expires_at=session.expires_at
+        )
+
+def session_etag(session: SessionRecord) -> str:
+    """
+    Validator for the bootstrap response: changes whenever the stored tokens
+    or profile change, and when the session expires
+    """
+    digest = hashlib.sha256(
+        f"{session.user_id}|{session.updated_at}|{session.expires_at}|{session.name}|{session.picture}".encode()
+        + session.access_token
+    ).hexdigest()[:32]
+    return f'"{digest}-{0 if session.is_expired() else 1}"'
+
+def session_validation(session: Optional[SessionRecord]) -> Dict[str, Any]:
+    """Validation result for a raw session record (tokens are not decrypted)"""
+    if not session:
+        return {"valid": False, "message": "No session found"}
+    
+    # Check if token is expired
+    if session.is_expired():
+        return {
+            "valid": False,
+            "message": "Token expired",
+            "requires_refresh": True
+        }
+    
+    return {
+        "valid": True,
+        "message": "Session is valid",
+        "user": {
+            "user_id": session.user_id,
+            "email": session.email,
+            "name": session.name,
+            "picture": session.picture
+        }
+    }
+
 async def store_tokens_in_supabase(
     google_user_id: str,
     email: str,
@@ -250,7 +526,12 @@ async def store_tokens_in_supabase(
     refresh_token: Optional[str],
     supabase_user_id: Optional[str] = None
 ) -> dict:
-    """Store Google OAuth tokens in Supabase"""
+    """
+    Store Google OAuth tokens in Supabase
+    
+    With write-behind enabled the row is queued for a bulk upsert and the
+    queued row is returned immediately
+    """
     try:
         token_data = {
             "google_user_id": google_user_id,
@@ -265,11 +546,18 @@ async def store_tokens_in_supabase(
         if supabase_user_id:
             token_data["user_id"] = supabase_user_id
         
-        # Upsert (insert or update) based on google_user_id
-        response = supabase.table("google_oauth_tokens").upsert(
-            token_data,
-            on_conflict="google_user_id"
-        ).execute()
+        if settings.supabase_write_behind:
+            await supabase_writer.enqueue(token_data)
+            return token_data
+        
+        # Upsert (insert or update) based on google_user_id, in a thread so
+        # the synchronous client does not block the event loop
+        response = await asyncio.to_thread(
+            get_supabase().table("google_oauth_tokens").upsert(
+                token_data,
+                on_conflict="google_user_id"
+            ).execute
+        )
         
         print(f"✅ Stored tokens in Supabase for user: {email}")
         return response.data[0] if response.data else {}
@@ -277,11 +565,449 @@ async def store_tokens_in_supabase(
         print(f"❌ Error storing tokens in Supabase: {str(e)}")
         return {}
 
+async def fetch_user_info(access_token: str, id_token: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Resolve the user's profile from the verified id_token when available,
+    falling back to a request to the userinfo endpoint
+    """
+    if id_token and settings.id_token_verification:
+        try:
+            return await id_token_verifier.userinfo(id_token, access_token)
+        except IdTokenError as e:
+            print(f"⚠️ id_token verification failed, using userinfo endpoint: {str(e)}")
+    
+    def send(timeout: float):
+        return upstream.client.get(
+            settings.google_userinfo_url,
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=timeout
+        )
+    
+    if settings.userinfo_hedge_after_seconds > 0:
+        userinfo_response = await google_upstream.hedged("userinfo", send, settings.userinfo_hedge_after_seconds)
+    else:
+        userinfo_response = await google_upstream.call("userinfo", send, idempotent=True)
+    
+    if userinfo_response.status_code != 200:
+        raise HTTPException(
+            status_code=400,
+            detail="Failed to obtain user information"
+        )
+    
+    return userinfo_response.json()
+
+async def exchange_refresh_token(refresh_token: str) -> AuthResponse:
+    """Exchange a refresh token with Google and update the stored session"""
+    # Refreshing is repeatable (Google does not rotate refresh tokens), so
+    # timeouts and 5xx may be retried
+    token_response = await google_upstream.call(
+        "token",
+        lambda timeout: upstream.client.post(
+            settings.google_token_url,
+            data={
+                "client_id": settings.google_client_id,
+                "client_secret": settings.google_client_secret,
+                "refresh_token": refresh_token,
+                "grant_type": "refresh_token",
+            },
+            timeout=timeout
+        ),
+        idempotent=True
+    )
+    
+    if token_response.status_code != 200:
+        error_data = token_response.json()
+        if error_data.get("error") == "invalid_grant":
+            REFRESH_INVALID_GRANT.inc()
+            raise HTTPException(
+                status_code=401,
+                detail="Refresh token expired or invalid. Please login again."
+            )
+        REFRESH_OTHER_FAILURE.inc()
+        raise HTTPException(
+            status_code=400,
+            detail=f"Failed to refresh token: {token_response.text}"
+        )
+    
+    tokens = token_response.json()
+    new_access_token = tokens["access_token"]
+    new_refresh_token = tokens.get("refresh_token", refresh_token)
+    expires_in = tokens["expires_in"]
+    expires_at = int(time.time()) + expires_in
+    
+    # Get user info with new access token
+    userinfo = await fetch_user_info(new_access_token, tokens.get("id_token"))
+    
+    # Update user session with new tokens
+    await store_user_session(
+        user_id=userinfo["id"],
+        email=userinfo["email"],
+        name=userinfo.get("name", userinfo["email"]),
+        picture=userinfo.get("picture"),
+        access_token=new_access_token,
+        refresh_token=new_refresh_token,
+        expires_in=expires_in,
+        scopes=tokens.get("scope", "").split()
+    )
+    
+    return AuthResponse(
+        success=True,
+        message="Token refreshed successfully",
+        user=UserProfile(
+            user_id=userinfo["id"],
+            email=userinfo["email"],
+            name=userinfo.get("name", userinfo["email"]),
+            picture=userinfo.get("picture"),
+            given_name=userinfo.get("given_name"),
+            family_name=userinfo.get("family_name")
+        ),
+        tokens=TokenData(
+            access_token=new_access_token,
+            refresh_token=new_refresh_token,
+            expires_in=expires_in,
+            token_type="Bearer",
+            scope=tokens.get("scope", ""),
+            expires_at=expires_at
+        )
+    )
+
+async def refresh_stored_session(session: UserSession) -> AuthResponse:
+    """Refresh a stored session with its own refresh token and persist the new tokens"""
+    result = await refresh_flights.do(
+        hash_key(session.refresh_token),
+        lambda: exchange_refresh_token(session.refresh_token)
+    )
+    
+    await store_tokens_in_supabase(
+        google_user_id=result.user.user_id,
+        email=result.user.email,
+        name=result.user.name,
+        picture=result.user.picture,
+        access_token=result.tokens.access_token,
+        refresh_token=result.tokens.refresh_token
+    )
+    return result
+
+async def proactive_refresh(user_id: str) -> None:
+    """Refresh a stored session ahead of expiry and persist the new tokens"""
+    session = await get_user_session(user_id)
+    if not session or not session.refresh_token:
+        return
+    
+    try:
+        await refresh_stored_session(session)
+    except HTTPException as e:
+        if e.status_code == 401:
+            # Refresh token revoked or expired; the user must log in again
+            print(f"⚠️ Refresh token no longer valid for user: {user_id}")
+            return
+        raise
+
+async def load_brokered_token(user_id: str) -> Optional[BrokeredToken]:
+    """The stored access token for the token broker (only that token is decrypted)"""
+    session = await user_sessions.get(user_id)
+    if not session:
+        return None
+    return BrokeredToken(decrypt_token(session.access_token), session.expires_at, session.scopes)
+
+async def verify_brokered_token(user_id: str, token: BrokeredToken) -> bool:
+    """Whether a cached broker token still matches the shared store (no other worker replaced or removed it)"""
+    session = await user_sessions.get(user_id)
+    return session is not None and session.expires_at == token.expires_at
+
+async def refresh_brokered_token(user_id: str) -> Optional[BrokeredToken]:
+    """Refresh a stored session for the token broker"""
+    session = await get_user_session(user_id)
+    if not session:
+        return None
+    if not session.refresh_token:
+        raise HTTPException(
+            status_code=401,
+            detail="Access token expiring and no refresh token stored. Please login again."
+        )
+    
+    result = await refresh_stored_session(session)
+    # The result may come from the single-flight grace cache, issued a few seconds ago
+    return BrokeredToken(result.tokens.access_token, result.tokens.expires_at, result.tokens.scope.split())
+
+def schedule_restored_refresh(session: SessionRecord) -> None:
+    """
+    Re-arm proactive refresh for a session restored from disk or Supabase
+    
+    Sessions whose access token has already expired are refreshed on first
+    use instead, so restoring many old sessions (after long downtime, or a
+    re-hydration) neither storms Google nor revives unused refresh tokens
+    """
+    if session.refresh_token and session.expires_at > time.time():
+        refresh_scheduler.schedule(session.user_id, session.expires_at)
+
+def session_from_supabase_row(row: Dict[str, Any]) -> Optional[SessionRecord]:
+    """
+    Session record for a google_oauth_tokens row (tokens encrypted here), or
+    None for a logged-out row or an expired one without a refresh token
+    
+    Supabase keeps no scopes; they are filled in by the first refresh
+    """
+    access_token = row.get("access_token")
+    refresh_token = row.get("refresh_token") or None
+    if not access_token:
+        return None
+    updated_at = to_epoch(row["updated_at"])
+    expires_at = updated_at + SUPABASE_ACCESS_TOKEN_LIFETIME_SECONDS
+    if expires_at <= time.time() and not refresh_token:
+        return None
+    return SessionRecord(
+        user_id=row["google_user_id"],
+        email=row["email"],
+        name=row.get("name") or row["email"],
+        picture=row.get("picture"),
+        access_token=encrypt_token_bytes(access_token),
+        refresh_token=encrypt_token_bytes(refresh_token) if refresh_token else None,
+        expires_at=expires_at,
+        scope_mask=0,
+        created_at=updated_at,
+        updated_at=updated_at
+    )
+
+def session_from_export_line(line: bytes) -> Optional[SessionRecord]:
+    """
+    Session record for one exported NDJSON line, re-encrypted under the current
+    key (tokens from another deployment decrypt with ENCRYPTION_KEYS_PREVIOUS);
+    None for an expired session without a refresh token
+    """
+    record = SessionRecord.from_dict(json.loads(line))
+    if record.is_expired() and not record.refresh_token:
+        return None
+    reencrypt_record(record)
+    return record
+
+async def save_transferred_sessions(records: list[SessionRecord]) -> int:
+    """
+    Store imported or re-hydrated sessions, never replacing a stored session
+    updated at the same time or later; returns how many were stored
+    """
+    current = await user_sessions.get_many([record.user_id for record in records])
+    newer = [
+        record for record, existing in zip(records, current)
+        if existing is None or existing.updated_at < record.updated_at
+    ]
+    # Issued together so shared backends can write them in one round trip or transaction
+    await asyncio.gather(*(user_sessions.set(record.user_id, record) for record in newer))
+    for record in newer:
+        token_broker.invalidate(record.user_id)
+        schedule_restored_refresh(record)
+    return len(newer)
+
+def tune_gc_for_restore() -> None:
+    """
+    GC policy for a journal restore, applied before serving: freeze the
+    objects built at startup so collections skip them, and with
+    GC_GEN0_THRESHOLD set raise the generation-0 threshold so the restored
+    sessions are not rescanned often
+    """
+    gc.freeze()
+    if settings.gc_gen0_threshold > 0:
+        _, gen1, gen2 = gc.get_threshold()
+        gc.set_threshold(settings.gc_gen0_threshold, gen1, gen2)
+
+async def restore_sessions_on_startup() -> None:
+    """Replay the session journal in the background"""
+    try:
+        count = await user_sessions.restore(on_record=schedule_restored_refresh)
+    except Exception as e:
+        # The store is marked ready regardless, so requests are served without the restored sessions
+        print(f"❌ Session restore failed, serving without persisted sessions: {str(e)}")
+        return
+    print(f"✅ Restored {count} sessions in {user_sessions.restore_seconds * 1000:.0f}ms")
+
+async def rehydrate_sessions_on_startup() -> None:
+    """Warm the session store from Supabase in the background"""
+    try:
+        await session_rehydrator.run()
+    except Exception as e:
+        print(f"❌ Session re-hydration from Supabase failed: {str(e)}")
+
+# ============================================================================
+# Metrics Collection
+# ============================================================================
+
+def _bind_upstream_calls(config: Settings) -> Dict[str, tuple]:
+    """Map upstream URL paths to pre-bound (latency, ok, error, exception) children"""
+    calls = {
+        config.google_token_url: "token",
+        config.google_userinfo_url: "userinfo",
+        config.google_revoke_url: "revoke",
+        config.google_certs_url: "jwks",
+    }
+    bound = {}
+    for url, call in calls.items():
+        bound[urllib.parse.urlparse(url).path] = (
+            UPSTREAM_LATENCY.labels(call),
+            UPSTREAM_RESULTS.labels(call, "ok"),
+            UPSTREAM_RESULTS.labels(call, "error"),
+            UPSTREAM_RESULTS.labels(call, "exception"),
+        )
+    return bound
+
+# Bound per configured Google URL in configure()
+UPSTREAM_CALLS: Dict[str, tuple] = {}
+UPSTREAM_SUPABASE = (
+    UPSTREAM_LATENCY.labels("supabase_upsert"),
+    UPSTREAM_RESULTS.labels("supabase_upsert", "ok"),
+    UPSTREAM_RESULTS.labels("supabase_upsert", "error"),
+    UPSTREAM_RESULTS.labels("supabase_upsert", "exception"),
+)
+
+def observe_upstream(request: httpx.Request, status: Optional[int], elapsed: float) -> None:
+    """Record one upstream call; installed as the shared client's observer"""
+    path = request.url.path
+    children = UPSTREAM_CALLS.get(path)
+    if children is None:
+        if not path.startswith("/rest/v1/"):
+            return
+        children = UPSTREAM_SUPABASE
+    latency, ok, error, exception = children
+    latency.observe(elapsed)
+    if status is None:
+        exception.inc()
+    elif status < 400:
+        ok.inc()
+    else:
+        error.inc()
+
+def _store_stat(field: str):
+    def read():
+        for name, store in (("sessions", user_sessions), ("oauth_states", oauth_states)):
+            yield (name,), store.stats().get(field)
+    return read
+
+metrics.callback("session_store_entries", "Entries held by each store", "gauge", _store_stat("size"), ["store"])
+metrics.callback("session_store_evictions", "LRU evictions", "counter", _store_stat("evicted"), ["store"])
+metrics.callback("session_store_expirations", "TTL expirations", "counter", _store_stat("expired"), ["store"])
+metrics.callback("session_store_hits", "Store lookups that found a live entry", "counter", _store_stat("hits"), ["store"])
+metrics.callback("session_store_misses", "Store lookups that found nothing", "counter", _store_stat("misses"), ["store"])
+metrics.callback(
+    "refresh_coalesced", "Refresh requests served by a shared exchange or cached result", "counter",
+    lambda: [((), refresh_flights.coalesced + refresh_flights.cache_hits)]
+)
+metrics.callback(
+    "refresh_exchanges", "Refresh token exchanges sent to Google", "counter",
+    lambda: [((), refresh_flights.executions)]
+)
+metrics.callback(
+    "proactive_refresh_scheduled", "Sessions scheduled for proactive refresh", "gauge",
+    lambda: [((), refresh_scheduler.stats()["scheduled"])]
+)
+metrics.callback(
+    "id_token_verifications", "Local id_token verifications by outcome", "counter",
+    lambda: [(("ok",), id_token_verifier.verified), (("failed",), id_token_verifier.failed)],
+    ["outcome"]
+)
+metrics.callback(
+    "jwks_fetches", "Fetches of Google's signing keys", "counter",
+    lambda: [((), id_token_verifier.jwks_fetches)]
+)
+metrics.callback(
+    "supabase_write_queue_pending", "Token upserts waiting to be flushed", "gauge",
+    lambda: [((), supabase_writer.stats()["pending"])]
+)
+metrics.callback(
+    "supabase_writes", "Token upserts by outcome", "counter",
+    lambda: [(("written",), supabase_writer.written), (("merged",), supabase_writer.merged), (("dropped",), supabase_writer.dropped)],
+    ["outcome"]
+)
+metrics.callback(
+    "upstream_connections", "Pooled upstream connections", "gauge",
+    lambda: [((state,), upstream.stats()["connections"][state]) for state in ("active", "idle")],
+    ["state"]
+)
+metrics.callback(
+    "upstream_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", "gauge",
+    lambda: [((name,), breaker.state) for name, breaker in google_upstream.breakers.items()],
+    ["upstream"]
+)
+metrics.callback(
+    "upstream_circuit_rejections", "Calls failed fast by an open circuit", "counter",
+    lambda: [((name,), breaker.rejected) for name, breaker in google_upstream.breakers.items()],
+    ["upstream"]
+)
+metrics.callback(
+    "upstream_retries", "Retries and hedges by retry budget decision", "counter",
+    lambda: [
+        (("allowed",), google_upstream.budget.allowed),
+        (("rejected",), google_upstream.budget.rejected),
+    ],
+    ["decision"]
+)
+metrics.callback(
+    "upstream_concurrency_in_use", "Google calls holding a concurrency slot", "gauge",
+    lambda: [((), google_upstream.slots.in_use)]
+)
+metrics.callback(
+    "upstream_concurrency_rejections", "Google calls shed waiting for a concurrency slot", "counter",
+    lambda: [((), google_upstream.slots.rejected)]
+)
+metrics.callback(
+    "admission_buckets", "Tracked rate-limit buckets by limiter", "gauge",
+    lambda: [((kind,), len(limiter)) for kind, limiter in admission_limiters.items()],
+    ["limiter"]
+)
+metrics.callback(
+    "upstream_hedged_requests", "Hedged userinfo requests sent and won", "counter",
+    lambda: [(("sent",), google_upstream.hedges), (("won",), google_upstream.hedge_wins)],
+    ["outcome"]
+)
+metrics.callback(
+    "token_broker_requests", "Token broker lookups by how they were served", "counter",
+    lambda: [
+        (("cache",), token_broker.hits),
+        (("store",), token_broker.loaded),
+        (("refreshed",), token_broker.refreshed),
+    ],
+    ["source"]
+)
+metrics.callback(
+    "session_event_subscribers", "Open session event streams", "gauge",
+    lambda: [((), session_events.stats()["subscribers"])]
+)
+metrics.callback(
+    "session_events", "Session events by outcome", "counter",
+    lambda: [
+        (("published",), session_events.published),
+        (("delivered",), session_events.delivered),
+        (("dropped",), session_events.stats()["dropped"]),
+    ],
+    ["outcome"]
+)
+metrics.callback(
+    "session_rehydration_rows", "Supabase rows read by re-hydration, by outcome", "counter",
+    lambda: [
+        (("restored",), session_rehydrator.restored),
+        (("skipped",), session_rehydrator.rows - session_rehydrator.restored - session_rehydrator.failed),
+        (("failed",), session_rehydrator.failed),
+    ],
+    ["outcome"]
+)
+metrics.callback(
+    "token_revocation_queue_pending", "Tokens waiting to be revoked (including retries)", "gauge",
+    lambda: [((), token_revoker.stats()["pending"])]
+)
+metrics.callback(
+    "token_revocations", "Token revocations by outcome", "counter",
+    lambda: [
+        (("revoked",), token_revoker.revoked),
+        (("already_invalid",), token_revoker.already_invalid),
+        (("retried",), token_revoker.retries),
+        (("dead_lettered",), token_revoker.dead_lettered),
+    ],
+    ["outcome"]
+)
+
 # ============================================================================
 # OAuth2 Endpoints
 # ============================================================================
 
-@app.get("/")
+@router.get("/")
 async def root():
     """Health check endpoint"""
     return {
@@ -290,77 +1016,64 @@ async def root():
         "version": "1.0.0"
     }
 
-@app.get("/api/auth/google/login")
-async def google_login(prompt: Optional[str] = "consent"):
+@router.get("/api/auth/google/login")
+async def google_login(prompt: Optional[str] = None, profile: str = "default"):
     """
     Initiate Google OAuth2 login flow
     Returns the authorization URL for the frontend to redirect to
     
-    Always requests consent to ensure we get refresh tokens
+    `profile` names a login profile (scopes, default prompt, offline access)
+    and `prompt` overrides its prompt. The default profile always adds
+    consent so that Google returns a refresh token
     """
-    state = generate_state()
-    
-    # Store state with timestamp for validation
-    oauth_states[state] = {
-        "created_at": datetime.utcnow().isoformat(),
-        "type": "login",
-        "prompt": prompt
-    }
-    
-    # Build authorization URL
-    params = {
-        "client_id": GOOGLE_CLIENT_ID,
-        "redirect_uri": GOOGLE_REDIRECT_URI,
-        "response_type": "code",
-        "scope": " ".join([
-            "openid",
-            "email",
-            "profile",
-            "https://www.googleapis.com/auth/gmail.readonly",
-            "https://www.googleapis.com/auth/gmail.modify",
-            "https://www.googleapis.com/auth/calendar",
-            "https://www.googleapis.com/auth/calendar.events"
-        ]),
-        "access_type": "offline",
-        "prompt": "consent",  # Always force consent to get refresh token
-        "state": state
-    }
+    login_profile = login_profiles.get(profile)
+    if login_profile is None:
+        raise HTTPException(status_code=400, detail=f"Unknown login profile: {profile}")
+    try:
+        prompt = login_profile.resolve_prompt(prompt)
+    except LoginProfileError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    auth_url = f"{GOOGLE_AUTH_URL}?{urllib.parse.urlencode(params)}"
+    state, code_verifier = await create_oauth_state(prompt)
+    auth_url = login_profile.url(state, prompt, pkce_challenge(code_verifier) if code_verifier else None)
     
-    return {
+    return FastJSONResponse({
         "authorization_url": auth_url,
         "state": state
-    }
+    })
 
-@app.get("/api/auth/google/callback")
+@router.get("/api/auth/google/callback")
 async def google_callback(code: str, state: str):
     """
     Handle Google OAuth2 callback
     Exchange authorization code for tokens and create user session
     """
-    # Validate state
-    if state not in oauth_states:
+    # Validate state and remove it so it cannot be replayed
+    state_data = await consume_oauth_state(state)
+    if state_data is None:
         return RedirectResponse(
-            url=f"{FRONTEND_URL}?error=invalid_state",
+            url=f"{settings.frontend_url}?error=invalid_state",
             status_code=302
         )
     
-    # Remove state after validation
-    oauth_states.pop(state)
-    
     try:
         # Exchange authorization code for tokens
-        async with httpx.AsyncClient() as http_client:
-            token_response = await http_client.post(
-                GOOGLE_TOKEN_URL,
-                data={
-                    "code": code,
-                    "client_id": GOOGLE_CLIENT_ID,
-                    "client_secret": GOOGLE_CLIENT_SECRET,
-                    "redirect_uri": GOOGLE_REDIRECT_URI,
-                    "grant_type": "authorization_code",
-                }
+        token_request = {
+            "code": code,
+            "client_id": settings.google_client_id,
+            "client_secret": settings.google_client_secret,
+            "redirect_uri": settings.google_redirect_uri,
+            "grant_type": "authorization_code",
+        }
+        if state_data.get("code_verifier"):
+            token_request["code_verifier"] = state_data["code_verifier"]
+        
+        # One budget for the code exchange and the userinfo step together
+        with deadline(settings.upstream_deadline_seconds):
+            # Authorization codes are single-use: only retried if never sent
+            token_response = await google_upstream.call(
+                "token",
+                lambda timeout: upstream.client.post(settings.google_token_url, data=token_request, timeout=timeout)
             )
             
             if token_response.status_code != 200:
@@ -376,142 +1089,144 @@ async def google_callback(code: str, state: str):
             scope = tokens.get("scope", "")
             
             # Get user info
-            userinfo_response = await http_client.get(
-                GOOGLE_USERINFO_URL,
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
-            
-            if userinfo_response.status_code != 200:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Failed to obtain user information"
-                )
-            
-            userinfo = userinfo_response.json()
-            
-            # Store user session in memory
-            await store_user_session(
-                user_id=userinfo["id"],
-                email=userinfo["email"],
-                name=userinfo.get("name", userinfo["email"]),
-                picture=userinfo.get("picture"),
-                access_token=access_token,
-                refresh_token=refresh_token,
-                expires_in=expires_in,
-                scopes=scope.split()
-            )
-            
-            # Store tokens in Supabase
-            await store_tokens_in_supabase(
-                google_user_id=userinfo["id"],
-                email=userinfo["email"],
-                name=userinfo.get("name", userinfo["email"]),
-                picture=userinfo.get("picture"),
-                access_token=access_token,
-                refresh_token=refresh_token
-            )
+            userinfo = await fetch_user_info(access_token, tokens.get("id_token"))
+        
+        if not refresh_token:
+            # Logins without consent (e.g. the reauth profile) get no refresh token
+            refresh_token = await stored_refresh_token(userinfo["id"])
+        
+        # Store user session in memory
+        await store_user_session(
+            user_id=userinfo["id"],
+            email=userinfo["email"],
+            name=userinfo.get("name", userinfo["email"]),
+            picture=userinfo.get("picture"),
+            access_token=access_token,
+            refresh_token=refresh_token,
+            expires_in=expires_in,
+            scopes=scope.split()
+        )
+        
+        # Store tokens in Supabase
+        await store_tokens_in_supabase(
+            google_user_id=userinfo["id"],
+            email=userinfo["email"],
+            name=userinfo.get("name", userinfo["email"]),
+            picture=userinfo.get("picture"),
+            access_token=access_token,
+            refresh_token=refresh_token
+        )
 
-            # Redirect to frontend with success
-            redirect_url = f"{FRONTEND_URL}?auth=success&user_id={userinfo['id']}"
-            return RedirectResponse(url=redirect_url, status_code=302)
-            
+        # Redirect to frontend with success
+        redirect_url = f"{settings.frontend_url}?auth=success&user_id={userinfo['id']}"
+        return RedirectResponse(url=redirect_url, status_code=302)
+        
+    except UpstreamUnavailable as e:
+        # The browser is mid-redirect, so pass the retry hint to the frontend
+        return RedirectResponse(
+            url=f"{settings.frontend_url}?error=upstream_unavailable&retry_after={e.retry_after_header}",
+            status_code=302
+        )
     except Exception as e:
         # Redirect to frontend with error
         error_message = urllib.parse.quote(str(e))
         return RedirectResponse(
-            url=f"{FRONTEND_URL}?error={error_message}",
+            url=f"{settings.frontend_url}?error={error_message}",
             status_code=302
         )
 
-@app.post("/api/auth/refresh", response_model=AuthResponse)
+@router.post("/api/auth/refresh", response_model=AuthResponse)
 async def refresh_access_token(request: RefreshTokenRequest):
     """
     Refresh access token using refresh token
+    
+    Concurrent refreshes of the same token (e.g. several open tabs) share
+    a single upstream exchange and its result. Responds 503 with
+    Retry-After when Google is unavailable or too slow
     """
     try:
-        async with httpx.AsyncClient() as http_client:
-            token_response = await http_client.post(
-                GOOGLE_TOKEN_URL,
-                data={
-                    "client_id": GOOGLE_CLIENT_ID,
-                    "client_secret": GOOGLE_CLIENT_SECRET,
-                    "refresh_token": request.refresh_token,
-                    "grant_type": "refresh_token",
-                }
-            )
-            
-            if token_response.status_code != 200:
-                error_data = token_response.json()
-                if error_data.get("error") == "invalid_grant":
-                    raise HTTPException(
-                        status_code=401,
-                        detail="Refresh token expired or invalid. Please login again."
-                    )
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Failed to refresh token: {token_response.text}"
-                )
-            
-            tokens = token_response.json()
-            new_access_token = tokens["access_token"]
-            new_refresh_token = tokens.get("refresh_token", request.refresh_token)
-            expires_in = tokens["expires_in"]
-            
-            # Get user info with new access token
-            userinfo_response = await http_client.get(
-                GOOGLE_USERINFO_URL,
-                headers={"Authorization": f"Bearer {new_access_token}"}
-            )
-            
-            if userinfo_response.status_code != 200:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Failed to obtain user information"
-                )
-            
-            userinfo = userinfo_response.json()
-            
-            # Update user session with new tokens
-            await store_user_session(
-                user_id=userinfo["id"],
-                email=userinfo["email"],
-                name=userinfo.get("name", userinfo["email"]),
-                picture=userinfo.get("picture"),
-                access_token=new_access_token,
-                refresh_token=new_refresh_token,
-                expires_in=expires_in,
-                scopes=tokens.get("scope", "").split()
-            )
-            
-            return AuthResponse(
-                success=True,
-                message="Token refreshed successfully",
-                user=UserProfile(
-                    user_id=userinfo["id"],
-                    email=userinfo["email"],
-                    name=userinfo.get("name", userinfo["email"]),
-                    picture=userinfo.get("picture"),
-                    given_name=userinfo.get("given_name"),
-                    family_name=userinfo.get("family_name")
-                ),
-                tokens=TokenData(
-                    access_token=new_access_token,
-                    refresh_token=new_refresh_token,
-                    expires_in=expires_in,
-                    token_type="Bearer",
-                    scope=tokens.get("scope", "")
-                )
+        with deadline(settings.upstream_deadline_seconds):
+            result = await refresh_flights.do(
+                hash_key(request.refresh_token),
+                lambda: exchange_refresh_token(request.refresh_token)
             )
-            
+        response = result.model_dump()
+        # A shared result was issued earlier: report the time it has left
+        response["tokens"]["expires_in"] = max(0, result.tokens.expires_at - int(time.time()))
+        return FastJSONResponse(response)
     except HTTPException:
         raise
+    except UpstreamUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Google is temporarily unavailable, please retry later",
+            headers={"Retry-After": e.retry_after_header}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"An unexpected error occurred: {str(e)}"
         )
 
-@app.get("/api/auth/user/{user_id}", response_model=UserSession)
+@router.get("/api/auth/refresh/stats")
+async def refresh_stats():
+    """
+    Report refresh coalescing, proactive refresh scheduler and token broker counters
+    """
+    return {
+        "coalescing": refresh_flights.stats(),
+        "scheduler": refresh_scheduler.stats(),
+        "broker": token_broker.stats()
+    }
+
+@router.get("/api/auth/token/{user_id}")
+async def get_access_token(user_id: str, min_ttl: int = 300):
+    """
+    Get an access token valid for at least `min_ttl` seconds (for backend jobs)
+    
+    Served from memory while the cached token is fresh enough; otherwise the
+    stored session is read and, if needed, refreshed with its stored refresh
+    token, which never leaves the backend. Concurrent requests for one user
+    share a single refresh
+    """
+    if not 0 <= min_ttl <= MAX_TOKEN_MIN_TTL_SECONDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"min_ttl must be between 0 and {MAX_TOKEN_MIN_TTL_SECONDS} seconds"
+        )
+    
+    try:
+        with deadline(settings.upstream_deadline_seconds):
+            token = await token_broker.get(user_id, min_ttl)
+    except HTTPException:
+        raise
+    except UpstreamUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Google is temporarily unavailable, please retry later",
+            headers={"Retry-After": e.retry_after_header}
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"An unexpected error occurred: {str(e)}"
+        )
+    
+    if token is None:
+        raise HTTPException(status_code=404, detail="User session not found")
+    
+    return FastJSONResponse(
+        {
+            "access_token": token.access_token,
+            "token_type": "Bearer",
+            "expires_in": max(0, int(token.ttl())),
+            "expires_at": to_iso(token.expires_at),
+            "scopes": token.scopes
+        },
+        headers={"Cache-Control": "no-store"}
+    )
+
+@router.get("/api/auth/user/{user_id}", response_model=UserSession)
 async def get_user(user_id: str):
     """
     Get user session information
@@ -520,30 +1235,115 @@ async def get_user(user_id: str):
     if not session:
         raise HTTPException(status_code=404, detail="User session not found")
     
-    return session
+    return FastJSONResponse(session.model_dump())
 
-@app.post("/api/auth/logout")
+@router.get("/api/auth/session/{user_id}")
+async def bootstrap_session(user_id: str, request: Request):
+    """
+    Validity, profile and tokens in one response, for page load
+    
+    Replaces /api/auth/validate followed by /api/auth/user/{user_id}. The
+    response carries an ETag; a request with a matching If-None-Match gets
+    304 without the tokens being decrypted
+    """
+    session = await get_session_profile(user_id)
+    if not session:
+        return FastJSONResponse(session_validation(None))
+    
+    etag = session_etag(session)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    
+    model, reencrypted = open_session(session)
+    if reencrypted:
+        await user_sessions.set(user_id, session)
+        headers["ETag"] = session_etag(session)
+    
+    return FastJSONResponse(
+        {**session_validation(session), "session": model.model_dump()},
+        headers=headers
+    )
+
+class EventStreamResponse(StreamingResponse):
+    """
+    SSE response that owns a subscription and releases it however the
+    response ends: the stream's own cleanup only runs once its body has
+    started, and a client that disconnects before then would leak the slot
+    """
+
+    def __init__(self, hub: SessionEventHub, subscription: Subscription, heartbeat: float, max_seconds: float):
+        super().__init__(
+            hub.stream(subscription, heartbeat=heartbeat, max_seconds=max_seconds),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        self.hub = hub
+        self.subscription = subscription
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.hub.unsubscribe(self.subscription)
+
+@router.get("/api/auth/events/{user_id}")
+async def session_event_stream(user_id: str):
+    """
+    Server-Sent Events for one user's session: `refresh` (new tokens and
+    profile), `expiry` (token expired without a refresh) and `logout`
+    
+    Open the stream before fetching /api/auth/session/{user_id} so no change
+    falls between the two
+    """
+    session = await get_session_profile(user_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="User session not found")
+    
+    subscription = session_events.subscribe(user_id, session.expires_at)
+    if subscription is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many event streams, please retry later",
+            headers={"Retry-After": "30"}
+        )
+    
+    return EventStreamResponse(
+        session_events,
+        subscription,
+        heartbeat=settings.session_events_heartbeat_seconds,
+        max_seconds=settings.session_events_max_stream_seconds
+    )
+
+@router.post("/api/auth/logout")
 async def logout(user_id: str):
     """
     Logout user and revoke tokens
+    
+    The session is removed immediately; revocation of the access and refresh
+    tokens is queued and happens in the background
     """
     try:
-        # Get user session to revoke token
-        session = await get_user_session(user_id)
-        if session and session.access_token:
-            # Revoke Google token
-            async with httpx.AsyncClient() as http_client:
-                try:
-                    await http_client.post(
-                        "https://oauth2.googleapis.com/revoke",
-                        params={"token": session.access_token}
-                    )
-                except:
-                    pass  # Continue even if revocation fails
+        session = await user_sessions.pop(user_id)
+        refresh_scheduler.cancel(user_id)
+        token_broker.invalidate(user_id)
+        session_events.publish(user_id, LOGOUT, {"reason": "logout"})
         
-        # Delete user session from memory
-        if user_id in user_sessions:
-            del user_sessions[user_id]
+        if session:
+            # Don't hand out a coalesced refresh result for a logged-out session
+            if session.refresh_token:
+                refresh_flights.forget(hash_key(decrypt_token(session.refresh_token)))
+                token_revoker.enqueue(session.refresh_token)
+            token_revoker.enqueue(session.access_token)
+            # Blank the stored tokens so re-hydration does not bring the session back
+            await store_tokens_in_supabase(
+                google_user_id=session.user_id,
+                email=session.email,
+                name=session.name,
+                picture=session.picture,
+                access_token="",
+                refresh_token=None
+            )
         
         return {"success": True, "message": "Logged out successfully"}
     except Exception as e:
@@ -552,46 +1352,522 @@ async def logout(user_id: str):
             detail=f"Error during logout: {str(e)}"
         )
 
-@app.get("/api/auth/validate")
+@router.get("/api/auth/validate")
 async def validate_session(user_id: str):
     """
     Validate if user session is still valid
+    
+    Reads only the epoch expiry and profile fields; tokens are not decrypted
     """
     try:
-        session = await get_user_session(user_id)
-        if not session:
-            return {"valid": False, "message": "No session found"}
-        
-        # Check if token is expired
-        expires_at = datetime.fromisoformat(session.expires_at.replace("Z", "+00:00"))
-        if expires_at < datetime.utcnow():
-            return {
-                "valid": False,
-                "message": "Token expired",
-                "requires_refresh": True
-            }
-        
-        return {
-            "valid": True,
-            "message": "Session is valid",
-            "user": {
-                "user_id": session.user_id,
-                "email": session.email,
-                "name": session.name,
-                "picture": session.picture
-            }
-        }
+        return FastJSONResponse(session_validation(await get_session_profile(user_id)))
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error validating session: {str(e)}"
         )
 
+@router.get("/metrics")
+async def metrics_endpoint():
+    """
+    Prometheus metrics
+    """
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+@router.get("/api/auth/store/stats")
+async def store_stats():
+    """
+    Report session and OAuth2 state store sizes and eviction counters,
+    session event stream counters and Supabase re-hydration progress
+    """
+    return {
+        "sessions": {**user_sessions.stats(), "size": await user_sessions.size()},
+        "oauth_states": {**oauth_states.stats(), "size": await oauth_states.size()},
+        "events": session_events.stats(),
+        "rehydration": session_rehydrator.stats()
+    }
+
+@router.get("/api/upstream/stats")
+async def upstream_stats():
+    """
+    Report shared upstream connection pool, resilience (breakers, retry
+    budget, hedging), Supabase write queue and token revocation statistics
+    """
+    return {
+        **upstream.stats(),
+        "supabase_writes": supabase_writer.stats(),
+        "resilience": google_upstream.stats(),
+        "revocations": {**token_revoker.stats(), "dead_letters": list(token_revoker.dead_letters)}
+    }
+
+@router.get("/api/admission/stats")
+async def admission_stats():
+    """
+    Report per-limiter rate-limit buckets, admissions and rejections
+    """
+    return {
+        "enabled": settings.admission_enabled,
+        "limiters": {kind: limiter.stats() for kind, limiter in admission_limiters.items()}
+    }
+
+# ============================================================================
+# Batch Endpoints (internal services)
+# ============================================================================
+
+def wants_ndjson(request: Request, stream: bool) -> bool:
+    return stream or "application/x-ndjson" in request.headers.get("accept", "")
+
+def check_batch_size(user_ids: list[str]) -> None:
+    if len(user_ids) > settings.batch_max_users:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.batch_max_users} user ids per request"
+        )
+
+async def iter_validation_chunks(user_ids: list[str]):
+    """Yield (user_id, validation result) pairs, one bulk lookup per chunk"""
+    for start in range(0, len(user_ids), settings.batch_chunk_size):
+        chunk = user_ids[start:start + settings.batch_chunk_size]
+        sessions = await user_sessions.get_many(chunk)
+        for user_id, session in zip(chunk, sessions):
+            yield user_id, session_validation(session)
+
+async def iter_session_chunks(user_ids: list[str]):
+    """Yield (user_id, session payload) pairs, decrypting each chunk on the crypto pool"""
+    loop = asyncio.get_running_loop()
+    for start in range(0, len(user_ids), settings.batch_chunk_size):
+        chunk = user_ids[start:start + settings.batch_chunk_size]
+        sessions = await user_sessions.get_many(chunk)
+        found = [session for session in sessions if session]
+        opened = await loop.run_in_executor(crypto_executor, lambda: [open_session(s) for s in found])
+        for session, (_, reencrypted) in zip(found, opened):
+            if reencrypted:
+                await user_sessions.set(session.user_id, session)
+        models = iter(model for model, _ in opened)
+        now = time.time()
+        for user_id, session in zip(chunk, sessions):
+            if not session:
+                yield user_id, {"found": False}
+                continue
+            yield user_id, {
+                "found": True,
+                "requires_refresh": session.is_expired(now),
+                "session": next(models).model_dump()
+            }
+
+def ndjson_response(pairs) -> StreamingResponse:
+    async def lines():
+        async for user_id, result in pairs:
+            yield json_dumps({"user_id": user_id, **result}) + b"\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.post("/api/auth/validate/batch")
+async def validate_sessions_batch(body: BatchUserRequest, request: Request, stream: bool = False):
+    """
+    Validate many sessions in one request
+    Returns {user_id: result} or, with ?stream=true / Accept: application/x-ndjson,
+    one JSON object per line
+    """
+    check_batch_size(body.user_ids)
+    pairs = iter_validation_chunks(body.user_ids)
+    if wants_ndjson(request, stream):
+        return ndjson_response(pairs)
+    return FastJSONResponse({"results": {user_id: result async for user_id, result in pairs}})
+
+@router.post("/api/auth/user/batch")
+async def get_users_batch(body: BatchUserRequest, request: Request, stream: bool = False):
+    """
+    Get decrypted sessions for many users in one request
+    Each result says whether the user was found and whether it requires a refresh
+    """
+    check_batch_size(body.user_ids)
+    pairs = iter_session_chunks(body.user_ids)
+    if wants_ndjson(request, stream):
+        return ndjson_response(pairs)
+    return FastJSONResponse({"results": {user_id: result async for user_id, result in pairs}})
+
+# ============================================================================
+# Admin Endpoints (bulk session transfer)
+# ============================================================================
+
+async def require_admin(authorization: Optional[str] = Header(None)) -> None:
+    """Admin endpoints take ADMIN_TOKEN as a bearer token; without ADMIN_TOKEN they do not exist"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.admin_token.encode()):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid admin token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+async def export_session_lines():
+    """
+    NDJSON for every stored session, one store chunk at a time; records under
+    an older key are re-encrypted (and written back) on the crypto pool first,
+    so the export only needs the current ENCRYPTION_KEY to be read
+    """
+    loop = asyncio.get_running_loop()
+    async for chunk in user_sessions.scan(settings.batch_chunk_size):
+        records = [record for _, record in chunk]
+        reencrypted = await loop.run_in_executor(crypto_executor, lambda: [reencrypt_record(r) for r in records])
+        for record, changed in zip(records, reencrypted):
+            if changed:
+                await user_sessions.set(record.user_id, record)
+        yield b"".join(json_dumps(record.to_dict()) + b"\n" for record in records)
+
+@router.get("/api/admin/sessions/export", dependencies=[Depends(require_admin)])
+async def export_sessions():
+    """
+    Stream every stored session as NDJSON (tokens stay encrypted)
+    Import it elsewhere with POST /api/admin/sessions/import
+    """
+    return StreamingResponse(
+        export_session_lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-store"}
+    )
+
+@router.post("/api/admin/sessions/import", dependencies=[Depends(require_admin)])
+async def import_sessions(request: Request):
+    """
+    Load sessions from an NDJSON export, streamed in chunks
+    
+    Tokens are re-encrypted under this deployment's key, so exports from a
+    deployment with another ENCRYPTION_KEY import once that key is listed in
+    ENCRYPTION_KEYS_PREVIOUS. A stored session updated at the same time or
+    later is kept; expired sessions without a refresh token are skipped
+    """
+    loop = asyncio.get_running_loop()
+    
+    def open_lines(lines: list[bytes]) -> Tuple[list[SessionRecord], int]:
+        records, failed = [], 0
+        for line in lines:
+            try:
+                record = session_from_export_line(line)
+            except Exception:
+                failed += 1
+                continue
+            if record is not None:
+                records.append(record)
+        return records, failed
+    
+    lines = imported = failed = 0
+    try:
+        async for chunk in ndjson_chunks(request.stream(), settings.batch_chunk_size):
+            records, chunk_failed = await loop.run_in_executor(crypto_executor, open_lines, chunk)
+            imported += await save_transferred_sessions(records) if records else 0
+            lines += len(chunk)
+            failed += chunk_failed
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    print(f"✅ Imported {imported} of {lines} sessions ({failed} failed)")
+    return {
+        "lines": lines,
+        "imported": imported,
+        "skipped": lines - imported - failed,
+        "failed": failed
+    }
+
+@router.post("/api/admin/sessions/rehydrate", dependencies=[Depends(require_admin)])
+async def rehydrate_sessions():
+    """
+    Rebuild the session store from the tokens in Supabase (e.g. after losing
+    the in-memory sessions); joins a run already in progress
+    """
+    try:
+        return await session_rehydrator.run()
+    except SupabaseReadError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+# ============================================================================
+# App Factory
+# ============================================================================
+
+def configure(config: Settings) -> None:
+    """
+    Build the process-wide components from `config`
+    Cheap and free of I/O: clients connect and the session journal is opened
+    in the lifespan hook. Raises ValueError for settings that cannot be combined
+    """
+    config.check_combinations()
+    global settings, upstream, user_sessions, oauth_states, token_cipher, crypto_executor
+    global supabase_writer, google_upstream, token_revoker, token_broker, session_events, id_token_verifier
+    global session_rehydrator
+    global refresh_flights, refresh_scheduler, state_signer, login_profiles, admission_limiters
+    global UPSTREAM_CALLS, _supabase
+    settings = config
+    _supabase = None
+
+    # Shared upstream HTTP client for Google and Supabase (one pool per process)
+    upstream = UpstreamClient.from_settings(config)
+    upstream.observer = observe_upstream
+    UPSTREAM_CALLS = _bind_upstream_calls(config)
+
+    # Storage for user sessions (memory with TTL + LRU, Redis, or SQLite shared by
+    # the workers of one host; see SESSION_STORE_BACKEND)
+    user_sessions = create_session_store(
+        "session:",
+        default_ttl=config.session_ttl_seconds,
+        max_size=config.session_store_max_size,
+        record_type=SessionRecord,
+        backend=config.session_store_backend,
+        redis_url=config.redis_url,
+        sqlite_path=config.session_sqlite_path,
+        cache_size=config.session_sqlite_cache_size
+    )
+    # Local persistence so restarts keep every session: an append-only journal
+    # plus periodic snapshots in SESSION_PERSISTENCE_DIR (memory backend only)
+    if config.session_persistence_dir:
+        user_sessions = JournaledSessionStore(
+            user_sessions,
+            SessionJournal(config.session_persistence_dir),
+            snapshot_interval=config.session_snapshot_interval_seconds,
+            compact_after_bytes=config.session_journal_max_bytes
+        )
+
+    # Store for OAuth2 state; abandoned logins expire after OAUTH_STATE_TTL_SECONDS
+    oauth_states = create_session_store(
+        "oauth_state:",
+        default_ttl=config.oauth_state_ttl_seconds,
+        max_size=config.oauth_state_max_size,
+        backend=config.session_store_backend,
+        redis_url=config.redis_url,
+        sqlite_path=config.session_sqlite_path,
+        cache_size=config.oauth_state_max_size
+    )
+
+    # TOKEN_CIPHER selects aesgcm (default) or fernet; ENCRYPTION_KEYS_PREVIOUS
+    # lists retired keys that can still decrypt until records are re-encrypted
+    token_cipher = None
+    if config.encryption_key:
+        token_cipher = create_token_cipher(
+            config.encryption_key,
+            name=config.token_cipher,
+            previous_secrets=config.previous_encryption_keys()
+        )
+    # Bulk token encryption/decryption runs here, off the event loop
+    crypto_executor = ThreadPoolExecutor(max_workers=config.crypto_workers, thread_name_prefix="token-crypto")
+
+    # Token upserts are queued and flushed in bulk off the request path
+    supabase_writer = SupabaseWriteBehind(
+        config.supabase_url,
+        config.supabase_anon_key,
+        client=lambda: upstream.client,
+        max_batch=config.supabase_write_batch_size,
+        flush_interval=config.supabase_write_flush_interval,
+        max_pending=config.supabase_write_max_pending
+    )
+
+    # Google calls run under a per-request deadline, a shared retry budget, a
+    # circuit breaker per endpoint and a process-wide concurrency cap; while a
+    # breaker is open (or the cap is saturated) requests fail fast with
+    # 503 + Retry-After instead of waiting on the upstream
+    google_upstream = ResilientUpstream(
+        RetryBudget(
+            ratio=config.upstream_retry_budget_ratio,
+            min_per_second=config.upstream_retry_budget_min_per_second
+        ),
+        attempt_timeout=config.upstream_attempt_timeout,
+        default_deadline=config.upstream_deadline_seconds,
+        max_attempts=config.upstream_max_attempts,
+        backoff=config.upstream_retry_backoff_seconds,
+        failure_threshold=config.upstream_breaker_failures,
+        reset_timeout=config.upstream_breaker_reset_seconds,
+        max_concurrency=config.upstream_max_concurrency,
+        queue_timeout=config.upstream_queue_timeout_seconds
+    )
+
+    # Tokens are revoked in the background after logout; the queue is persisted
+    # (still encrypted) when REVOCATION_LOG_PATH or SESSION_PERSISTENCE_DIR is set
+    revocation_log_path = config.revocation_log_path or (
+        os.path.join(config.session_persistence_dir, "revocations.log") if config.session_persistence_dir else None
+    )
+    token_revoker = TokenRevoker(
+        client=lambda: upstream.client,
+        revoke_url=config.google_revoke_url,
+        decrypt=decrypt_token,
+        max_concurrency=config.revocation_concurrency,
+        max_retries=config.revocation_max_retries,
+        retry_backoff=config.revocation_retry_backoff_seconds,
+        log_path=revocation_log_path
+    )
+
+    # Rebuilds user_sessions from google_oauth_tokens (keyset pages, converted and
+    # stored by SESSION_REHYDRATE_CONCURRENCY workers)
+    session_rehydrator = SessionRehydrator(
+        SupabaseTokenReader(
+            config.supabase_url,
+            config.supabase_anon_key,
+            client=lambda: upstream.client,
+            page_size=config.session_rehydrate_page_size
+        ),
+        build=session_from_supabase_row,
+        save=save_transferred_sessions,
+        executor=crypto_executor,
+        concurrency=config.session_rehydrate_concurrency
+    )
+
+    # Verify the id_token locally (cached JWKS) instead of calling userinfo
+    id_token_verifier = IdTokenVerifier(
+        config.google_client_id,
+        client=lambda: upstream.client,
+        jwks_url=config.google_certs_url
+    )
+
+    # Coalesces concurrent refreshes of the same refresh token
+    refresh_flights = SingleFlight(grace_seconds=config.refresh_coalesce_grace_seconds)
+
+    # Access tokens for backend jobs (GET /api/auth/token/{user_id}), cached
+    # decrypted for up to TOKEN_BROKER_CACHE_SIZE users. The cache is per
+    # process, so with a store shared between workers every hit is checked
+    # against the stored session (a logout elsewhere must not be missed)
+    token_broker = AccessTokenBroker(
+        load_brokered_token,
+        refresh_brokered_token,
+        max_size=config.token_broker_cache_size,
+        verify=verify_brokered_token if config.session_store_backend != "memory" else None
+    )
+
+    # Pushes refresh/expiry/logout to open tabs (GET /api/auth/events/{user_id})
+    session_events = SessionEventHub(
+        queue_size=config.session_events_queue_size,
+        max_subscribers=config.session_events_max_subscribers,
+        on_expiry=publish_session_expiry
+    )
+
+    # Proactive server-side refresh of stored tokens before they expire
+    refresh_scheduler = RefreshScheduler(
+        proactive_refresh,
+        margin_seconds=config.proactive_refresh_margin_seconds,
+        jitter_seconds=config.proactive_refresh_jitter_seconds,
+        max_concurrency=config.proactive_refresh_concurrency,
+        retry_seconds=config.proactive_refresh_retry_seconds
+    )
+
+    # OAUTH_STATE_MODE=signed issues self-contained HMAC-signed states instead of
+    # storing them, so callbacks can land on any worker
+    state_secret = config.oauth_state_secret or hashlib.sha256(
+        b"oauth-state:" + config.encryption_key.encode()
+    ).hexdigest()
+    state_signer = StateSigner(
+        state_secret.encode(),
+        max_age_seconds=int(config.oauth_state_ttl_seconds)
+    )
+
+    # Authorization URL prefixes per login profile and prompt, encoded once
+    login_profiles = compile_profiles(
+        {**DEFAULT_LOGIN_PROFILES, **config.login_profiles},
+        config.google_auth_url,
+        config.google_client_id,
+        config.google_redirect_uri
+    )
+
+    # Rate-limit buckets (ADMISSION_<LIMITER>_RATE per second, up to _BURST)
+    admission_limiters = {}
+    for kind in (IP, USER, REFRESH_TOKEN):
+        rate = getattr(config, f"admission_{kind}_rate")
+        if rate > 0:
+            admission_limiters[kind] = TokenBucketTable(
+                rate,
+                getattr(config, f"admission_{kind}_burst"),
+                max_keys=config.admission_max_keys
+            )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Validate settings, create app-lifetime resources on startup and release them on shutdown"""
+    settings.check_required()
+    await upstream.start()
+    if not settings.supabase_write_behind:
+        # Import the SDK and build the client now rather than on the first login
+        await asyncio.to_thread(get_supabase)
+    if isinstance(user_sessions, JournaledSessionStore):
+        # Before any session is restored or request served, so only startup objects are frozen
+        tune_gc_for_restore()
+        # Opens the journal, so writes made while restoring are kept
+        await user_sessions.start()
+        # Restore in the background; lookups that miss wait for it to finish
+        app.state.session_restore = asyncio.create_task(restore_sessions_on_startup())
+    if settings.session_rehydrate_on_startup:
+        app.state.session_rehydrate = asyncio.create_task(rehydrate_sessions_on_startup())
+    if not token_revoker.log_path:
+        print(
+            "⚠️ Token revocations are queued in memory only and are lost on restart or crash; "
+            "set REVOCATION_LOG_PATH (one file per process) or SESSION_PERSISTENCE_DIR"
+        )
+    await token_revoker.start()
+    if settings.supabase_write_behind:
+        await supabase_writer.start()
+    if settings.proactive_refresh_enabled:
+        await refresh_scheduler.start()
+    yield
+    # End event streams first so the server is not left waiting on them
+    session_events.close()
+    await refresh_scheduler.stop()
+    await token_revoker.close(timeout=settings.revocation_drain_timeout_seconds)
+    await supabase_writer.close()
+    for name in ("session_restore", "session_rehydrate"):
+        task = getattr(app.state, name, None)
+        if task is not None and not task.done():
+            task.cancel()
+    await user_sessions.close()
+    await oauth_states.close()
+    await upstream.aclose()
+    crypto_executor.shutdown(wait=False)
+
+def create_app(config: Optional[Settings] = None) -> FastAPI:
+    """
+    Build the app from `config` (default: Settings from the environment)
+    
+    Components are process-wide, so the most recently created app is the
+    one being served. Missing credentials are reported when it starts.
+    """
+    configure(config or Settings())
+    app = FastAPI(
+        title="Google OAuth2 Authentication API",
+        version="1.0.0",
+        lifespan=lifespan,
+        default_response_class=FastJSONResponse
+    )
+    
+    # Admission control runs inside CORS so 429s carry CORS headers
+    if settings.admission_enabled:
+        app.add_middleware(
+            AdmissionMiddleware,
+            limiters=admission_limiters,
+            rules=ADMISSION_RULES,
+            on_reject=lambda kind: ADMISSION_REJECTED[kind].inc()
+        )
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[*CORS_ORIGINS, settings.frontend_url],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Retry-After", "ETag"],
+    )
+    # Outermost, so latency covers the whole middleware stack
+    app.add_middleware(HttpMetricsMiddleware, latency=HTTP_LATENCY, responses=HTTP_RESPONSES)
+    
+    app.include_router(router)
+    return app
+
+def __getattr__(name: str):
+    # `app` (e.g. for `uvicorn auth_backend:app`) is built on first access
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 # ============================================================================
 # Run Server
 # ============================================================================
 
 if __name__ == "__main__":
     import uvicorn
-    port = int(os.getenv("PORT", "8060"))
-    uvicorn.run(app, host="127.0.0.1", port=port)
+    app = create_app()
+    uvicorn.run(app, host="127.0.0.1", port=settings.port)
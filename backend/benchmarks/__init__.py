@@ -0,0 +1,82 @@
+"""
+Benchmarks for the authentication backend
+Local stand-ins for Google and Supabase, a load driver and micro-benchmarks.
+Run from the backend directory, e.g. `python -m benchmarks.load`
+"""
+from typing import Any, Dict, List
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import subprocess
+
+# Environment the backend needs at import time; real values are never used
+BENCH_ENV = {
+    "ENCRYPTION_KEY": "benchmark-encryption-key",
+    "SUPABASE_URL": "http://supabase.bench",
+    "SUPABASE_ANON_KEY": "benchmark-anon-key",
+    "GOOGLE_CLIENT_ID": "bench-client.apps.googleusercontent.com",
+    "GOOGLE_CLIENT_SECRET": "benchmark-secret",
+    "GOOGLE_REDIRECT_URI": "http://localhost:8060/api/auth/google/callback",
+    "FRONTEND_URL": "http://localhost:3035",
+    "PROACTIVE_REFRESH_ENABLED": "false",
+    # One client address drives all load; rate limits would dominate the results
+    "ADMISSION_ENABLED": "false",
+}
+
+
+def configure_environment() -> None:
+    """Fill in benchmark defaults for any backend setting not already set"""
+    for name, value in BENCH_ENV.items():
+        os.environ.setdefault(name, value)
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, Any]:
+    """Throughput and latency percentiles (milliseconds) for one run"""
+    ordered = sorted(latencies)
+    count = len(ordered)
+
+    def percentile(p: float) -> float:
+        if not ordered:
+            return 0.0
+        index = min(count - 1, max(0, int(round(p / 100 * count)) - 1))
+        return round(ordered[index] * 1000, 3)
+
+    return {
+        "requests": count,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(count / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(path: str, kind: str, config: Dict[str, Any], results: Any) -> None:
+    """Write results as JSON with enough metadata to compare commits"""
+    document = {
+        "kind": kind,
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": config,
+        "results": results,
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+    print(f"✅ Saved {kind} results to {path}")
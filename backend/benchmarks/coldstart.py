@@ -0,0 +1,108 @@
+"""
+Cold start: time to import auth_backend and build the app in a fresh
+interpreter with no backend environment, which modules dominate, and
+whether heavy SDKs stayed out of the import path. Exits non-zero when the
+median import exceeds the budget, so it can guard CI.
+
+    python -m benchmarks.coldstart --runs 5 --budget-ms 1500
+"""
+from typing import Dict, List
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from benchmarks import save_results
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported on first use (or in the lifespan), never by `import auth_backend`
+LAZY_MODULES = ("supabase", "jose", "redis")
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import auth_backend
+imported = time.perf_counter()
+auth_backend.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "modules": sorted(sys.modules),
+}))
+"""
+
+
+def _clean_env() -> Dict[str, str]:
+    """Only what the interpreter needs; importing must not depend on backend settings"""
+    return {name: os.environ[name] for name in ("PATH", "HOME", "VIRTUAL_ENV") if name in os.environ}
+
+
+def run_once(importtime: bool) -> Dict[str, object]:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", CHILD]
+    completed = subprocess.run(command, cwd=BACKEND_DIR, env=_clean_env(), capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise SystemExit(f"❌ import auth_backend failed without environment:\n{completed.stderr}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    if importtime:
+        result["importtime"] = completed.stderr
+    return result
+
+
+def top_modules(importtime: str, count: int) -> List[Dict[str, object]]:
+    """Top-level imports by cumulative time, from `-X importtime` output"""
+    rows = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Nesting is shown by two spaces per level; level 1 is imported directly by auth_backend
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1 and cumulative.strip().isdigit():
+            rows.append({"module": name.strip(), "cumulative_ms": round(int(cumulative) / 1000, 1)})
+    rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+    return rows[:count]
+
+
+def measure(runs: int, top: int) -> Dict[str, object]:
+    samples = [run_once(importtime=False) for _ in range(runs)]
+    profile = run_once(importtime=True)
+    loaded = set(samples[0]["modules"])
+    return {
+        "runs": runs,
+        "import_ms_median": round(statistics.median(s["import_ms"] for s in samples), 1),
+        "import_ms_max": round(max(s["import_ms"] for s in samples), 1),
+        "create_app_ms_median": round(statistics.median(s["create_app_ms"] for s in samples), 1),
+        "eager_heavy_modules": [name for name in LAZY_MODULES if name in loaded],
+        "top_imports": top_modules(profile["importtime"], top),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to report")
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="fail when the median import exceeds this")
+    parser.add_argument("--output", default="benchmarks/results/coldstart.json")
+    args = parser.parse_args()
+
+    result = measure(args.runs, args.top)
+    print(
+        f"import auth_backend: median={result['import_ms_median']}ms max={result['import_ms_max']}ms  "
+        f"create_app: median={result['create_app_ms_median']}ms"
+    )
+    for row in result["top_imports"]:
+        print(f"  {row['module']:>28}  {row['cumulative_ms']}ms")
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    save_results(args.output, "coldstart", config, result)
+
+    failed = False
+    if result["eager_heavy_modules"]:
+        print(f"❌ Imported eagerly: {', '.join(result['eager_heavy_modules'])}")
+        failed = True
+    if result["import_ms_median"] > args.budget_ms:
+        print(f"❌ Cold import {result['import_ms_median']}ms is over the {args.budget_ms}ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,68 @@
+"""
+Compare two benchmark result files (e.g. from two commits)
+
+    python -m benchmarks.compare results/base.json results/head.json --threshold 10
+
+Exits with status 1 if any metric regressed by more than the threshold (%).
+"""
+from typing import Dict, Iterator, Tuple
+import argparse
+import json
+import sys
+
+# metric name -> True if higher is better
+METRICS = {
+    "throughput_rps": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "ops_per_s": True,
+    "best_ns_per_op": False,
+    "total_mb": False,
+    "bytes_per_session": False,
+    "restore_s": False,
+    "snapshot_write_s": False,
+    "upstream_calls_per_request": False,
+}
+
+
+def _flatten(results: Dict, prefix: str = "") -> Iterator[Tuple[str, str, float]]:
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}/")
+        elif key in METRICS and isinstance(value, (int, float)):
+            yield prefix.rstrip("/"), key, float(value)
+
+
+def compare(base: Dict, head: Dict, threshold: float) -> bool:
+    if base.get("kind") != head.get("kind"):
+        raise SystemExit("Cannot compare different benchmark kinds")
+
+    base_metrics = {(case, metric): value for case, metric, value in _flatten(base["results"])}
+    regressed = False
+    print(f"{base.get('kind')} benchmark: {base.get('commit')} -> {head.get('commit')}")
+    for case, metric, value in _flatten(head["results"]):
+        old = base_metrics.get((case, metric))
+        if not old:
+            continue
+        change = (value - old) / old * 100
+        worse = -change if METRICS[metric] else change
+        flag = ""
+        if worse > threshold:
+            flag = "  ⚠️ regression"
+            regressed = True
+        print(f"  {case:<28} {metric:<16} {old:>12.2f} -> {value:>12.2f}  ({change:+.1f}%){flag}")
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed regression in percent")
+    args = parser.parse_args()
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    sys.exit(1 if compare(base, head, args.threshold) else 0)
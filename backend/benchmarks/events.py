@@ -0,0 +1,97 @@
+"""
+Session events: cost of publishing one event to N open streams of a user,
+and page-load cost of the bootstrap endpoint (200 and 304) against the
+validate + user request pair it replaces
+
+    python -m benchmarks.events --subscribers 1,10,100 --requests 2000
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+import time
+from benchmarks import save_results, summarize
+from benchmarks.load import backend_client
+from session_events import SessionEventHub, REFRESH
+
+SAMPLE_EVENT = {
+    "user_id": "bench-user",
+    "email": "bench@example.com",
+    "name": "Bench User",
+    "picture": None,
+    "access_token": "ya29." + "a0AfB_byC" * 20,
+    "refresh_token": "1//0g" + "Lx9Qm2Rt" * 12,
+    "expires_at": "2030-01-01T00:00:00",
+    "scopes": ["openid", "email", "profile"],
+}
+
+
+async def measure_publish(subscribers: int, number: int) -> Dict[str, float]:
+    hub = SessionEventHub(queue_size=16, max_subscribers=subscribers)
+    subscriptions = [hub.subscribe("bench-user") for _ in range(subscribers)]
+    started = time.perf_counter_ns()
+    for _ in range(number):
+        hub.publish("bench-user", REFRESH, SAMPLE_EVENT)
+    elapsed = time.perf_counter_ns() - started
+    for subscription in subscriptions:
+        hub.unsubscribe(subscription)
+    return {
+        "ns_per_publish": round(elapsed / number, 1),
+        "ns_per_delivery": round(elapsed / number / subscribers, 1),
+    }
+
+
+async def measure_page_load(requests: int, latency_ms: float) -> Dict[str, Dict[str, object]]:
+    async with backend_client(None, latency_ms) as client:
+        state = (await client.get("/api/auth/google/login")).json()["state"]
+        location = (await client.get(
+            "/api/auth/google/callback", params={"code": "bench-events", "state": state}
+        )).headers["location"]
+        user_id = location.rsplit("user_id=", 1)[1]
+        etag = (await client.get(f"/api/auth/session/{user_id}")).headers["etag"]
+
+        async def validate_then_user():
+            await client.get("/api/auth/validate", params={"user_id": user_id})
+            await client.get(f"/api/auth/user/{user_id}")
+
+        cases = {
+            "validate_then_user": validate_then_user,
+            "bootstrap_200": lambda: client.get(f"/api/auth/session/{user_id}"),
+            "bootstrap_304": lambda: client.get(f"/api/auth/session/{user_id}", headers={"If-None-Match": etag}),
+        }
+        results = {}
+        for name, case in cases.items():
+            latencies: List[float] = []
+            started = time.perf_counter()
+            for _ in range(requests):
+                request_started = time.perf_counter()
+                await case()
+                latencies.append(time.perf_counter() - request_started)
+            results[name] = summarize(latencies, time.perf_counter() - started)
+            results[name]["requests_per_load"] = 2 if name == "validate_then_user" else 1
+        return results
+
+
+async def main(args: argparse.Namespace) -> Dict[str, object]:
+    publish = {}
+    for subscribers in [int(n) for n in args.subscribers.split(",")]:
+        publish[str(subscribers)] = await measure_publish(subscribers, args.number)
+        print(
+            f"publish to {subscribers:>4} streams: {publish[str(subscribers)]['ns_per_publish']:>10} ns "
+            f"({publish[str(subscribers)]['ns_per_delivery']} ns per stream)"
+        )
+    page_load = await measure_page_load(args.requests, args.latency_ms)
+    for name, result in page_load.items():
+        print(f"{name:>20}: p50={result['p50_ms']}ms p99={result['p99_ms']}ms  requests/load={result['requests_per_load']}")
+    return {"publish": publish, "page_load": page_load}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", default="1,10,100", help="open streams for the published user")
+    parser.add_argument("--number", type=int, default=20000, help="events published per subscriber count")
+    parser.add_argument("--requests", type=int, default=2000, help="page loads timed per variant")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mock upstream latency")
+    parser.add_argument("--output", default="benchmarks/results/events.json")
+    args = parser.parse_args()
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    save_results(args.output, "events", config, asyncio.run(main(args)))
@@ -0,0 +1,122 @@
+"""
+Refresh behaviour while the mocked Google endpoints misbehave: how fast
+requests fail, what they fail with, and how many upstream calls each
+request costs (retry amplification)
+
+    python -m benchmarks.faults --requests 500 --concurrency 50
+    python -m benchmarks.faults --scenarios userinfo_tail --hedge-after-ms 50
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+import collections
+import os
+import time
+import httpx
+from benchmarks import save_results, summarize
+from benchmarks.load import backend_client
+from benchmarks.mock_upstreams import MockFaults
+
+# name -> MockFaults settings; userinfo is only called without id_token verification
+SCENARIOS = {
+    "healthy": {},
+    "flaky": {"error_rate": 0.2, "endpoints": ("token", "userinfo")},
+    "outage": {"error_rate": 1.0, "endpoints": ("token",)},
+    "hang": {"slow_rate": 1.0, "slow_seconds": 30.0, "endpoints": ("token",)},
+    "userinfo_tail": {"slow_rate": 0.05, "slow_seconds": 0.5, "endpoints": ("userinfo",)},
+}
+
+# Short deadlines so the hang scenario finishes quickly; overridable from the environment
+SCENARIO_ENV = {
+    "UPSTREAM_DEADLINE_SECONDS": "2",
+    "UPSTREAM_ATTEMPT_TIMEOUT": "1",
+    "ID_TOKEN_VERIFICATION": "false",
+}
+
+
+def _apply(faults: MockFaults, settings: Dict[str, object]) -> None:
+    faults.error_rate = settings.get("error_rate", 0.0)
+    faults.slow_rate = settings.get("slow_rate", 0.0)
+    faults.slow_seconds = settings.get("slow_seconds", 1.0)
+    faults.endpoints = settings.get("endpoints", ("token", "userinfo"))
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, concurrency: int, requests: int) -> Dict[str, object]:
+    import auth_backend
+    from resilience import RetryBudget
+
+    # Every scenario starts with closed breakers and a full retry budget
+    resilience = auth_backend.google_upstream
+    resilience.breakers.clear()
+    resilience.budget = RetryBudget(resilience.budget.ratio, resilience.budget.min_per_second)
+    calls_before = auth_backend.upstream.stats()["requests"]["total"]
+
+    latencies: List[float] = []
+    statuses: "collections.Counter[int]" = collections.Counter()
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal next_index
+        while next_index < requests:
+            i = next_index
+            next_index += 1
+            started = time.perf_counter()
+            response = await client.post(
+                "/api/auth/refresh", json={"refresh_token": f"rt-faults-{name}-{time.time_ns()}-{i}"}
+            )
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    result = summarize(latencies, time.perf_counter() - started)
+    upstream_calls = auth_backend.upstream.stats()["requests"]["total"] - calls_before
+    result.update({
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "upstream_calls_per_request": round(upstream_calls / requests, 2),
+        "resilience": resilience.stats(),
+    })
+    return result
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Dict[str, object]]:
+    for name, value in SCENARIO_ENV.items():
+        os.environ.setdefault(name, value)
+    scenarios = [name.strip() for name in args.scenarios.split(",")]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    faults = MockFaults(seed=args.seed)
+    results: Dict[str, Dict[str, object]] = {}
+    async with backend_client(None, args.latency_ms, faults) as client:
+        import auth_backend
+        for name in scenarios:
+            variants = [("", auth_backend.settings.userinfo_hedge_after_seconds)]
+            if name == "userinfo_tail" and args.hedge_after_ms:
+                variants = [(" (no hedge)", 0.0), (" (hedged)", args.hedge_after_ms / 1000)]
+            for suffix, hedge_after in variants:
+                auth_backend.settings.userinfo_hedge_after_seconds = hedge_after
+                _apply(faults, SCENARIOS[name])
+                result = results[name + suffix] = await run_scenario(client, name, args.concurrency, args.requests)
+                print(
+                    f"{name + suffix:>26}  p50={result['p50_ms']}ms p99={result['p99_ms']}ms "
+                    f"max={result['max_ms']}ms  statuses={result['statuses']}  "
+                    f"upstream calls/request={result['upstream_calls_per_request']}"
+                )
+        _apply(faults, {})
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500, help="refresh requests per scenario")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="baseline mock upstream latency")
+    parser.add_argument("--hedge-after-ms", type=float, default=50.0, help="userinfo hedge delay compared in userinfo_tail (0 = skip)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="benchmarks/results/faults.json")
+    args = parser.parse_args()
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    save_results(args.output, "faults", config, asyncio.run(main(args)))
@@ -0,0 +1,198 @@
+"""
+Load driver for the login, callback, refresh, validate and token broker endpoints
+Reports throughput and p50/p95/p99 latency per endpoint and concurrency level.
+
+In-process (backend and mocked Google/Supabase in this process):
+    python -m benchmarks.load --concurrency 1,10,50 --requests 2000
+
+Against a running backend that was started with the mock environment
+printed by `python -m benchmarks.mock_upstreams`:
+    python -m benchmarks.load --url http://127.0.0.1:8060
+"""
+from typing import Awaitable, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import contextlib
+import time
+import urllib.parse
+import httpx
+from benchmarks import configure_environment, save_results, summarize
+
+ENDPOINTS = ("login", "callback", "refresh", "validate", "token")
+
+
+class LoadDriver:
+    """Runs endpoint scenarios against one backend client"""
+
+    def __init__(self, client: httpx.AsyncClient, run_id: str):
+        self.client = client
+        self.run_id = run_id
+        self.user_ids: List[str] = []
+        self.round = 0
+
+    @staticmethod
+    async def _timed(request: Awaitable[httpx.Response], check: Callable[[httpx.Response], bool]) -> Optional[float]:
+        """Latency of one request in seconds, or None if it failed"""
+        started = time.perf_counter()
+        response = await request
+        elapsed = time.perf_counter() - started
+        return elapsed if check(response) else None
+
+    async def login(self, i: int) -> Optional[float]:
+        return await self._timed(
+            self.client.get("/api/auth/google/login"),
+            lambda r: r.status_code == 200,
+        )
+
+    async def callback(self, i: int) -> Optional[float]:
+        # The login request is setup, only the callback is timed
+        state = (await self.client.get("/api/auth/google/login")).json()["state"]
+        return await self._timed(
+            self.client.get(
+                "/api/auth/google/callback",
+                params={"code": f"{self.run_id}-cb-{self.round}-{i}", "state": state},
+            ),
+            lambda r: r.status_code == 302 and "auth=success" in r.headers.get("location", ""),
+        )
+
+    async def refresh(self, i: int) -> Optional[float]:
+        # Distinct tokens so single-flight coalescing does not short-circuit the run
+        return await self._timed(
+            self.client.post("/api/auth/refresh", json={"refresh_token": f"rt-{self.run_id}-rf-{self.round}-{i}"}),
+            lambda r: r.status_code == 200,
+        )
+
+    async def validate(self, i: int) -> Optional[float]:
+        user_id = self.user_ids[i % len(self.user_ids)]
+        return await self._timed(
+            self.client.get("/api/auth/validate", params={"user_id": user_id}),
+            lambda r: r.status_code == 200 and r.json().get("valid") is True,
+        )
+
+    async def token(self, i: int) -> Optional[float]:
+        user_id = self.user_ids[i % len(self.user_ids)]
+        return await self._timed(
+            self.client.get(f"/api/auth/token/{user_id}", params={"min_ttl": 300}),
+            lambda r: r.status_code == 200,
+        )
+
+    async def seed_users(self, count: int) -> None:
+        """Create sessions through the real callback path for validate and token runs"""
+        for i in range(count):
+            state = (await self.client.get("/api/auth/google/login")).json()["state"]
+            response = await self.client.get(
+                "/api/auth/google/callback",
+                params={"code": f"{self.run_id}-seed-{i}", "state": state},
+            )
+            query = urllib.parse.urlparse(response.headers.get("location", "")).query
+            user_id = urllib.parse.parse_qs(query).get("user_id", [None])[0]
+            if user_id:
+                self.user_ids.append(user_id)
+        if not self.user_ids:
+            raise RuntimeError("Seeding sessions failed; is the backend pointed at the mocks?")
+
+    async def run(self, endpoint: str, concurrency: int, requests: int) -> Dict[str, object]:
+        operation: Callable[[int], Awaitable[Optional[float]]] = getattr(self, endpoint)
+        self.round += 1
+        latencies: List[float] = []
+        errors = 0
+        next_index = 0
+
+        async def worker() -> None:
+            nonlocal errors, next_index
+            while next_index < requests:
+                i = next_index
+                next_index += 1
+                try:
+                    elapsed = await operation(i)
+                except (httpx.HTTPError, KeyError, ValueError):
+                    elapsed = None
+                if elapsed is not None:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        result = summarize(latencies, time.perf_counter() - started)
+        result["errors"] = errors
+        return result
+
+
+@contextlib.asynccontextmanager
+async def backend_client(url: Optional[str], latency_ms: float, faults=None):
+    """
+    Yield a client for a remote backend, or for an in-process backend wired
+    to the mocks (optionally with a MockFaults to inject failures)
+    """
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=30.0) as client:
+            yield client
+        return
+
+    configure_environment()
+    import auth_backend
+    from benchmarks.mock_upstreams import MockLatency, create_mock_app, mock_transport
+
+    app = auth_backend.create_app()
+    mock_app = create_mock_app(
+        auth_backend.settings.google_client_id,
+        MockLatency.uniform(latency_ms / 1000),
+        faults=faults,
+    )
+    auth_backend.upstream.use_transport(mock_transport(mock_app))
+    async with auth_backend.lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            yield client
+
+
+async def main(args: argparse.Namespace) -> None:
+    endpoints = [name.strip() for name in args.endpoints.split(",")]
+    levels = [int(level) for level in args.concurrency.split(",")]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    results: Dict[str, Dict[str, object]] = {}
+    async with backend_client(args.url, args.latency_ms) as client:
+        driver = LoadDriver(client, run_id=str(time.time_ns()))
+        if "validate" in endpoints or "token" in endpoints:
+            await driver.seed_users(args.users)
+
+        for endpoint in endpoints:
+            results[endpoint] = {}
+            if args.warmup:
+                await driver.run(endpoint, min(levels), args.warmup)
+            for level in levels:
+                summary = await driver.run(endpoint, level, args.requests)
+                results[endpoint][str(level)] = summary
+                print(
+                    f"{endpoint:>9} c={level:<4} {summary['throughput_rps']:>9} req/s  "
+                    f"p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms "
+                    f"p99={summary['p99_ms']}ms errors={summary['errors']}"
+                )
+
+    config = {
+        "endpoints": endpoints,
+        "concurrency": levels,
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "users": args.users,
+        "latency_ms": args.latency_ms,
+        "target": args.url or "in-process",
+    }
+    save_results(args.output, "load", config, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="1,10,50")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per endpoint and level")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200, help="sessions seeded for validate")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mock upstream latency (in-process only)")
+    parser.add_argument("--url", help="benchmark a running backend instead of an in-process one")
+    parser.add_argument("--output", default="benchmarks/results/load.json")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,124 @@
+"""
+Memory footprint of stored sessions: the original dict layout vs SessionRecord
+
+    python -m benchmarks.memory --sessions 100000,1000000
+
+Sessions are inserted into a MemorySessionStore, so the store's own
+bookkeeping is included. Encrypted tokens are random bytes of the exact
+length Fernet produces for realistic Google tokens, which keeps 1M-session
+runs fast without changing what is measured.
+"""
+from typing import Any, Callable, Dict
+from datetime import datetime
+import argparse
+import asyncio
+import base64
+import gc
+import os
+import time
+import tracemalloc
+from cryptography.fernet import Fernet
+from benchmarks import save_results
+from benchmarks.micro import SAMPLE_ACCESS_TOKEN, SAMPLE_REFRESH_TOKEN
+from benchmarks.mock_upstreams import SCOPE
+from session_record import SCOPE_REGISTRY, SessionRecord
+from session_store import MemorySessionStore
+
+
+def _ciphertext_factory(plaintext: str) -> Callable[[], bytes]:
+    """Random stand-ins with the length of a real Fernet token for `plaintext`"""
+    length = len(Fernet(Fernet.generate_key()).encrypt(plaintext.encode()))
+    raw = length * 3 // 4
+    return lambda: base64.urlsafe_b64encode(os.urandom(raw))[:length]
+
+
+def dict_session(i: int, access: bytes, refresh: bytes, now: float) -> Dict[str, Any]:
+    """Session as the backend originally stored it"""
+    return {
+        "user_id": f"1{i:020d}",
+        "email": f"user{i}@example.com",
+        "name": f"User {i}",
+        "picture": None,
+        "access_token": access.decode(),
+        "refresh_token": refresh.decode(),
+        "expires_at": datetime.utcfromtimestamp(now + 3599).isoformat(),
+        "expires_at_epoch": int(now + 3599),
+        # Each token response is split afresh, so every session owns its strings
+        "scopes": SCOPE.split(),
+        "created_at": datetime.utcfromtimestamp(now).isoformat(),
+        "updated_at": datetime.utcfromtimestamp(now).isoformat(),
+    }
+
+
+def record_session(i: int, access: bytes, refresh: bytes, now: float) -> SessionRecord:
+    now = int(now)
+    return SessionRecord(
+        user_id=f"1{i:020d}",
+        email=f"user{i}@example.com",
+        name=f"User {i}",
+        picture=None,
+        access_token=access,
+        refresh_token=refresh,
+        expires_at=now + 3599,
+        scope_mask=SCOPE_REGISTRY.mask(SCOPE.split()),
+        created_at=now,
+        updated_at=now,
+    )
+
+
+LAYOUTS = {"dict": dict_session, "record": record_session}
+
+
+def measure(layout: str, count: int) -> Dict[str, float]:
+    build = LAYOUTS[layout]
+    access_token = _ciphertext_factory(SAMPLE_ACCESS_TOKEN)
+    refresh_token = _ciphertext_factory(SAMPLE_REFRESH_TOKEN)
+    store = MemorySessionStore(max_size=count, default_ttl=7 * 24 * 3600)
+
+    async def fill() -> None:
+        now = time.time()
+        for i in range(count):
+            session = build(i, access_token(), refresh_token(), now)
+            await store.set(session["user_id"] if layout == "dict" else session.user_id, session)
+
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    asyncio.run(fill())
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+    gc.collect()
+    return {
+        "sessions": count,
+        "total_mb": round(current / 2**20, 1),
+        "peak_mb": round(peak / 2**20, 1),
+        "bytes_per_session": round(current / count, 1),
+        "fill_s": round(elapsed, 2),
+    }
+
+
+def run(sizes) -> Dict[str, Dict[str, Dict[str, float]]]:
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for count in sizes:
+        results[str(count)] = {}
+        for layout in LAYOUTS:
+            result = results[str(count)][layout] = measure(layout, count)
+            print(
+                f"{count:>9} {layout:<7} {result['total_mb']:>9} MB  "
+                f"{result['bytes_per_session']:>8} B/session  fill {result['fill_s']}s"
+            )
+        saved = 1 - results[str(count)]["record"]["total_mb"] / results[str(count)]["dict"]["total_mb"]
+        print(f"{'':>9} record layout saves {saved:.0%}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="100000,1000000", help="comma-separated session counts")
+    parser.add_argument("--output", default="benchmarks/results/memory.json")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sessions.split(",")]
+    save_results(args.output, "memory", {"sessions": sizes}, run(sizes))
@@ -0,0 +1,107 @@
+"""
+Micro-benchmarks for the token crypto and session read paths
+The fernet_* and aesgcm_* cases time the two token ciphers directly;
+token_broker_get is a cached access token lookup.
+
+    python -m benchmarks.micro --number 20000 --repeat 5
+"""
+from typing import Any, Awaitable, Callable, Dict
+import argparse
+import asyncio
+import statistics
+import time
+from benchmarks import configure_environment, save_results
+from token_cipher import AesGcmCipher, FernetCipher
+
+SAMPLE_ACCESS_TOKEN = "ya29." + "a0AfB_byC" * 20
+SAMPLE_REFRESH_TOKEN = "1//0g" + "Lx9Qm2Rt" * 12
+
+
+def bench_sync(fn: Callable[[], Any], number: int, repeat: int) -> Dict[str, float]:
+    """Time `number` calls of `fn`, `repeat` times; per-call figures in nanoseconds"""
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter_ns() - started) / number)
+    return _summary(rounds)
+
+
+def bench_async(fn: Callable[[], Awaitable[Any]], number: int, repeat: int) -> Dict[str, float]:
+    """Like bench_sync, awaiting `fn()` sequentially inside one event loop"""
+    async def run_rounds():
+        rounds = []
+        for _ in range(repeat):
+            started = time.perf_counter_ns()
+            for _ in range(number):
+                await fn()
+            rounds.append((time.perf_counter_ns() - started) / number)
+        return rounds
+    return _summary(asyncio.run(run_rounds()))
+
+
+def _summary(rounds) -> Dict[str, float]:
+    best = min(rounds)
+    return {
+        "best_ns_per_op": round(best, 1),
+        "median_ns_per_op": round(statistics.median(rounds), 1),
+        "ops_per_s": round(1e9 / best, 1),
+    }
+
+
+def run(number: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    configure_environment()
+    import auth_backend
+    auth_backend.create_app()
+
+    encrypted = auth_backend.encrypt_token(SAMPLE_ACCESS_TOKEN)
+    asyncio.run(auth_backend.store_user_session(
+        user_id="bench-user",
+        email="bench@example.com",
+        name="Bench User",
+        picture=None,
+        access_token=SAMPLE_ACCESS_TOKEN,
+        refresh_token=SAMPLE_REFRESH_TOKEN,
+        expires_in=3600,
+        scopes=["openid", "email", "profile"],
+    ))
+    # Fill the broker cache so token_broker_get times the in-memory path
+    asyncio.run(auth_backend.token_broker.get("bench-user", 0))
+
+    cases = {
+        "encrypt_token": lambda: bench_sync(
+            lambda: auth_backend.encrypt_token(SAMPLE_ACCESS_TOKEN), number, repeat),
+        "decrypt_token": lambda: bench_sync(
+            lambda: auth_backend.decrypt_token(encrypted), number, repeat),
+        "get_user_session": lambda: bench_async(
+            lambda: auth_backend.get_user_session("bench-user"), number, repeat),
+        "get_session_profile": lambda: bench_async(
+            lambda: auth_backend.get_session_profile("bench-user"), number, repeat),
+        "token_broker_get": lambda: bench_async(
+            lambda: auth_backend.token_broker.get("bench-user", 300), number, repeat),
+    }
+    secret = auth_backend.settings.encryption_key
+    for cipher in (FernetCipher([secret]), AesGcmCipher([secret])):
+        plaintext = SAMPLE_ACCESS_TOKEN.encode()
+        ciphertext = cipher.encrypt(plaintext)
+        cases[f"{cipher.name}_encrypt"] = lambda cipher=cipher, plaintext=plaintext: bench_sync(
+            lambda: cipher.encrypt(plaintext), number, repeat)
+        cases[f"{cipher.name}_decrypt"] = lambda cipher=cipher, ciphertext=ciphertext: bench_sync(
+            lambda: cipher.decrypt(ciphertext), number, repeat)
+
+    results = {}
+    for name, case in cases.items():
+        results[name] = case()
+        print(f"{name:>20}: {results[name]['best_ns_per_op']:>10} ns/op  {results[name]['ops_per_s']:>12} ops/s")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="calls per round")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds (best is reported)")
+    parser.add_argument("--output", default="benchmarks/results/micro.json")
+    args = parser.parse_args()
+    results = run(args.number, args.repeat)
+    save_results(args.output, "micro", {"number": args.number, "repeat": args.repeat}, results)
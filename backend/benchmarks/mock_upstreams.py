@@ -0,0 +1,311 @@
+"""
+Local stand-ins for the Google OAuth2 endpoints and Supabase REST
+Usable in-process (as an httpx transport) or as a standalone server:
+
+    python -m benchmarks.mock_upstreams --port 9100 --latency-ms 20
+    python -m benchmarks.mock_upstreams --error-rate 0.2 --slow-rate 0.05 --slow-ms 2000
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import bisect
+import hashlib
+import random
+import time
+import httpx
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+SCOPE = " ".join([
+    "openid",
+    "email",
+    "profile",
+    "https://www.googleapis.com/auth/gmail.readonly",
+    "https://www.googleapis.com/auth/gmail.modify",
+    "https://www.googleapis.com/auth/calendar",
+    "https://www.googleapis.com/auth/calendar.events",
+])
+
+
+class MockLatency:
+    """Per-endpoint artificial latency in seconds"""
+
+    def __init__(self, token: float = 0.0, userinfo: float = 0.0, revoke: float = 0.0, supabase: float = 0.0):
+        self.token = token
+        self.userinfo = userinfo
+        self.revoke = revoke
+        self.supabase = supabase
+
+    @classmethod
+    def uniform(cls, seconds: float) -> "MockLatency":
+        return cls(seconds, seconds, seconds, seconds)
+
+
+class MockFaults:
+    """
+    Fault injection for the Google endpoints, adjustable while running
+
+    A share `error_rate` of requests to `endpoints` fail with 503 and a
+    share `slow_rate` are held for `slow_seconds` first (a latency tail;
+    set both rates to 1.0 for a hard outage or a hang).
+    """
+
+    def __init__(
+        self,
+        error_rate: float = 0.0,
+        slow_rate: float = 0.0,
+        slow_seconds: float = 1.0,
+        endpoints: Tuple[str, ...] = ("token", "userinfo"),
+        seed: Optional[int] = None,
+    ):
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.endpoints = endpoints
+        self._random = random.Random(seed)
+        self.injected = {"errors": 0, "slow": 0}
+
+    async def apply(self, endpoint: str) -> Optional[Response]:
+        """Delay and/or return a failure response for this request"""
+        if endpoint not in self.endpoints:
+            return None
+        if self.slow_rate and self._random.random() < self.slow_rate:
+            self.injected["slow"] += 1
+            await asyncio.sleep(self.slow_seconds)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.injected["errors"] += 1
+            return JSONResponse({"error": "backend_error"}, status_code=503)
+        return None
+
+
+class MockTable:
+    """Rows of one Supabase table, upserted by a key column and read in key order"""
+
+    def __init__(self):
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        # (column, sorted column values, row keys in that order), rebuilt after writes
+        self._order: Optional[Tuple[str, List[str], List[str]]] = None
+
+    def upsert(self, rows: List[Dict[str, Any]], key_column: str) -> None:
+        for row in rows:
+            key = str(row[key_column])
+            self.rows[key] = {**self.rows.get(key, {}), **row}
+        self._order = None
+
+    def page(self, column: str, after: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        if self._order is None or self._order[0] != column:
+            ordered = sorted((str(row[column]), key) for key, row in self.rows.items())
+            self._order = (column, [value for value, _ in ordered], [key for _, key in ordered])
+        _, values, keys = self._order
+        start = bisect.bisect_right(values, after) if after is not None else 0
+        return [self.rows[key] for key in keys[start:start + limit]]
+
+
+def _user_id(seed: str) -> str:
+    return "1" + str(int(hashlib.sha256(seed.encode()).hexdigest()[:15], 16))
+
+
+def create_mock_app(
+    client_id: str,
+    latency: Optional[MockLatency] = None,
+    issue_id_tokens: bool = True,
+    faults: Optional[MockFaults] = None,
+) -> FastAPI:
+    """
+    Build the stand-in app
+
+    The token endpoint derives a stable user from the authorization code or
+    refresh token, so the same code/refresh token always maps to the same
+    user. With `issue_id_tokens` it also returns an RS256 id_token signed by
+    a key served from /oauth2/v3/certs. `faults` (also adjustable with
+    POST /faults) injects errors and slow responses.
+    """
+    latency = latency or MockLatency()
+    faults = faults or MockFaults()
+    app = FastAPI()
+    app.state.faults = faults
+    app.state.counters = {"token": 0, "userinfo": 0, "revoke": 0, "certs": 0, "supabase": 0, "supabase_reads": 0}
+    app.state.tables = {}
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    # Parse the signing key once; re-parsing the PEM per token dominates otherwise
+    signing_key = jwk.construct(private_pem, "RS256")
+    public_jwk = jwk.construct(
+        private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        ),
+        "RS256",
+    ).to_dict()
+    public_jwk.update({"kid": "bench-key", "use": "sig", "alg": "RS256"})
+
+    async def delay(seconds: float) -> None:
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    @app.post("/token")
+    async def token(request: Request):
+        app.state.counters["token"] += 1
+        await delay(latency.token)
+        failure = await faults.apply("token")
+        if failure is not None:
+            return failure
+        form = await request.form()
+        seed = form.get("code") or form.get("refresh_token") or "anonymous"
+        user_id = _user_id(seed.removeprefix("rt-"))
+        access_token = f"at-{user_id}-{time.monotonic_ns()}"
+        body = {
+            "access_token": access_token,
+            "expires_in": 3599,
+            "scope": SCOPE,
+            "token_type": "Bearer",
+        }
+        if form.get("grant_type") == "authorization_code":
+            body["refresh_token"] = f"rt-{seed}"
+        if issue_id_tokens:
+            now = int(time.time())
+            body["id_token"] = jwt.encode(
+                {
+                    "iss": "https://accounts.google.com",
+                    "aud": client_id,
+                    "sub": user_id,
+                    "email": f"{user_id}@bench.example.com",
+                    "name": f"Bench User {user_id[-4:]}",
+                    "iat": now,
+                    "exp": now + 3600,
+                },
+                signing_key,
+                algorithm="RS256",
+                headers={"kid": "bench-key"},
+                access_token=access_token,
+            )
+        return body
+
+    @app.get("/oauth2/v2/userinfo")
+    async def userinfo(request: Request):
+        app.state.counters["userinfo"] += 1
+        await delay(latency.userinfo)
+        failure = await faults.apply("userinfo")
+        if failure is not None:
+            return failure
+        access_token = request.headers.get("authorization", "").removeprefix("Bearer ")
+        user_id = access_token.split("-")[1] if access_token.count("-") >= 2 else _user_id(access_token)
+        return {
+            "id": user_id,
+            "email": f"{user_id}@bench.example.com",
+            "name": f"Bench User {user_id[-4:]}",
+        }
+
+    @app.post("/revoke")
+    async def revoke():
+        app.state.counters["revoke"] += 1
+        await delay(latency.revoke)
+        failure = await faults.apply("revoke")
+        if failure is not None:
+            return failure
+        return {}
+
+    @app.get("/oauth2/v3/certs")
+    async def certs():
+        app.state.counters["certs"] += 1
+        return JSONResponse({"keys": [public_jwk]}, headers={"Cache-Control": "public, max-age=21600"})
+
+    @app.post("/rest/v1/{table}")
+    async def supabase_upsert(table: str, request: Request):
+        app.state.counters["supabase"] += 1
+        await delay(latency.supabase)
+        body = await request.json()
+        app.state.tables.setdefault(table, MockTable()).upsert(
+            body if isinstance(body, list) else [body],
+            request.query_params.get("on_conflict", "id"),
+        )
+        return Response(status_code=201)
+
+    @app.get("/rest/v1/{table}")
+    async def supabase_select(table: str, request: Request):
+        """PostgREST subset for keyset reads: select, order=<column>.asc, limit and <column>=gt.<value>"""
+        app.state.counters["supabase_reads"] += 1
+        await delay(latency.supabase)
+        params = request.query_params
+        column = params.get("order", "id.asc").split(".")[0]
+        after = params.get(column, "")
+        rows = app.state.tables.get(table, MockTable()).page(
+            column,
+            after[3:] if after.startswith("gt.") else None,
+            int(params.get("limit", 1000)),
+        )
+        select = params.get("select", "*")
+        if select != "*":
+            columns = select.split(",")
+            rows = [{name: row.get(name) for name in columns} for row in rows]
+        return JSONResponse(rows)
+
+    @app.post("/faults")
+    async def set_faults(request: Request):
+        for name, value in (await request.json()).items():
+            if name in ("error_rate", "slow_rate", "slow_seconds"):
+                setattr(faults, name, float(value))
+            elif name == "endpoints":
+                faults.endpoints = tuple(value)
+        return {**app.state.counters, "faults": faults.injected}
+
+    @app.get("/stats")
+    async def stats():
+        return {**app.state.counters, "faults": faults.injected}
+
+    return app
+
+
+def mock_transport(app: FastAPI) -> httpx.AsyncBaseTransport:
+    """In-process transport; requests to any host are routed by path to `app`"""
+    return httpx.ASGITransport(app=app)
+
+
+def backend_env(base_url: str) -> Dict[str, str]:
+    """Environment that points a separately started backend at a mock server"""
+    base_url = base_url.rstrip("/")
+    return {
+        "GOOGLE_TOKEN_URL": f"{base_url}/token",
+        "GOOGLE_USERINFO_URL": f"{base_url}/oauth2/v2/userinfo",
+        "GOOGLE_REVOKE_URL": f"{base_url}/revoke",
+        "GOOGLE_CERTS_URL": f"{base_url}/oauth2/v3/certs",
+        "SUPABASE_URL": base_url,
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+    from benchmarks import BENCH_ENV
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latency added to every endpoint")
+    parser.add_argument("--client-id", default=BENCH_ENV["GOOGLE_CLIENT_ID"])
+    parser.add_argument("--no-id-token", action="store_true", help="omit id_token from token responses")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of token/userinfo requests failing with 503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of token/userinfo requests delayed by --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    print("Start the backend with:")
+    for name, value in backend_env(f"http://127.0.0.1:{args.port}").items():
+        print(f"  export {name}={value}")
+    uvicorn.run(
+        create_mock_app(
+            args.client_id,
+            MockLatency.uniform(args.latency_ms / 1000),
+            not args.no_id_token,
+            MockFaults(args.error_rate, args.slow_rate, args.slow_ms / 1000),
+        ),
+        host="127.0.0.1",
+        port=args.port,
+        log_level="warning",
+    )
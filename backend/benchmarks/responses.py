@@ -0,0 +1,184 @@
+"""
+Response path: per-request cost of building the login URL (urlencode per
+call vs a compiled login profile) and of serializing hot responses through
+FastAPI's default path (response_model validation, jsonable_encoder,
+JSONResponse) against FastJSONResponse (orjson when installed), and the
+same payloads as a plain JSONResponse (the fallback without orjson)
+
+    python -m benchmarks.responses --number 5000 --repeat 5
+"""
+from typing import Any, Callable, Dict, Optional, Tuple
+import argparse
+import asyncio
+import time
+import urllib.parse
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from benchmarks import save_results
+from benchmarks.micro import bench_sync, _summary
+import fast_json
+from auth_backend import AuthResponse, TokenData, UserProfile, UserSession, GOOGLE_SCOPES
+from login_profiles import LoginProfile
+
+CLIENT_ID = "bench-client.apps.googleusercontent.com"
+REDIRECT_URI = "http://localhost:8060/api/auth/google/callback"
+AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth"
+STATE = "Xq3v8dN1kLmP0aRtYb6cZe2fGh5jKl7nOp9qRs4tUvw"
+ACCESS_TOKEN = "ya29." + "a0AfB_byC" * 20
+REFRESH_TOKEN = "1//0g" + "Lx9Qm2Rt" * 12
+BATCH_USERS = 500
+
+
+def user_session(user_id: str) -> UserSession:
+    return UserSession(
+        user_id=user_id,
+        email=f"{user_id}@bench.example.com",
+        name="Bench User",
+        access_token=ACCESS_TOKEN,
+        refresh_token=REFRESH_TOKEN,
+        expires_at="2030-01-01T00:00:00",
+        scopes=GOOGLE_SCOPES,
+        created_at="2029-12-31T23:00:00",
+        updated_at="2029-12-31T23:00:00",
+    )
+
+
+def validation(user_id: str) -> Dict[str, Any]:
+    return {
+        "valid": True,
+        "message": "Session is valid",
+        "user": {"user_id": user_id, "email": f"{user_id}@bench.example.com", "name": "Bench User", "picture": None},
+    }
+
+
+# name -> (response_model or None, payload factory) as the endpoints produce them
+PAYLOADS: Dict[str, Tuple[Optional[type], Callable[[], Any]]] = {
+    "validate": (None, lambda: validation("bench-user")),
+    "user": (UserSession, lambda: user_session("bench-user")),
+    "refresh": (AuthResponse, lambda: AuthResponse(
+        success=True,
+        message="Token refreshed successfully",
+        user=UserProfile(user_id="bench-user", email="bench@example.com", name="Bench User"),
+        tokens=TokenData(access_token=ACCESS_TOKEN, refresh_token=REFRESH_TOKEN, expires_in=3599, scope=" ".join(GOOGLE_SCOPES)),
+    )),
+    "validate_batch_500": (None, lambda: {"results": {f"user-{i}": validation(f"user-{i}") for i in range(BATCH_USERS)}}),
+    "user_batch_500": (None, lambda: {"results": {
+        f"user-{i}": {"found": True, "requires_refresh": False, "session": user_session(f"user-{i}").model_dump()}
+        for i in range(BATCH_USERS)
+    }}),
+}
+
+
+def plain(content: Any) -> Any:
+    return content.model_dump() if isinstance(content, BaseModel) else content
+
+
+def endpoint(content: Any, response: Optional[type] = None) -> Callable[[], Any]:
+    """A parameterless endpoint returning `content`, wrapped in `response` if given"""
+    async def handler():
+        return content if response is None else response(plain(content))
+    return handler
+
+
+def build_app() -> FastAPI:
+    """One route per payload and path; payloads are built up front so only the response path is timed"""
+    app = FastAPI()
+    for name, (model, factory) in PAYLOADS.items():
+        content = factory()
+        app.add_api_route(f"/default/{name}", endpoint(content), response_model=model)
+        app.add_api_route(f"/json/{name}", endpoint(content, JSONResponse))
+        app.add_api_route(f"/fast/{name}", endpoint(content, fast_json.FastJSONResponse))
+    return app
+
+
+async def call(app: FastAPI, path: str) -> int:
+    """One GET straight through the ASGI app (no HTTP client or server); returns the body size"""
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [], "server": ("bench", 80), "client": ("127.0.0.1", 1),
+    }
+    size = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return size
+
+
+async def measure_responses(number: int, repeat: int) -> Dict[str, Dict[str, Any]]:
+    app = build_app()
+    results = {}
+    for name in PAYLOADS:
+        count = max(1, number // 50) if "batch" in name else number
+        row = {}
+        for variant in ("default", "json", "fast"):
+            path = f"/{variant}/{name}"
+            row["bytes"] = await call(app, path)
+            rounds = []
+            for _ in range(repeat):
+                started = time.perf_counter_ns()
+                for _ in range(count):
+                    await call(app, path)
+                rounds.append((time.perf_counter_ns() - started) / count)
+            row[variant] = _summary(rounds)
+        row["speedup"] = round(row["default"]["best_ns_per_op"] / row["fast"]["best_ns_per_op"], 2)
+        results[name] = row
+    return results
+
+
+def measure_login_url(number: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    profile = LoginProfile("default", GOOGLE_SCOPES)
+    profile.compile(AUTH_URL, CLIENT_ID, REDIRECT_URI)
+
+    def urlencode_per_call():
+        params = {
+            "client_id": CLIENT_ID,
+            "redirect_uri": REDIRECT_URI,
+            "response_type": "code",
+            "scope": " ".join(GOOGLE_SCOPES),
+            "access_type": "offline",
+            "prompt": "consent",
+            "state": STATE,
+        }
+        return f"{AUTH_URL}?{urllib.parse.urlencode(params)}"
+
+    def compiled_profile():
+        return profile.url(STATE, profile.resolve_prompt("select_account"))
+
+    return {
+        "urlencode_per_call": bench_sync(urlencode_per_call, number, repeat),
+        "compiled_profile": bench_sync(compiled_profile, number, repeat),
+    }
+
+
+def main(args: argparse.Namespace) -> Dict[str, Any]:
+    login_url = measure_login_url(args.number * 10, args.repeat)
+    for name, result in login_url.items():
+        print(f"login url {name:>20}: {result['best_ns_per_op']:>10} ns")
+    responses = asyncio.run(measure_responses(args.number, args.repeat))
+    print(f"orjson installed: {fast_json.orjson is not None}")
+    for name, row in responses.items():
+        print(
+            f"{name:>20} ({row['bytes']:>7} B): default={row['default']['best_ns_per_op'] / 1000:>8.1f} us  "
+            f"json={row['json']['best_ns_per_op'] / 1000:>8.1f} us  fast={row['fast']['best_ns_per_op'] / 1000:>8.1f} us  "
+            f"x{row['speedup']}"
+        )
+    return {"orjson": fast_json.orjson is not None, "login_url": login_url, "responses": responses}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=5000, help="requests per round (batch payloads: number / 50)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="benchmarks/results/responses.json")
+    args = parser.parse_args()
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    save_results(args.output, "responses", config, main(args))
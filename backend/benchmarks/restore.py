@@ -0,0 +1,83 @@
+"""
+Warm-restart cost of the session journal: snapshot write time, snapshot
+size, and how long a fresh store takes to restore N sessions
+
+    python -m benchmarks.restore --sessions 100000,1000000
+"""
+from typing import Dict
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from benchmarks import save_results
+from benchmarks.memory import _ciphertext_factory, record_session
+from benchmarks.micro import SAMPLE_ACCESS_TOKEN, SAMPLE_REFRESH_TOKEN
+from session_journal import JournaledSessionStore, SessionJournal
+from session_store import MemorySessionStore
+
+
+def _store(directory: str, count: int) -> JournaledSessionStore:
+    return JournaledSessionStore(
+        MemorySessionStore(max_size=count, default_ttl=7 * 24 * 3600),
+        SessionJournal(directory),
+    )
+
+
+async def measure(count: int, journal_tail: int) -> Dict[str, float]:
+    directory = tempfile.mkdtemp(prefix="session-journal-")
+    try:
+        access_token = _ciphertext_factory(SAMPLE_ACCESS_TOKEN)
+        refresh_token = _ciphertext_factory(SAMPLE_REFRESH_TOKEN)
+        now = time.time()
+
+        store = _store(directory, count)
+        await store.restore()
+        for i in range(count):
+            record = record_session(i, access_token(), refresh_token(), now)
+            await store.inner.set(record.user_id, record)
+        started = time.perf_counter()
+        await store.compact()
+        snapshot_s = time.perf_counter() - started
+        # Writes after the snapshot are only in the journal
+        for i in range(journal_tail):
+            record = record_session(count + i, access_token(), refresh_token(), now)
+            await store.set(record.user_id, record)
+        store.journal.close()
+
+        restarted = _store(directory, count)
+        started = time.perf_counter()
+        restored = await restarted.restore()
+        restore_s = time.perf_counter() - started
+        restarted.journal.close()
+        return {
+            "sessions": restored,
+            "snapshot_mb": round(os.path.getsize(store.journal.snapshot_path) / 2**20, 1),
+            "snapshot_write_s": round(snapshot_s, 3),
+            "restore_s": round(restore_s, 3),
+            "restored_per_s": round(restored / restore_s, 1),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run(sizes, journal_tail: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for count in sizes:
+        result = results[str(count)] = asyncio.run(measure(count, journal_tail))
+        print(
+            f"{count:>9} sessions  snapshot {result['snapshot_mb']} MB in {result['snapshot_write_s']}s  "
+            f"restore {result['restore_s']}s ({result['restored_per_s']:.0f}/s)"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="100000,1000000", help="comma-separated session counts")
+    parser.add_argument("--journal-tail", type=int, default=1000, help="writes replayed from the journal")
+    parser.add_argument("--output", default="benchmarks/results/restore.json")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sessions.split(",")]
+    save_results(args.output, "restore", {"sessions": sizes, "journal_tail": args.journal_tail}, run(sizes, args.journal_tail))
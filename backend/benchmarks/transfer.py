@@ -0,0 +1,139 @@
+"""
+Bulk session transfer: re-hydration of N sessions from (mock) Supabase at
+each worker concurrency, and NDJSON export and import of the same sessions,
+with the peak memory traced during the export
+
+    python -m benchmarks.transfer --sessions 10000,100000 --concurrency 1,4 --latency-ms 20
+"""
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+from datetime import datetime
+from benchmarks import save_results
+from benchmarks.load import backend_client
+
+ADMIN_TOKEN = "benchmark-admin-token"
+HEADERS = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+
+
+def token_rows(count: int) -> List[Dict[str, Any]]:
+    updated_at = datetime.utcnow().isoformat()
+    return [
+        {
+            "google_user_id": f"1{i:020d}",
+            "email": f"user{i}@bench.example.com",
+            "name": f"Bench User {i}",
+            "picture": None,
+            "access_token": f"ya29.bench-{i}-" + "a0AfB_byC" * 18,
+            "refresh_token": f"1//0g-bench-{i}-" + "Lx9Qm2Rt" * 11,
+            "updated_at": updated_at,
+        }
+        for i in range(count)
+    ]
+
+
+async def seed_supabase(auth_backend, count: int, batch: int = 5000) -> None:
+    """Upsert rows into the mock table through the backend's upstream client"""
+    url = f"{auth_backend.settings.supabase_url}/rest/v1/google_oauth_tokens"
+    rows = token_rows(count)
+    for start in range(0, count, batch):
+        response = await auth_backend.upstream.client.post(
+            url, json=rows[start:start + batch], params={"on_conflict": "google_user_id"}
+        )
+        response.raise_for_status()
+
+
+async def wipe_sessions(auth_backend) -> None:
+    async for chunk in auth_backend.user_sessions.scan(1000):
+        for key, _ in chunk:
+            await auth_backend.user_sessions.delete(key)
+
+
+async def measure(sessions: int, levels: List[int], latency_ms: float, trace_memory: bool) -> Dict[str, Any]:
+    os.environ["ADMIN_TOKEN"] = ADMIN_TOKEN
+    os.environ.setdefault("SESSION_STORE_MAX_SIZE", str(max(sessions, 100000)))
+    async with backend_client(None, latency_ms) as client:
+        import auth_backend
+        await seed_supabase(auth_backend, sessions)
+
+        rehydrate = {}
+        for level in levels:
+            await wipe_sessions(auth_backend)
+            auth_backend.session_rehydrator.concurrency = level
+            started = time.perf_counter()
+            result = (await client.post("/api/admin/sessions/rehydrate", headers=HEADERS, timeout=600)).json()
+            elapsed = time.perf_counter() - started
+            rehydrate[str(level)] = {
+                "restored": result["restored"],
+                "seconds": round(elapsed, 3),
+                "sessions_per_s": round(result["restored"] / elapsed, 1),
+            }
+
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        size = 0
+        async with client.stream("GET", "/api/admin/sessions/export", headers=HEADERS, timeout=600) as response:
+            body = []
+            async for data in response.aiter_bytes():
+                size += len(data)
+                body.append(data)
+        export_seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+        payload = b"".join(body)
+        body.clear()
+
+        await wipe_sessions(auth_backend)
+        started = time.perf_counter()
+        imported = (await client.post("/api/admin/sessions/import", headers=HEADERS, content=payload, timeout=600)).json()
+        import_seconds = time.perf_counter() - started
+
+        return {
+            "rehydrate": rehydrate,
+            "export": {
+                "seconds": round(export_seconds, 3),
+                "bytes": size,
+                "sessions_per_s": round(sessions / export_seconds, 1),
+                # Includes the client's copy of the body, which the benchmark keeps
+                "traced_peak_bytes": peak,
+            },
+            "import": {
+                "imported": imported["imported"],
+                "seconds": round(import_seconds, 3),
+                "sessions_per_s": round(imported["imported"] / import_seconds, 1),
+            },
+        }
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    levels = [int(level) for level in args.concurrency.split(",")]
+    results = {}
+    for sessions in [int(n) for n in args.sessions.split(",")]:
+        result = results[str(sessions)] = await measure(sessions, levels, args.latency_ms, args.trace_memory)
+        for level, row in result["rehydrate"].items():
+            print(f"{sessions:>8} rehydrate c={level:<3} {row['seconds']:>8}s  {row['sessions_per_s']:>10} sessions/s")
+        export, imported = result["export"], result["import"]
+        print(
+            f"{sessions:>8} export        {export['seconds']:>8}s  {export['sessions_per_s']:>10} sessions/s  "
+            f"{export['bytes'] / 1e6:.1f} MB"
+            + (f"  traced peak {export['traced_peak_bytes'] / 1e6:.1f} MB" if export["traced_peak_bytes"] else "")
+        )
+        print(f"{sessions:>8} import        {imported['seconds']:>8}s  {imported['sessions_per_s']:>10} sessions/s")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="10000,100000", help="Supabase rows / stored sessions per run")
+    parser.add_argument("--concurrency", default="1,4", help="re-hydration worker counts")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="mock upstream latency (per Supabase page)")
+    parser.add_argument("--trace-memory", action="store_true", help="trace peak Python memory during the export")
+    parser.add_argument("--output", default="benchmarks/results/transfer.json")
+    args = parser.parse_args()
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    save_results(args.output, "transfer", config, asyncio.run(main(args)))
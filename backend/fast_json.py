@@ -0,0 +1,33 @@
+"""
+Fast JSON
+JSON encoding for hot responses: orjson when it is installed, otherwise the
+standard library with the same output Starlette's JSONResponse produces
+"""
+from typing import Any
+import json
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse encoded with `dumps`
+
+    Endpoints that return one directly also skip FastAPI's response_model
+    validation and jsonable_encoder pass, so content must already be plain
+    JSON types (dicts, lists, str, int, float, bool, None)
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,121 @@
+"""
+Local Google ID Token Verification
+Verifies the id_token returned by the token endpoint against Google's
+cached JWKS, replacing the extra userinfo round trip after each exchange
+"""
+from typing import Any, Callable, Dict, Iterable, Optional
+import re
+import time
+import httpx
+from singleflight import SingleFlight
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class IdTokenError(Exception):
+    """Raised when an id_token cannot be verified"""
+
+
+class IdTokenVerifier:
+    """
+    Verifies RS256 id_tokens (signature, audience, issuer, expiry, at_hash)
+
+    The JWKS is cached for the `max-age` Google sends in Cache-Control
+    (falling back to `default_ttl`). A token signed with an unknown `kid`
+    triggers a refetch, at most once per `min_refetch_interval`, to pick up
+    rotated keys. Concurrent fetches share one request.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        client: Callable[[], httpx.AsyncClient],
+        jwks_url: str = GOOGLE_CERTS_URL,
+        issuers: Iterable[str] = GOOGLE_ISSUERS,
+        default_ttl: float = 3600.0,
+        min_refetch_interval: float = 30.0,
+    ):
+        self.client_id = client_id
+        self._client = client
+        self.jwks_url = jwks_url
+        self.issuers = tuple(issuers)
+        self.default_ttl = default_ttl
+        self.min_refetch_interval = min_refetch_interval
+        self._keys: Dict[str, Dict[str, Any]] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._fetches = SingleFlight(grace_seconds=0)
+        self.verified = 0
+        self.failed = 0
+        self.jwks_fetches = 0
+
+    async def _fetch_jwks(self) -> None:
+        response = await self._client().get(self.jwks_url)
+        response.raise_for_status()
+        self.jwks_fetches += 1
+
+        match = _MAX_AGE.search(response.headers.get("cache-control", ""))
+        ttl = float(match.group(1)) if match else self.default_ttl
+        now = time.time()
+        self._keys = {key["kid"]: key for key in response.json().get("keys", []) if "kid" in key}
+        self._fetched_at = now
+        self._expires_at = now + ttl
+
+    async def _get_key(self, kid: Optional[str]) -> Dict[str, Any]:
+        now = time.time()
+        if now >= self._expires_at:
+            await self._fetches.do("jwks", self._fetch_jwks)
+        elif kid not in self._keys and now - self._fetched_at >= self.min_refetch_interval:
+            # Unknown key id: Google may have rotated its signing keys
+            await self._fetches.do("jwks", self._fetch_jwks)
+
+        key = self._keys.get(kid)
+        if key is None:
+            raise IdTokenError(f"Unknown signing key: {kid}")
+        return key
+
+    async def verify(self, id_token: str, access_token: Optional[str] = None) -> Dict[str, Any]:
+        """Verify an id_token and return its claims"""
+        # Imported on first use: python-jose is slow to import and only needed at login
+        from jose import jwt, JWTError
+
+        try:
+            header = jwt.get_unverified_header(id_token)
+            key = await self._get_key(header.get("kid"))
+            claims = jwt.decode(
+                id_token,
+                key,
+                algorithms=["RS256"],
+                audience=self.client_id,
+                issuer=self.issuers,
+                access_token=access_token,
+            )
+        except (JWTError, IdTokenError, httpx.HTTPError) as e:
+            self.failed += 1
+            raise IdTokenError(str(e)) from e
+
+        self.verified += 1
+        return claims
+
+    async def userinfo(self, id_token: str, access_token: Optional[str] = None) -> Dict[str, Any]:
+        """Verify an id_token and return its claims in the userinfo endpoint's shape"""
+        claims = await self.verify(id_token, access_token)
+        if "email" not in claims:
+            raise IdTokenError("id_token has no email claim")
+        userinfo = {"id": claims["sub"], "email": claims["email"]}
+        for field in ("name", "picture", "given_name", "family_name"):
+            if claims.get(field):
+                userinfo[field] = claims[field]
+        return userinfo
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "verified": self.verified,
+            "failed": self.failed,
+            "jwks_fetches": self.jwks_fetches,
+            "cached_keys": len(self._keys),
+            "jwks_expires_in": max(0.0, self._expires_at - time.time()),
+        }
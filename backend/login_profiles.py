@@ -0,0 +1,111 @@
+"""
+Login Profiles
+Named variants of the Google authorization request (scopes, prompt, offline
+access), each compiled once into URL prefixes so a login only appends its
+state and PKCE challenge
+"""
+from typing import Any, Dict, Iterable, Optional
+import urllib.parse
+
+# `prompt` values Google accepts, words in sorted order ("none" stands alone)
+PROMPTS = ("none", "consent", "select_account", "consent select_account")
+
+
+class LoginProfileError(ValueError):
+    """Unknown profile, bad profile definition, or a prompt the profile refuses"""
+
+
+class LoginProfile:
+    """
+    One variant of the authorization request
+
+    `prompt` applies when a login names none. With `require_consent` (for
+    profiles that must yield a refresh token) "consent" is added to any
+    requested prompt, since Google only returns a refresh token with
+    consent, and "none" is refused. `include_granted_scopes` asks for
+    incremental authorization: the new grant also covers the scopes the
+    user granted before, so a profile can ask for just the scopes it adds.
+    """
+
+    __slots__ = ("name", "scopes", "prompt", "access_type", "include_granted_scopes", "require_consent", "_prefixes")
+
+    def __init__(
+        self,
+        name: str,
+        scopes: Iterable[str],
+        prompt: str = "consent",
+        access_type: str = "offline",
+        include_granted_scopes: bool = False,
+        require_consent: bool = True,
+    ):
+        self.name = name
+        self.scopes = list(scopes)
+        self.access_type = access_type
+        self.include_granted_scopes = include_granted_scopes
+        self.require_consent = require_consent
+        self._prefixes: Dict[str, str] = {}
+        if not self.scopes:
+            raise LoginProfileError(f"Login profile {name!r} has no scopes")
+        if access_type not in ("offline", "online"):
+            raise LoginProfileError(f"Login profile {name!r}: access_type must be offline or online")
+        self.prompt = self.resolve_prompt(prompt)
+
+    @classmethod
+    def from_dict(cls, name: str, data: Dict[str, Any]) -> "LoginProfile":
+        try:
+            return cls(name, **data)
+        except TypeError as e:
+            raise LoginProfileError(f"Login profile {name!r}: {str(e)}")
+
+    def resolve_prompt(self, requested: Optional[str]) -> str:
+        """The prompt sent for a login requesting `requested` (None: the profile's own)"""
+        words = set((requested or self.prompt).split())
+        if self.require_consent:
+            words.add("consent")
+        prompt = " ".join(sorted(words))
+        if prompt not in PROMPTS:
+            raise LoginProfileError(f"Prompt {requested!r} is not allowed for login profile {self.name!r}")
+        return prompt
+
+    def compile(self, auth_url: str, client_id: str, redirect_uri: str) -> None:
+        """Encode everything but state and PKCE once, one prefix per allowed prompt"""
+        params = {
+            "client_id": client_id,
+            "redirect_uri": redirect_uri,
+            "response_type": "code",
+            "scope": " ".join(self.scopes),
+            "access_type": self.access_type,
+        }
+        if self.include_granted_scopes:
+            params["include_granted_scopes"] = "true"
+        query = urllib.parse.urlencode(params)
+        self._prefixes = {}
+        for prompt in PROMPTS:
+            try:
+                allowed = self.resolve_prompt(prompt) == prompt
+            except LoginProfileError:
+                allowed = False
+            if allowed:
+                self._prefixes[prompt] = f"{auth_url}?{query}&{urllib.parse.urlencode({'prompt': prompt})}&state="
+
+    def url(self, state: str, prompt: str, code_challenge: Optional[str] = None) -> str:
+        """Authorization URL for a prompt returned by `resolve_prompt`"""
+        url = self._prefixes[prompt] + urllib.parse.quote(state, safe="")
+        if code_challenge:
+            url += f"&code_challenge={code_challenge}&code_challenge_method=S256"
+        return url
+
+
+def compile_profiles(
+    definitions: Dict[str, Dict[str, Any]],
+    auth_url: str,
+    client_id: str,
+    redirect_uri: str,
+) -> Dict[str, LoginProfile]:
+    """Build and compile a profile per definition (name -> LoginProfile keyword arguments)"""
+    profiles = {}
+    for name, data in definitions.items():
+        profile = LoginProfile.from_dict(name, data)
+        profile.compile(auth_url, client_id, redirect_uri)
+        profiles[name] = profile
+    return profiles
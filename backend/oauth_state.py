@@ -0,0 +1,122 @@
+"""
+Stateless OAuth2 State Tokens
+Self-contained, HMAC-signed and timestamped `state` values, so any worker
+can validate a callback without storing the state server-side
+"""
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+
+# Seconds a state's issue time may lie in the future (clock skew between workers)
+MAX_CLOCK_SKEW = 60
+
+
+class InvalidStateError(Exception):
+    """Raised when a state token is malformed, forged, expired or replayed"""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def pkce_challenge(code_verifier: str) -> str:
+    """S256 code challenge for a PKCE code verifier"""
+    return _b64encode(hashlib.sha256(code_verifier.encode()).digest())
+
+
+class StateSigner:
+    """
+    Issues and verifies `<payload>.<signature>` state tokens
+
+    The payload is compact JSON holding a random nonce, the issue time and
+    the login `prompt`. When PKCE is requested the code verifier is never
+    put in the token (it would be visible in the redirect URL); it is
+    derived from the nonce with the signing secret instead, so the callback
+    can recompute it. A bounded cache of consumed nonces rejects replays
+    within `max_age_seconds`; older tokens fail the age check anyway.
+
+    That cache is per process. With several workers, callers must also
+    record the returned `nonce` in shared storage for `max_age_seconds`
+    plus the allowed clock skew (see `replay_window`).
+    """
+
+    def __init__(self, secret: bytes, max_age_seconds: int = 600, replay_cache_size: int = 10000):
+        self._secret = secret
+        self.max_age_seconds = max_age_seconds
+        self.replay_cache_size = replay_cache_size
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+
+    @property
+    def replay_window(self) -> int:
+        """Seconds a consumed nonce must be remembered (max age plus allowed clock skew)"""
+        return self.max_age_seconds + MAX_CLOCK_SKEW
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self._secret, payload.encode(), hashlib.sha256).digest())
+
+    def code_verifier(self, nonce: str) -> str:
+        """PKCE code verifier bound to a state nonce (43 url-safe characters)"""
+        return _b64encode(hmac.new(self._secret, b"pkce:" + nonce.encode(), hashlib.sha256).digest())
+
+    def issue(self, prompt: Optional[str] = None, pkce: bool = False) -> Tuple[str, Optional[str]]:
+        """Create a state token; returns (token, PKCE code verifier or None)"""
+        nonce = secrets.token_urlsafe(16)
+        claims: Dict[str, Any] = {"n": nonce, "t": int(time.time())}
+        if prompt:
+            claims["p"] = prompt
+        if pkce:
+            claims["k"] = 1
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        token = f"{payload}.{self._sign(payload)}"
+        return token, self.code_verifier(nonce) if pkce else None
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Check signature, age and replay; returns the state data
+        (`nonce`, `created_at`, `prompt` and, if PKCE was requested,
+        `code_verifier`)
+        """
+        payload, _, signature = token.partition(".")
+        if not payload or not signature:
+            raise InvalidStateError("Malformed state")
+        if not hmac.compare_digest(signature.encode(), self._sign(payload).encode()):
+            raise InvalidStateError("Bad state signature")
+
+        try:
+            claims = json.loads(_b64decode(payload))
+            nonce, issued_at = claims["n"], int(claims["t"])
+        except (ValueError, KeyError, TypeError):
+            raise InvalidStateError("Malformed state")
+
+        now = time.time()
+        if issued_at > now + MAX_CLOCK_SKEW or now - issued_at > self.max_age_seconds:
+            raise InvalidStateError("State expired")
+
+        self._expire_seen(now)
+        if nonce in self._seen:
+            raise InvalidStateError("State already used")
+        self._seen[nonce] = issued_at + self.max_age_seconds
+        while len(self._seen) > self.replay_cache_size:
+            self._seen.popitem(last=False)
+
+        state = {"nonce": nonce, "created_at": issued_at, "type": "login", "prompt": claims.get("p")}
+        if claims.get("k"):
+            state["code_verifier"] = self.code_verifier(nonce)
+        return state
+
+    def _expire_seen(self, now: float) -> None:
+        # Nonces are inserted in roughly issue order, so expired ones are at the front
+        while self._seen:
+            nonce, expires_at = next(iter(self._seen.items()))
+            if expires_at > now:
+                break
+            self._seen.popitem(last=False)
@@ -0,0 +1,157 @@
+"""
+Proactive Token Refresh Scheduler
+Refreshes stored Google tokens shortly before they expire so server-side
+consumers of the stored tokens never see an expired access token
+"""
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+
+class RefreshScheduler:
+    """
+    Min-heap of refresh deadlines, keyed by user id
+
+    Each call to `schedule` pushes a new deadline of
+    `expires_at - margin - jitter`; older deadlines for the same user become
+    stale and are skipped when popped, so rescheduling and cancelling are
+    O(log n) / O(1) with no scan of the session store. A deadline already
+    in the past (a session restored close to expiry) is spread over the
+    next `jitter` seconds instead, so a bulk restore does not fire at once.
+
+    `refresh(user_id)` is awaited for each due user with at most
+    `max_concurrency` refreshes running at once. A successful refresh is
+    expected to call `schedule` again (via the session store); if it raises,
+    the user is retried after `retry_seconds`.
+    """
+
+    def __init__(
+        self,
+        refresh: Callable[[str], Awaitable[None]],
+        margin_seconds: float = 300.0,
+        jitter_seconds: float = 60.0,
+        max_concurrency: int = 8,
+        retry_seconds: float = 60.0,
+    ):
+        self._refresh = refresh
+        self.margin_seconds = margin_seconds
+        self.jitter_seconds = jitter_seconds
+        self.retry_seconds = retry_seconds
+        self.max_concurrency = max_concurrency
+        self._heap: List[Tuple[float, int, str]] = []
+        self._due: Dict[str, float] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self.refreshed = 0
+        self.failed = 0
+
+    # ------------------------------------------------------------------
+    # Index maintenance
+    # ------------------------------------------------------------------
+
+    def schedule(self, user_id: str, expires_at: float) -> None:
+        """(Re)schedule a refresh for a session expiring at epoch `expires_at`"""
+        due = expires_at - self.margin_seconds - random.uniform(0, self.jitter_seconds)
+        now = time.time()
+        if due < now:
+            due = now + random.uniform(0, self.jitter_seconds)
+        self._push(user_id, due)
+
+    def cancel(self, user_id: str) -> None:
+        """Stop refreshing a user (e.g. on logout); the heap entry goes stale"""
+        self._due.pop(user_id, None)
+
+    def _push(self, user_id: str, due: float) -> None:
+        self._due[user_id] = due
+        heapq.heappush(self._heap, (due, next(self._seq), user_id))
+        if self._heap[0][0] == due and self._heap[0][2] == user_id:
+            # New earliest deadline, let the loop recompute its sleep
+            self._wakeup.set()
+        if len(self._heap) > 2 * len(self._due) + 1024:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Drop stale heap entries left behind by reschedules and cancels"""
+        self._heap = [
+            entry for entry in self._heap
+            if self._due.get(entry[2]) == entry[0]
+        ]
+        heapq.heapify(self._heap)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._running):
+            task.cancel()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, user_id = heapq.heappop(self._heap)
+                if self._due.get(user_id) != due:
+                    continue  # stale entry
+                del self._due[user_id]
+                await self._semaphore.acquire()
+                task = asyncio.create_task(self._refresh_one(user_id))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refresh_one(self, user_id: str) -> None:
+        try:
+            await self._refresh(user_id)
+            self.refreshed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            print(f"❌ Proactive refresh failed for user {user_id}: {str(e)}")
+            if user_id not in self._due:
+                self._push(user_id, time.time() + self.retry_seconds)
+        finally:
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, object]:
+        # Discard stale entries at the top so the head is the real next deadline
+        while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return {
+            "running": self._task is not None,
+            "scheduled": len(self._due),
+            "heap_size": len(self._heap),
+            "in_progress": len(self._running),
+            "next_due_in": (
+                max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            ),
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+        }
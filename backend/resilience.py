@@ -0,0 +1,396 @@
+"""
+Upstream Resilience
+Deadlines, a shared retry budget, per-upstream circuit breakers and hedged
+reads around calls to Google, so a slow or failing upstream sheds load
+quickly instead of holding every request open until it times out
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import math
+import random
+import time
+import httpx
+
+# Absolute (monotonic) deadline of the request being served, if any
+_deadline: ContextVar[Optional[float]] = ContextVar("upstream_deadline", default=None)
+
+# Failures that happen before the request reaches the upstream: always safe to retry
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Breaker states, also the value of the state gauge
+CLOSED = 0
+HALF_OPEN = 1
+OPEN = 2
+STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half_open", OPEN: "open"}
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream call was not attempted or gave up; retry after `retry_after` seconds"""
+
+    def __init__(self, upstream: str, reason: str, retry_after: float):
+        super().__init__(f"{upstream} unavailable: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        """Retry-After value (whole seconds, at least 1)"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+@contextmanager
+def deadline(seconds: float):
+    """
+    Bound all upstream calls made inside the block (including in tasks it
+    starts) to `seconds` from now; nested deadlines only ever shorten it
+    """
+    expires_at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(expires_at if current is None else min(current, expires_at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one"""
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+class RetryBudget:
+    """
+    Process-wide token bucket that caps retries (and hedges) to a fraction
+    of first attempts
+
+    Every first attempt deposits `ratio` tokens and every retry withdraws
+    one, with a floor of `min_per_second` so a quiet process can still
+    retry. When an upstream degrades, retries stop at roughly `ratio` extra
+    load instead of multiplying it.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+        self.allowed = 0
+        self.rejected = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self) -> None:
+        self._refill()
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        self._refill()
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            self.allowed += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "tokens": round(self._tokens, 2),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    for `reset_timeout` seconds, then lets a single probe through
+    (half-open): its success closes the breaker, its failure reopens it
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a probe through"""
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and self.retry_after() <= 0:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def release_probe(self) -> None:
+        """A half-open probe was cancelled without an outcome; let the next call probe"""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probing = False
+        if self.state != CLOSED:
+            print(f"✅ Circuit for {self.name} closed")
+        self.state = CLOSED
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.failure_threshold):
+            if self.state == CLOSED:
+                print(f"⚠️ Circuit for {self.name} opened after {self._failures} consecutive failures")
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+            self.opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        if self.state == OPEN and self.retry_after() <= 0:
+            self.state = HALF_OPEN
+        return {
+            "state": STATE_NAMES[self.state],
+            "consecutive_failures": self._failures,
+            "retry_after": round(self.retry_after(), 3) if self.state == OPEN else 0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class ConcurrencyLimit:
+    """
+    Caps concurrent upstream attempts across the process; callers beyond
+    the cap wait in FIFO order for at most their timeout
+
+    Written against the running loop on each wait (rather than holding an
+    asyncio.Semaphore) so one instance can outlive an event loop.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self.queued = 0
+        self.rejected = 0
+
+    async def acquire(self, timeout: float) -> bool:
+        if self.in_use < self.limit and not self._waiters:
+            self.in_use += 1
+            return True
+        if timeout <= 0:
+            self.rejected += 1
+            return False
+        self.queued += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # release() hands its slot straight to the waiter
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            return True
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                return True
+            waiter.cancel()
+            self.rejected += 1
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_use -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "waiting": sum(1 for waiter in self._waiters if not waiter.done()),
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+
+def is_upstream_failure(response: httpx.Response) -> bool:
+    """Responses that count against the breaker and may be retried (429 and 5xx)"""
+    return response.status_code == 429 or response.status_code >= 500
+
+
+class ResilientUpstream:
+    """
+    Runs upstream requests under the current deadline, the shared retry
+    budget and one circuit breaker per upstream name
+
+    `send(timeout)` performs a single attempt with the given httpx timeout.
+    Requests that were never sent (connect errors, pool timeouts) are
+    always retried; responses that were (timeouts, 429, 5xx) only when
+    `idempotent` is true. A 4xx is returned as-is and counts as success for
+    the breaker: the upstream is healthy, the request was not. When the
+    breaker is open, the deadline is exhausted, retries run out or no
+    concurrency slot frees up within `queue_timeout`, UpstreamUnavailable
+    is raised with a Retry-After hint.
+    """
+
+    def __init__(
+        self,
+        budget: RetryBudget,
+        attempt_timeout: float = 5.0,
+        default_deadline: float = 10.0,
+        max_attempts: int = 3,
+        backoff: float = 0.1,
+        max_backoff: float = 1.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        max_concurrency: int = 100,
+        queue_timeout: float = 1.0,
+    ):
+        self.budget = budget
+        self.slots = ConcurrencyLimit(max_concurrency)
+        self.queue_timeout = queue_timeout
+        self.attempt_timeout = attempt_timeout
+        self.default_deadline = default_deadline
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = self.breakers[name] = CircuitBreaker(
+                name, self.failure_threshold, self.reset_timeout
+            )
+        return breaker
+
+    def _deadline_left(self) -> float:
+        left = remaining_time()
+        return self.default_deadline if left is None else left
+
+    async def call(
+        self,
+        name: str,
+        send: Callable[[float], Awaitable[httpx.Response]],
+        idempotent: bool = False,
+    ) -> httpx.Response:
+        breaker = self.breaker(name)
+        if not breaker.allow():
+            raise UpstreamUnavailable(name, "circuit open", breaker.retry_after())
+        left = self._deadline_left()
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            if left <= 0:
+                breaker.release_probe()
+                raise UpstreamUnavailable(name, "deadline exceeded", self.backoff)
+            if not await self.slots.acquire(min(self.queue_timeout, left)):
+                # Saturated: shed the request without blaming the upstream
+                breaker.release_probe()
+                raise UpstreamUnavailable(name, "concurrency limit", self.queue_timeout)
+            timeout = min(self.attempt_timeout, self._deadline_left())
+            try:
+                if timeout <= 0:
+                    breaker.release_probe()
+                    raise UpstreamUnavailable(name, "deadline exceeded", self.backoff)
+                response = await asyncio.wait_for(send(timeout), timeout)
+            except asyncio.CancelledError:
+                breaker.release_probe()
+                raise
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                retryable = idempotent or isinstance(e, _NOT_SENT)
+                reason = type(e).__name__
+            else:
+                if not is_upstream_failure(response):
+                    breaker.record_success()
+                    return response
+                retryable = idempotent
+                reason = f"HTTP {response.status_code}"
+            finally:
+                self.slots.release()
+            breaker.record_failure()
+
+            delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1))) * random.uniform(0.5, 1.5)
+            left = self._deadline_left()
+            if (
+                not retryable
+                or attempt >= self.max_attempts
+                or delay >= left
+                or breaker.state != CLOSED
+                or not self.budget.try_withdraw()
+            ):
+                retry_after = breaker.retry_after() if breaker.state == OPEN else delay
+                raise UpstreamUnavailable(name, reason, retry_after)
+            await asyncio.sleep(delay)
+            left = self._deadline_left()
+
+    async def hedged(
+        self,
+        name: str,
+        send: Callable[[float], Awaitable[httpx.Response]],
+        hedge_after: float,
+    ) -> httpx.Response:
+        """
+        Idempotent read that fires a second identical request if the first
+        has not answered within `hedge_after` seconds; the first response
+        wins and the other request is cancelled. Hedges draw on the retry
+        budget, so they stop when the upstream is struggling.
+        """
+        first = asyncio.ensure_future(self.call(name, send, idempotent=True))
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done or not self.budget.try_withdraw():
+            return await first
+
+        self.hedges += 1
+        second = asyncio.ensure_future(self.call(name, send, idempotent=True))
+        pending = {first, second}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded or not pending:
+                    # Both failed: surface the last failure
+                    winner = succeeded[0] if succeeded else done.pop()
+                    if winner is second and succeeded:
+                        self.hedge_wins += 1
+                    return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breakers": {name: breaker.stats() for name, breaker in self.breakers.items()},
+            "retry_budget": self.budget.stats(),
+            "concurrency": self.slots.stats(),
+            "hedges": {"sent": self.hedges, "won": self.hedge_wins},
+        }
@@ -0,0 +1,219 @@
+"""
+Session Events
+Per-process fan-out of session changes (refresh, expiry, logout) to
+Server-Sent Event subscribers, so open tabs are told about changes instead
+of polling for them
+"""
+from typing import Any, Callable, Dict, Optional, Set
+import asyncio
+import time
+from fast_json import dumps
+
+# Client reconnect delay sent at the start of every stream (milliseconds)
+RETRY_MILLISECONDS = 5000
+
+REFRESH = "refresh"
+EXPIRY = "expiry"
+LOGOUT = "logout"
+
+
+def encode_event(event: str, data: Dict[str, Any], event_id: int) -> bytes:
+    """One SSE frame"""
+    return f"id: {event_id}\nevent: {event}\ndata: ".encode() + dumps(data) + b"\n\n"
+
+
+class Subscription:
+    """One connected stream: a bounded queue of encoded frames (None ends the stream)"""
+
+    __slots__ = ("user_id", "queue", "dropped")
+
+    def __init__(self, user_id: str, queue_size: int):
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, frame: Optional[bytes]) -> None:
+        """Queue a frame without blocking; when full the oldest frame is dropped"""
+        while True:
+            try:
+                self.queue.put_nowait(frame)
+                return
+            except asyncio.QueueFull:
+                self.queue.get_nowait()
+                self.dropped += 1
+
+
+class SessionEventHub:
+    """
+    Fan-out hub for session events, one per process
+
+    `publish` encodes an event once and offers the same bytes to every
+    subscriber of that user. Queues hold at most `queue_size` frames; a
+    subscriber that falls behind loses its oldest frames rather than
+    slowing the publisher or growing without bound (each event carries the
+    full new state, so the latest one is what matters).
+
+    While a user has subscribers the hub keeps one timer at their token
+    expiry; if no refresh re-arms it first, `on_expiry(user_id)` decides
+    whether to publish an expiry event. A logout event ends the user's
+    streams after it is delivered.
+
+    Events only reach streams held by this process; with several workers,
+    each worker publishes the changes it makes itself.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 16,
+        max_subscribers: int = 10000,
+        on_expiry: Optional[Callable[[str], Any]] = None,
+    ):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.on_expiry = on_expiry
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._expiry_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._expiry_tasks: Set[asyncio.Task] = set()
+        self._count = 0
+        self._next_id = 0
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    # ------------------------------------------------------------------
+    # Subscriptions
+    # ------------------------------------------------------------------
+
+    def subscribe(self, user_id: str, expires_at: Optional[int] = None) -> Optional[Subscription]:
+        """Open a subscription, or None when the process is at `max_subscribers`"""
+        if self._count >= self.max_subscribers:
+            self.rejected += 1
+            return None
+        subscription = Subscription(user_id, self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        self._count += 1
+        if expires_at is not None and user_id not in self._expiry_timers:
+            self._arm_expiry(user_id, expires_at)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.user_id)
+        if not subscribers or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        self._count -= 1
+        self.dropped += subscription.dropped
+        subscription.dropped = 0
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+            timer = self._expiry_timers.pop(subscription.user_id, None)
+            if timer is not None:
+                timer.cancel()
+
+    def has_subscribers(self, user_id: str) -> bool:
+        return user_id in self._subscribers
+
+    # ------------------------------------------------------------------
+    # Publishing
+    # ------------------------------------------------------------------
+
+    def publish(self, user_id: str, event: str, data: Dict[str, Any], expires_at: Optional[int] = None) -> int:
+        """
+        Send an event to the user's subscribers; returns how many received it
+        `expires_at` (with a refresh) moves the user's expiry timer
+        """
+        subscribers = self._subscribers.get(user_id)
+        if not subscribers:
+            return 0
+        self._next_id += 1
+        frame = encode_event(event, data, self._next_id)
+        self.published += 1
+        delivered = 0
+        for subscription in subscribers:
+            subscription.offer(frame)
+            if event == LOGOUT:
+                subscription.offer(None)
+            delivered += 1
+        self.delivered += delivered
+
+        if expires_at is not None:
+            self._arm_expiry(user_id, expires_at)
+        elif event in (EXPIRY, LOGOUT):
+            timer = self._expiry_timers.pop(user_id, None)
+            if timer is not None:
+                timer.cancel()
+        return delivered
+
+    def _arm_expiry(self, user_id: str, expires_at: int) -> None:
+        timer = self._expiry_timers.pop(user_id, None)
+        if timer is not None:
+            timer.cancel()
+        loop = asyncio.get_running_loop()
+        delay = max(0.0, expires_at - time.time())
+        self._expiry_timers[user_id] = loop.call_later(delay, self._expired, user_id)
+
+    def _expired(self, user_id: str) -> None:
+        self._expiry_timers.pop(user_id, None)
+        if self.on_expiry is not None and user_id in self._subscribers:
+            result = self.on_expiry(user_id)
+            if asyncio.iscoroutine(result):
+                task = asyncio.ensure_future(result)
+                self._expiry_tasks.add(task)
+                task.add_done_callback(self._expiry_tasks.discard)
+
+    async def stream(self, subscription: Subscription, heartbeat: float, max_seconds: float):
+        """
+        SSE body for one subscription: the reconnect delay, then events, with
+        a comment line every `heartbeat` seconds of silence so proxies keep
+        the connection open. Unsubscribes when the client goes away.
+
+        The stream ends after `max_seconds` and the client reconnects, so a
+        server shutting down gracefully (which waits for open responses)
+        is held up for at most that long, and streams rebalance over workers
+        """
+        loop = asyncio.get_running_loop()
+        ends_at = loop.time() + max_seconds
+        try:
+            yield f"retry: {RETRY_MILLISECONDS}\n\n".encode()
+            while True:
+                remaining = ends_at - loop.time()
+                if remaining <= 0:
+                    return
+                try:
+                    frame = await asyncio.wait_for(subscription.queue.get(), min(heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self.unsubscribe(subscription)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def close(self) -> None:
+        """End every stream (on shutdown) and cancel the expiry timers"""
+        for subscribers in self._subscribers.values():
+            for subscription in subscribers:
+                subscription.offer(None)
+        for timer in self._expiry_timers.values():
+            timer.cancel()
+        self._expiry_timers.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "subscribers": self._count,
+            "users": len(self._subscribers),
+            "max_subscribers": self.max_subscribers,
+            "expiry_timers": len(self._expiry_timers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped + sum(
+                s.dropped for subscribers in self._subscribers.values() for s in subscribers
+            ),
+            "rejected": self.rejected,
+        }
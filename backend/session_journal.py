@@ -0,0 +1,550 @@
+"""
+Session Journal
+Local persistence for the in-memory session store: an append-only journal of
+session writes and deletes plus periodic compacted snapshots, so a restart
+restores every session instead of logging everyone out
+"""
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import math
+import mmap
+import os
+import re
+import struct
+import time
+import zlib
+from session_record import SCOPE_REGISTRY, SessionRecord
+from session_store import MemorySessionStore, SessionStore
+
+# Files in the journal directory:
+#   snapshot            compacted state; header records the first journal
+#                       generation it does not include
+#   journal.<gen>       appended to between snapshots
+#
+# Both hold the same frames: length (u32) | crc32 (u32) | payload. A frame
+# with a bad length or checksum ends the file (torn write at crash time).
+FRAME = struct.Struct("<II")
+SNAPSHOT_MAGIC = b"GAUTHSS1"
+SNAPSHOT_HEADER = struct.Struct("<8sQ")
+
+OP_PUT = 1
+OP_DELETE = 2
+OP_SCOPE = 3
+
+# op | store expiry (NaN: none) | expires_at | created_at | updated_at |
+# mask length | lengths of user_id, email, name, picture, access and refresh
+# token (NONE_LENGTH: None) -- then the mask and the six fields back to back,
+# so decoding is one unpack plus slicing
+PUT_HEADER = struct.Struct("<BdqqqH6I")
+SCOPE_HEADER = struct.Struct("<BH")
+NONE_LENGTH = 0xFFFFFFFF
+
+JOURNAL_NAME = re.compile(r"^journal\.(\d+)$")
+
+
+def encode_frame(payload: bytes) -> bytes:
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def encode_put(record: SessionRecord, store_expires_at: Optional[float]) -> bytes:
+    """PUT payload; the scope mask is written against the process's scope registry"""
+    mask = record.scope_mask.to_bytes((record.scope_mask.bit_length() + 7) // 8, "little")
+    fields = (
+        record.user_id.encode(),
+        record.email.encode(),
+        record.name.encode(),
+        record.picture.encode() if record.picture is not None else None,
+        record.access_token,
+        record.refresh_token,
+    )
+    header = PUT_HEADER.pack(
+        OP_PUT,
+        math.nan if store_expires_at is None else store_expires_at,
+        record.expires_at,
+        record.created_at,
+        record.updated_at,
+        len(mask),
+        *[NONE_LENGTH if field is None else len(field) for field in fields],
+    )
+    return b"".join([header, mask, *[field for field in fields if field is not None]])
+
+
+def encode_delete(key: str) -> bytes:
+    return bytes([OP_DELETE]) + key.encode()
+
+
+def encode_scope(bit_index: int, name: str) -> bytes:
+    return SCOPE_HEADER.pack(OP_SCOPE, bit_index) + name.encode()
+
+
+def iter_frames(buffer, offset: int = 0) -> Iterator[memoryview]:
+    """Yield valid frame payloads from `buffer` (bytes or mmap), stopping at the first bad one"""
+    view = memoryview(buffer)
+    end = len(view)
+    while offset + FRAME.size <= end:
+        length, crc = FRAME.unpack_from(view, offset)
+        start = offset + FRAME.size
+        if start + length > end:
+            return
+        payload = view[start:start + length]
+        if zlib.crc32(payload) != crc:
+            return
+        yield payload
+        offset = start + length
+
+
+class _Decoder:
+    """
+    Decodes payloads from one file
+
+    Scope masks are remapped from the file's scope table to this process's
+    registry, once per distinct mask.
+    """
+
+    def __init__(self):
+        self.scopes: List[str] = []
+        self._remapped: Dict[int, int] = {}
+
+    def define_scope(self, bit_index: int, name: str) -> None:
+        while len(self.scopes) <= bit_index:
+            self.scopes.append("")
+        self.scopes[bit_index] = name
+        self._remapped.clear()
+
+    def mask(self, file_mask: int) -> int:
+        mask = self._remapped.get(file_mask)
+        if mask is None:
+            names = [name for i, name in enumerate(self.scopes) if file_mask >> i & 1]
+            mask = self._remapped[file_mask] = SCOPE_REGISTRY.mask(names)
+        return mask
+
+    def decode(self, payload: memoryview) -> Tuple[int, Any]:
+        """(op, value): PUT -> (store_expires_at, record), DELETE -> key, SCOPE -> None"""
+        op = payload[0]
+        if op == OP_DELETE:
+            return op, bytes(payload[1:]).decode()
+        if op == OP_SCOPE:
+            _, bit_index = SCOPE_HEADER.unpack_from(payload)
+            self.define_scope(bit_index, bytes(payload[SCOPE_HEADER.size:]).decode())
+            return op, None
+
+        (_, store_expires_at, expires_at, created_at, updated_at, mask_length,
+         *lengths) = PUT_HEADER.unpack_from(payload)
+        data = bytes(payload)
+        offset = PUT_HEADER.size + mask_length
+        mask = int.from_bytes(data[PUT_HEADER.size:offset], "little")
+        fields: List[Optional[bytes]] = []
+        for length in lengths:
+            if length == NONE_LENGTH:
+                fields.append(None)
+            else:
+                fields.append(data[offset:offset + length])
+                offset += length
+        user_id, email, name, picture, access_token, refresh_token = fields
+        record = SessionRecord(
+            user_id=user_id.decode(),
+            email=email.decode(),
+            name=name.decode(),
+            picture=picture.decode() if picture is not None else None,
+            access_token=access_token,
+            refresh_token=refresh_token,
+            expires_at=expires_at,
+            scope_mask=self.mask(mask),
+            created_at=created_at,
+            updated_at=updated_at,
+        )
+        return op, (None if math.isnan(store_expires_at) else store_expires_at, record)
+
+
+class SessionJournal:
+    """
+    Journal and snapshot files in one directory
+
+    Compaction starts a new journal generation, captures the store, and
+    writes the snapshot in a worker thread; the snapshot is renamed into
+    place atomically and older journals are then removed. Replay is
+    idempotent, so a crash at any point restores the latest state.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.generation = 0
+        self._file = None
+        self._scopes_written = 0
+        self.appended = 0
+        self.appended_bytes = 0
+        self.snapshots = 0
+        self.last_snapshot_seconds: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._file is not None
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, "snapshot")
+
+    def journal_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"journal.{generation}")
+
+    def snapshot_generation(self) -> int:
+        """First journal generation the snapshot does not include (0 without one)"""
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                header = f.read(SNAPSHOT_HEADER.size)
+        except FileNotFoundError:
+            return 0
+        if len(header) < SNAPSHOT_HEADER.size:
+            return 0
+        magic, generation = SNAPSHOT_HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"Not a session snapshot: {self.snapshot_path}")
+        return generation
+
+    def journal_generations(self) -> List[int]:
+        generations = []
+        for name in os.listdir(self.directory):
+            match = JOURNAL_NAME.match(name)
+            if match:
+                generations.append(int(match.group(1)))
+        return sorted(generations)
+
+    # ------------------------------------------------------------------
+    # Appending
+    # ------------------------------------------------------------------
+
+    def open(self, generation: int) -> None:
+        """Start appending to journal.<generation>"""
+        if self._file is not None:
+            self._file.close()
+        self.generation = generation
+        fd = os.open(self.journal_path(generation), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self._file = os.fdopen(fd, "ab")
+        self._scopes_written = 0
+        self.appended_bytes = 0
+
+    def _write(self, payload: bytes) -> None:
+        frame = encode_frame(payload)
+        self._file.write(frame)
+        self.appended_bytes += len(frame)
+
+    def _write_new_scopes(self) -> None:
+        # Each journal carries the scope names its masks refer to
+        names = SCOPE_REGISTRY.scopes((1 << len(SCOPE_REGISTRY)) - 1)
+        for bit_index in range(self._scopes_written, len(names)):
+            self._write(encode_scope(bit_index, names[bit_index]))
+        self._scopes_written = len(names)
+
+    def append_put(self, record: SessionRecord, store_expires_at: Optional[float]) -> None:
+        if len(SCOPE_REGISTRY) > self._scopes_written:
+            self._write_new_scopes()
+        self._write(encode_put(record, store_expires_at))
+        self._file.flush()
+        self.appended += 1
+
+    def append_delete(self, key: str) -> None:
+        self._write(encode_delete(key))
+        self._file.flush()
+        self.appended += 1
+
+    def sync(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+
+    def write_snapshot(self, entries: List[Tuple[str, SessionRecord, Optional[float]]], generation: int) -> None:
+        """Write `entries` as the snapshot covering all journals before `generation` (blocking)"""
+        started = time.perf_counter()
+        temp_path = self.snapshot_path + ".tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb", buffering=1 << 20) as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation))
+            names = SCOPE_REGISTRY.scopes((1 << len(SCOPE_REGISTRY)) - 1)
+            for bit_index, name in enumerate(names):
+                f.write(encode_frame(encode_scope(bit_index, name)))
+            for _, record, expires_at in entries:
+                f.write(encode_frame(encode_put(record, expires_at)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        for old in self.journal_generations():
+            if old < generation:
+                os.remove(self.journal_path(old))
+        self.snapshots += 1
+        self.last_snapshot_seconds = time.perf_counter() - started
+
+    # ------------------------------------------------------------------
+    # Replay
+    # ------------------------------------------------------------------
+
+    def open_next(self) -> None:
+        """Start a generation newer than anything on disk; replay reads only older ones"""
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self.open(max([self.snapshot_generation(), *self.journal_generations()]) + 1)
+
+    def replay(self, batch_size: int = 5000) -> Iterator[List[Tuple[int, Any]]]:
+        """
+        Yield decoded (op, value) batches: the memory-mapped snapshot first,
+        then the journals it does not cover, oldest first, up to (excluding)
+        the generation currently being appended to
+        """
+        first_generation = self.snapshot_generation()
+        if first_generation:
+            with open(self.snapshot_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield from self._decode_batches(mapped, SNAPSHOT_HEADER.size, batch_size)
+
+        for generation in self.journal_generations():
+            if first_generation <= generation < self.generation:
+                with open(self.journal_path(generation), "rb") as f:
+                    data = f.read()
+                yield from self._decode_batches(data, 0, batch_size)
+
+    @staticmethod
+    def _decode_batches(buffer, offset: int, batch_size: int) -> Iterator[List[Tuple[int, Any]]]:
+        decoder = _Decoder()
+        batch: List[Tuple[int, Any]] = []
+        for payload in iter_frames(buffer, offset):
+            op, value = decoder.decode(payload)
+            if op == OP_SCOPE:
+                continue
+            batch.append((op, value))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+class JournaledSessionStore(SessionStore):
+    """
+    Memory store whose mutations are journaled to disk
+
+    `restore()` replays the snapshot and journals in slices, yielding to the
+    event loop between them, so the app serves requests while it runs. A
+    lookup that misses during restore waits for it to finish rather than
+    reporting "no session" and forcing a re-login. Keys written live during
+    restore are not overwritten by older state from disk.
+
+    If restore fails (e.g. an unreadable or corrupt file) the store still
+    becomes ready and serves what it holds; the files on disk are kept as
+    they are for inspection, so no snapshot is written over them.
+    """
+
+    def __init__(
+        self,
+        inner: MemorySessionStore,
+        journal: SessionJournal,
+        snapshot_interval: float = 300.0,
+        compact_after_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.inner = inner
+        self.journal = journal
+        self.snapshot_interval = snapshot_interval
+        self.compact_after_bytes = compact_after_bytes
+        self.restored = 0
+        self.restore_seconds: Optional[float] = None
+        self.restore_error: Optional[str] = None
+        self._ready = asyncio.Event()
+        self._touched: Optional[set] = set()
+        self._compact_requested = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def open(self) -> None:
+        """Create the directory and start a new journal (before any write; idempotent)"""
+        if not self.journal.is_open:
+            self.journal.open_next()
+
+    async def restore(self, on_record: Optional[Callable[[SessionRecord], None]] = None) -> int:
+        """Load persisted sessions; `on_record` is called for each live one restored"""
+        started = time.perf_counter()
+        try:
+            self.open()
+            count = await self._restore(on_record)
+        except BaseException as e:
+            self.restore_error = str(e) or type(e).__name__
+            raise
+        finally:
+            # Lookups wait for this, so it is set even when restore fails
+            self._touched = None
+            self.restore_seconds = time.perf_counter() - started
+            self._ready.set()
+        self.restored = count
+        return count
+
+    async def _restore(self, on_record: Optional[Callable[[SessionRecord], None]]) -> int:
+        restored: Dict[str, Tuple[SessionRecord, Optional[float]]] = {}
+        for batch in self.journal.replay():
+            for op, value in batch:
+                if op == OP_PUT:
+                    expires_at, record = value
+                    restored[record.user_id] = (record, expires_at)
+                else:
+                    restored.pop(value, None)
+            await asyncio.sleep(0)
+
+        now = time.time()
+        live = [
+            (key, record, expires_at)
+            for key, (record, expires_at) in restored.items()
+            if expires_at is None or expires_at > now
+        ]
+        live.sort(key=lambda entry: math.inf if entry[2] is None else entry[2])
+        count = 0
+        for key, record, expires_at in live:
+            if key in self._touched:
+                continue
+            self.inner.load(key, record, expires_at)
+            if on_record is not None:
+                on_record(record)
+            count += 1
+            if count % 5000 == 0:
+                await asyncio.sleep(0)
+        return count
+
+    async def start(self) -> None:
+        """Open the journal and start periodic compaction"""
+        self.open()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        await self._ready.wait()
+        if self.restore_error is not None:
+            return
+        while True:
+            try:
+                await asyncio.wait_for(self._compact_requested.wait(), timeout=self.snapshot_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._compact_requested.clear()
+            if self._closing:
+                return
+            if self.journal.appended_bytes:
+                try:
+                    await self.compact()
+                except Exception as e:
+                    print(f"❌ Session snapshot failed: {str(e)}")
+
+    async def compact(self) -> None:
+        """Snapshot the store and drop the journals it covers"""
+        generation = self.journal.generation + 1
+        self.journal.open(generation)
+        entries = self.inner.entries()
+        await asyncio.to_thread(self.journal.write_snapshot, entries, generation)
+
+    async def close(self) -> None:
+        # Let an in-progress snapshot finish; its worker thread cannot be cancelled
+        self._closing = True
+        if self._task is not None:
+            self._compact_requested.set()
+            await self._task
+            self._task = None
+        if self._ready.is_set() and self.restore_error is None and (self.journal.appended_bytes or len(self.journal.journal_generations()) > 1):
+            await self.compact()
+        self.journal.close()
+        await self.inner.close()
+
+    # ------------------------------------------------------------------
+    # SessionStore interface
+    # ------------------------------------------------------------------
+
+    def _mutated(self, key: str) -> None:
+        if self._touched is not None:
+            self._touched.add(key)
+        elif self.journal.appended_bytes >= self.compact_after_bytes:
+            self._compact_requested.set()
+
+    async def get(self, key: str) -> Optional[SessionRecord]:
+        value = await self.inner.get(key)
+        if value is None and not self._ready.is_set():
+            await self._ready.wait()
+            value = await self.inner.get(key)
+        return value
+
+    async def get_many(self, keys: List[str]) -> List[Optional[SessionRecord]]:
+        if not self._ready.is_set():
+            await self._ready.wait()
+        return await self.inner.get_many(keys)
+
+    async def set(self, key: str, value: SessionRecord, ttl: Optional[float] = None) -> None:
+        await self.inner.set(key, value, ttl)
+        self._journal_put(key, value, ttl)
+
+    async def add(self, key: str, value: SessionRecord, ttl: Optional[float] = None) -> bool:
+        if not self._ready.is_set():
+            await self._ready.wait()
+        added = await self.inner.add(key, value, ttl)
+        if added:
+            self._journal_put(key, value, ttl)
+        return added
+
+    def _journal_put(self, key: str, value: SessionRecord, ttl: Optional[float]) -> None:
+        ttl = ttl if ttl is not None else self.inner.default_ttl
+        self.journal.append_put(value, time.time() + ttl if ttl is not None else None)
+        self._mutated(key)
+
+    async def pop(self, key: str) -> Optional[SessionRecord]:
+        if not self._ready.is_set():
+            await self._ready.wait()
+        value = await self.inner.pop(key)
+        if value is not None:
+            self.journal.append_delete(key)
+            self._mutated(key)
+        return value
+
+    async def delete(self, key: str) -> bool:
+        # Journal unconditionally: the key may still be on its way in from disk
+        existed = await self.inner.delete(key)
+        self.journal.append_delete(key)
+        self._mutated(key)
+        return existed
+
+    async def size(self) -> int:
+        return await self.inner.size()
+
+    async def scan(self, chunk_size: int = 500) -> AsyncIterator[List[Tuple[str, SessionRecord]]]:
+        if not self._ready.is_set():
+            await self._ready.wait()
+        async for chunk in self.inner.scan(chunk_size):
+            yield chunk
+
+    async def sweep(self) -> int:
+        return await self.inner.sweep()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.inner.stats(),
+            "persistence": {
+                "directory": self.journal.directory,
+                "ready": self._ready.is_set(),
+                "restored": self.restored,
+                "restore_ms": round(self.restore_seconds * 1000, 1) if self.restore_seconds is not None else None,
+                "restore_error": self.restore_error,
+                "generation": self.journal.generation,
+                "journal_entries": self.journal.appended,
+                "journal_bytes": self.journal.appended_bytes,
+                "snapshots": self.journal.snapshots,
+                "last_snapshot_ms": round(self.journal.last_snapshot_seconds * 1000, 1)
+                if self.journal.last_snapshot_seconds is not None else None,
+            },
+        }
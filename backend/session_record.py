@@ -0,0 +1,174 @@
+"""
+Session Record
+Compact in-memory representation of a stored user session: a slotted object
+with epoch-second timestamps, encrypted tokens as bytes, and scopes packed
+into a bitmask against a process-wide scope registry
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime
+import base64
+import sys
+import threading
+import time
+
+
+class ScopeRegistry:
+    """
+    Interns OAuth2 scope strings and assigns each one a bit
+
+    Every session granted the same scopes then shares one int mask instead of
+    holding its own list of long scope URLs. Bits are process-local, so masks
+    must never be persisted; serialize with `scopes(mask)` instead.
+    """
+
+    def __init__(self, scopes: Iterable[str] = ()):
+        self._bits: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._decoded: Dict[int, Tuple[str, ...]] = {0: ()}
+        self._lock = threading.Lock()
+        for scope in scopes:
+            self.bit(scope)
+
+    def bit(self, scope: str) -> int:
+        """Bit value for `scope`, registering it on first sight"""
+        bit = self._bits.get(scope)
+        if bit is None:
+            with self._lock:
+                bit = self._bits.get(scope)
+                if bit is None:
+                    bit = 1 << len(self._names)
+                    self._names.append(sys.intern(scope))
+                    self._bits[self._names[-1]] = bit
+        return bit
+
+    def mask(self, scopes: Iterable[str]) -> int:
+        mask = 0
+        for scope in scopes:
+            mask |= self.bit(scope)
+        return mask
+
+    def scopes(self, mask: int) -> Tuple[str, ...]:
+        """Scope names for `mask` in registration order; decoded once per distinct mask"""
+        decoded = self._decoded.get(mask)
+        if decoded is None:
+            decoded = tuple(name for i, name in enumerate(self._names) if mask >> i & 1)
+            self._decoded[mask] = decoded
+        return decoded
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+SCOPE_REGISTRY = ScopeRegistry()
+
+
+def to_iso(epoch: int) -> str:
+    """ISO-8601 UTC string (naive, as the API has always returned) for an epoch"""
+    return datetime.utcfromtimestamp(epoch).isoformat()
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    # Older records hold the Fernet token text itself; decoding it yields the
+    # raw Fernet bytes, which the token cipher also accepts
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def to_epoch(value: Any) -> int:
+    """Epoch seconds from an int/float or a (naive UTC) ISO-8601 string"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        return int((parsed - datetime(1970, 1, 1)).total_seconds())
+    return int(parsed.timestamp())
+
+
+class SessionRecord:
+    """
+    One stored session
+
+    `access_token`/`refresh_token` hold the encrypted tokens as bytes (binary
+    for AES-GCM) and are never decrypted here. Timestamps are integer epoch
+    seconds.
+    """
+
+    __slots__ = (
+        "user_id",
+        "email",
+        "name",
+        "picture",
+        "access_token",
+        "refresh_token",
+        "expires_at",
+        "scope_mask",
+        "created_at",
+        "updated_at",
+    )
+
+    def __init__(
+        self,
+        user_id: str,
+        email: str,
+        name: str,
+        picture: Optional[str],
+        access_token: bytes,
+        refresh_token: Optional[bytes],
+        expires_at: int,
+        scope_mask: int,
+        created_at: int,
+        updated_at: int,
+    ):
+        self.user_id = user_id
+        self.email = email
+        self.name = name
+        self.picture = picture
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.expires_at = expires_at
+        self.scope_mask = scope_mask
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @property
+    def scopes(self) -> List[str]:
+        return list(SCOPE_REGISTRY.scopes(self.scope_mask))
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        return self.expires_at < (time.time() if now is None else now)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-compatible form for shared backends (scopes as names, not bits)"""
+        return {
+            "user_id": self.user_id,
+            "email": self.email,
+            "name": self.name,
+            "picture": self.picture,
+            "access_token": _b64encode(self.access_token),
+            "refresh_token": _b64encode(self.refresh_token) if self.refresh_token else None,
+            "expires_at": self.expires_at,
+            "scopes": list(SCOPE_REGISTRY.scopes(self.scope_mask)),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SessionRecord":
+        """Inverse of `to_dict`; also accepts the older dict layout with ISO timestamps"""
+        expires_at = data.get("expires_at_epoch", data["expires_at"])
+        refresh_token = data.get("refresh_token")
+        return cls(
+            user_id=data["user_id"],
+            email=data["email"],
+            name=data["name"],
+            picture=data.get("picture"),
+            access_token=_b64decode(data["access_token"]),
+            refresh_token=_b64decode(refresh_token) if refresh_token else None,
+            expires_at=to_epoch(expires_at),
+            scope_mask=SCOPE_REGISTRY.mask(data.get("scopes", ())),
+            created_at=to_epoch(data["created_at"]),
+            updated_at=to_epoch(data["updated_at"]),
+        )
@@ -0,0 +1,479 @@
+"""
+Session Store
+Pluggable key/value storage for user sessions and OAuth2 states, with an
+in-process memory backend (TTL + LRU eviction), a Redis-protocol backend
+for sharing state between processes, and a host-local SQLite backend
+(sqlite_store.py) for sharing it between the workers of one host
+"""
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import json
+import time
+import urllib.parse
+
+
+class SessionStore(ABC):
+    """
+    Async key/value store with optional TTL
+
+    Values are JSON-compatible dicts, or record objects (e.g. SessionRecord)
+    when the store is built with a `record_type`: memory keeps them as-is,
+    shared backends serialize via `to_dict()` / `record_type.from_dict()`.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the value for `key`, or None if missing or expired"""
+
+    @abstractmethod
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """Store `value` under `key`, expiring after `ttl` seconds if given"""
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Return the values for `keys` in order (None where missing or expired)"""
+        return [await self.get(key) for key in keys]
+
+    @abstractmethod
+    async def add(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> bool:
+        """Atomically store `value` only if `key` has no live value; returns True if stored"""
+
+    @abstractmethod
+    async def pop(self, key: str) -> Optional[Dict[str, Any]]:
+        """Atomically remove and return the value for `key`"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> bool:
+        """Remove `key`; returns True if it existed"""
+
+    @abstractmethod
+    async def size(self) -> int:
+        """Number of live entries"""
+
+    @abstractmethod
+    def scan(self, chunk_size: int = 500) -> AsyncIterator[List[Tuple[str, Any]]]:
+        """
+        Yield every live (key, value) in chunks of at most `chunk_size`, for
+        bulk export; entries written during the scan may or may not be seen
+        """
+
+    async def sweep(self) -> int:
+        """Drop expired entries; returns how many were removed"""
+        return 0
+
+    async def close(self) -> None:
+        """Release backend resources"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__}
+
+
+# ============================================================================
+# Memory Backend
+# ============================================================================
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process store with per-entry TTL and LRU eviction
+
+    Entries live in an OrderedDict kept in least-recently-used order, so
+    eviction at `max_size` pops from the front in O(1). For expiry, entries
+    are also grouped into one OrderedDict per distinct TTL value; within a
+    group insertion order equals expiry order, so the sweeper only ever looks
+    at the front of each group. Every `set` sweeps up to `sweep_budget`
+    expired entries, making expiry amortized O(1) without a background scan.
+    """
+
+    def __init__(self, max_size: int = 100000, default_ttl: Optional[float] = None, sweep_budget: int = 8):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.sweep_budget = sweep_budget
+        # key -> (value, expires_at, ttl)
+        self._data: "OrderedDict[str, Tuple[Dict[str, Any], Optional[float], Optional[float]]]" = OrderedDict()
+        # ttl -> OrderedDict[key, expires_at], ordered by expiry
+        self._expiry: Dict[float, "OrderedDict[str, float]"] = {}
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _unlink(self, key: str, ttl: Optional[float]) -> None:
+        if ttl is not None:
+            bucket = self._expiry.get(ttl)
+            if bucket is not None:
+                bucket.pop(key, None)
+
+    def _remove(self, key: str) -> Optional[Tuple[Dict[str, Any], Optional[float], Optional[float]]]:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._unlink(key, entry[2])
+        return entry
+
+    def _live(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at <= time.time():
+            self._remove(key)
+            self.expired += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def _sweep(self, budget: Optional[int]) -> int:
+        now = time.time()
+        removed = 0
+        for bucket in self._expiry.values():
+            while bucket and (budget is None or removed < budget):
+                key, expires_at = next(iter(bucket.items()))
+                if expires_at > now:
+                    break
+                bucket.popitem(last=False)
+                self._data.pop(key, None)
+                removed += 1
+        self.expired += removed
+        return removed
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._live(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        values = []
+        for key in keys:
+            value = self._live(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            values.append(value)
+        return values
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        ttl = ttl if ttl is not None else self.default_ttl
+        self._insert(key, value, time.time() + ttl if ttl is not None else None, ttl)
+
+    def load(self, key: str, value: Any, expires_at: Optional[float]) -> None:
+        """
+        Insert an entry with an absolute expiry, e.g. one restored from disk
+
+        The entry joins the default-TTL expiry group (capped at now + default
+        TTL) rather than a group of its own, so load entries in ascending
+        expiry order to keep that group ordered.
+        """
+        ttl = self.default_ttl if expires_at is not None else None
+        if expires_at is not None and ttl is not None:
+            expires_at = min(expires_at, time.time() + ttl)
+        self._insert(key, value, expires_at, ttl)
+
+    def _insert(self, key: str, value: Any, expires_at: Optional[float], ttl: Optional[float]) -> None:
+        old = self._data.get(key)
+        if old is not None and old[2] != ttl:
+            self._unlink(key, old[2])
+
+        self._data[key] = (value, expires_at, ttl)
+        self._data.move_to_end(key)
+        if ttl is not None:
+            bucket = self._expiry.setdefault(ttl, OrderedDict())
+            bucket[key] = expires_at
+            bucket.move_to_end(key)
+
+        self._sweep(self.sweep_budget)
+        while len(self._data) > self.max_size:
+            evicted_key, entry = self._data.popitem(last=False)
+            self._unlink(evicted_key, entry[2])
+            self.evicted += 1
+
+    async def add(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> bool:
+        entry = self._data.get(key)
+        if entry is not None and (entry[1] is None or entry[1] > time.time()):
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def pop(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._live(key)
+        if value is not None:
+            self._remove(key)
+        return value
+
+    async def delete(self, key: str) -> bool:
+        return self._remove(key) is not None
+
+    async def size(self) -> int:
+        return len(self._data)
+
+    async def sweep(self) -> int:
+        return self._sweep(None)
+
+    async def scan(self, chunk_size: int = 500) -> AsyncIterator[List[Tuple[str, Any]]]:
+        # Only the keys are copied up front; values are read chunk by chunk,
+        # without touching LRU order or the hit counters
+        keys = list(self._data)
+        for start in range(0, len(keys), chunk_size):
+            now = time.time()
+            chunk = []
+            for key in keys[start:start + chunk_size]:
+                entry = self._data.get(key)
+                if entry is not None and (entry[1] is None or entry[1] > now):
+                    chunk.append((key, entry[0]))
+            if chunk:
+                yield chunk
+
+    def entries(self) -> List[Tuple[str, Any, Optional[float]]]:
+        """Point-in-time list of live (key, value, expires_at) entries"""
+        now = time.time()
+        return [
+            (key, value, expires_at)
+            for key, (value, expires_at, _) in list(self._data.items())
+            if expires_at is None or expires_at > now
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+# ============================================================================
+# Redis Backend
+# ============================================================================
+
+class RedisError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Store backed by any server speaking the Redis protocol (RESP2)
+
+    Talks RESP directly over an asyncio stream, so no client library is
+    needed. Values are stored as JSON strings under `prefix + key` and TTLs
+    map to SET ... PX. Commands are serialized over one connection, which
+    is reopened on the next call if it drops.
+    """
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        prefix: str = "",
+        default_ttl: Optional[float] = None,
+        record_type: Optional[type] = None,
+    ):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = urllib.parse.unquote(parsed.password) if parsed.password else None
+        self.username = urllib.parse.unquote(parsed.username) if parsed.username else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+        self.record_type = record_type
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    # ------------------------------------------------------------------
+    # RESP protocol
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _encode(*args: Any) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RedisError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(payload)
+            if count < 0:
+                return None
+            return [await self._read_reply() for _ in range(count)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            if self.password:
+                auth = ("AUTH", self.username, self.password) if self.username else ("AUTH", self.password)
+                self._writer.write(self._encode(*auth))
+                await self._read_reply()
+            if self.db:
+                self._writer.write(self._encode("SELECT", self.db))
+                await self._read_reply()
+        except BaseException:
+            # Never reuse a connection that is not authenticated and selected
+            self._drop_connection()
+            raise
+
+    async def execute(self, *args: Any) -> Any:
+        async with self._lock:
+            if self._writer is None:
+                await self._connect()
+            try:
+                self._writer.write(self._encode(*args))
+                await self._writer.drain()
+                return await self._read_reply()
+            except RedisError:
+                # An error reply was read in full; the connection is in sync
+                raise
+            except BaseException:
+                # Cancelled or failed mid-command: the reply may still be
+                # unread, and the next caller must not receive it
+                self._drop_connection()
+                raise
+
+    def _drop_connection(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _close_connection(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+
+    # ------------------------------------------------------------------
+    # SessionStore interface
+    # ------------------------------------------------------------------
+
+    def _decode(self, raw: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        return self.record_type.from_dict(value) if self.record_type else value
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._decode(await self.execute("GET", self.prefix + key))
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        if not keys:
+            return []
+        raw = await self.execute("MGET", *[self.prefix + key for key in keys])
+        return [self._decode(value) for value in raw]
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        await self._set(key, value, ttl)
+
+    async def add(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> bool:
+        return await self._set(key, value, ttl, "NX") is not None
+
+    async def _set(self, key: str, value: Dict[str, Any], ttl: Optional[float], *options: str) -> Any:
+        ttl = ttl if ttl is not None else self.default_ttl
+        payload = json.dumps(value.to_dict() if self.record_type else value, separators=(",", ":"))
+        if ttl is not None:
+            options += ("PX", int(ttl * 1000))
+        return await self.execute("SET", self.prefix + key, payload, *options)
+
+    async def pop(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._decode(await self.execute("GETDEL", self.prefix + key))
+
+    async def delete(self, key: str) -> bool:
+        return bool(await self.execute("DEL", self.prefix + key))
+
+    async def size(self) -> int:
+        # Keys are namespaced by prefix, so count them with an incremental SCAN
+        count, cursor = 0, b"0"
+        while True:
+            cursor, keys = await self.execute("SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", 1000)
+            count += len(keys)
+            if cursor in (b"0", "0"):
+                return count
+
+    async def scan(self, chunk_size: int = 500) -> AsyncIterator[List[Tuple[str, Any]]]:
+        cursor = b"0"
+        while True:
+            cursor, keys = await self.execute("SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", chunk_size)
+            if keys:
+                raw = await self.execute("MGET", *keys)
+                chunk = [
+                    (key.decode()[len(self.prefix):], self._decode(value))
+                    for key, value in zip(keys, raw)
+                    if value is not None
+                ]
+                if chunk:
+                    yield chunk
+            if cursor in (b"0", "0"):
+                return
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._close_connection()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis",
+            "host": self.host,
+            "port": self.port,
+            "db": self.db,
+            "prefix": self.prefix,
+        }
+
+
+# ============================================================================
+# Factory
+# ============================================================================
+
+def create_session_store(
+    prefix: str,
+    default_ttl: Optional[float] = None,
+    max_size: int = 100000,
+    record_type: Optional[type] = None,
+    backend: str = "memory",
+    redis_url: str = "redis://localhost:6379/0",
+    sqlite_path: str = "data/sessions.db",
+    cache_size: int = 100000,
+) -> SessionStore:
+    """Build the store selected by SESSION_STORE_BACKEND (memory, redis or sqlite)"""
+    backend = backend.lower()
+    if backend == "memory":
+        return MemorySessionStore(max_size=max_size, default_ttl=default_ttl)
+    if backend == "redis":
+        return RedisSessionStore(
+            url=redis_url,
+            prefix=prefix,
+            default_ttl=default_ttl,
+            record_type=record_type,
+        )
+    if backend == "sqlite":
+        from sqlite_store import SqliteSessionStore
+        return SqliteSessionStore(
+            sqlite_path,
+            prefix=prefix,
+            default_ttl=default_ttl,
+            record_type=record_type,
+            cache_size=cache_size,
+        )
+    raise ValueError(f"Unknown SESSION_STORE_BACKEND: {backend}")
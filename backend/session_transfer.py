@@ -0,0 +1,237 @@
+"""
+Session Transfer
+Bulk movement of stored sessions: re-hydration of the session store from the
+google_oauth_tokens table in Supabase, and NDJSON chunking for import. Every
+stage works on bounded chunks, so memory does not grow with the number of
+sessions moved
+"""
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import Executor
+import asyncio
+import random
+import time
+import httpx
+from session_record import SessionRecord
+
+# Columns read back from the rows store_tokens_in_supabase writes
+TOKEN_COLUMNS = ("google_user_id", "email", "name", "picture", "access_token", "refresh_token", "updated_at")
+
+
+class SupabaseReadError(Exception):
+    """A page could not be read from Supabase"""
+
+
+class SupabaseTokenReader:
+    """
+    Keyset pagination over one Supabase (PostgREST) table
+
+    Pages are ordered by `key_column` and each request asks for the rows
+    after the last key seen (`<key>=gt.<last>`), so every page is an index
+    range scan however deep into the table it is, and rows inserted while
+    reading do not shift later pages as they would with offsets. Failed
+    reads are retried with jittered exponential backoff, except on a 4xx.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        client: Callable[[], httpx.AsyncClient],
+        table: str = "google_oauth_tokens",
+        key_column: str = "google_user_id",
+        columns: Sequence[str] = TOKEN_COLUMNS,
+        page_size: int = 1000,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+    ):
+        self.url = f"{base_url.rstrip('/')}/rest/v1/{table}"
+        self.headers = {
+            "apikey": api_key,
+            "Authorization": f"Bearer {api_key}",
+            "Accept": "application/json",
+        }
+        self._client = client
+        self.key_column = key_column
+        self.select = ",".join(columns)
+        self.page_size = page_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.pages_read = 0
+        self.rows_read = 0
+        self.retries = 0
+
+    async def pages(self, after: str = "") -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield the table's rows page by page, starting after key `after`"""
+        while True:
+            params = {"select": self.select, "order": f"{self.key_column}.asc", "limit": str(self.page_size)}
+            if after:
+                params[self.key_column] = f"gt.{after}"
+            rows = await self._get(params)
+            if not rows:
+                return
+            self.pages_read += 1
+            self.rows_read += len(rows)
+            yield rows
+            if len(rows) < self.page_size:
+                return
+            after = rows[-1][self.key_column]
+
+    async def _get(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._client().get(self.url, params=params, headers=self.headers)
+                if response.status_code < 300:
+                    return response.json()
+                if response.status_code < 500 and response.status_code != 429:
+                    raise SupabaseReadError(f"Supabase rejected page read: HTTP {response.status_code} {response.text}")
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = str(e)
+
+            if attempt < self.max_retries:
+                self.retries += 1
+                delay = self.retry_backoff * (2 ** attempt)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+        raise SupabaseReadError(f"Supabase page read failed after retries: {error}")
+
+
+class SessionRehydrator:
+    """
+    Rebuilds the session store from Supabase token rows
+
+    One task reads keyset pages while `concurrency` workers turn each page
+    into SessionRecords with `build` (on `executor`, where the tokens are
+    encrypted; None skips a row) and write them with `save`, which returns
+    how many it wrote. At most `concurrency` pages wait in the queue, so
+    memory holds a few pages whatever the table size, and reading the next
+    page overlaps converting and writing the previous ones.
+
+    Calling `run` while a run is in progress joins it.
+    """
+
+    def __init__(
+        self,
+        reader: SupabaseTokenReader,
+        build: Callable[[Dict[str, Any]], Optional[SessionRecord]],
+        save: Callable[[List[SessionRecord]], Awaitable[int]],
+        executor: Optional[Executor] = None,
+        concurrency: int = 4,
+    ):
+        self.reader = reader
+        self.build = build
+        self.save = save
+        self.executor = executor
+        self.concurrency = max(1, concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.rows = 0
+        self.restored = 0
+        self.failed = 0
+        self.last_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    async def run(self) -> Dict[str, Any]:
+        """Re-hydrate every row; returns the run's counts"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return await asyncio.shield(self._task)
+
+    async def _run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        counts = (self.rows, self.restored, self.failed)
+        queue: "asyncio.Queue[Optional[List[Dict[str, Any]]]]" = asyncio.Queue(maxsize=self.concurrency)
+        # The first failure (reader or worker) cancels the rest
+        tasks = [asyncio.create_task(self._read(queue))]
+        tasks += [asyncio.create_task(self._work(queue)) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException as e:
+            for task in tasks:
+                task.cancel()
+            self.last_error = str(e) or type(e).__name__
+            raise
+        finally:
+            self.runs += 1
+            self.last_seconds = time.perf_counter() - started
+
+        self.last_error = None
+        rows, restored, failed = self.rows - counts[0], self.restored - counts[1], self.failed - counts[2]
+        print(f"✅ Re-hydrated {restored} of {rows} Supabase sessions in {self.last_seconds * 1000:.0f}ms")
+        return {
+            "rows": rows,
+            "restored": restored,
+            "skipped": rows - restored - failed,
+            "failed": failed,
+            "seconds": round(self.last_seconds, 3),
+        }
+
+    async def _read(self, queue: "asyncio.Queue[Optional[List[Dict[str, Any]]]]") -> None:
+        async for page in self.reader.pages():
+            await queue.put(page)
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    async def _work(self, queue: "asyncio.Queue[Optional[List[Dict[str, Any]]]]") -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            page = await queue.get()
+            if page is None:
+                return
+            records, failed = await loop.run_in_executor(self.executor, self._build_page, page)
+            self.rows += len(page)
+            self.failed += failed
+            if records:
+                self.restored += await self.save(records)
+
+    def _build_page(self, page: List[Dict[str, Any]]) -> Tuple[List[SessionRecord], int]:
+        records, failed = [], 0
+        for row in page:
+            try:
+                record = self.build(row)
+            except Exception:
+                failed += 1
+                continue
+            if record is not None:
+                records.append(record)
+        return records, failed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "runs": self.runs,
+            "rows": self.rows,
+            "restored": self.restored,
+            "failed": self.failed,
+            "pages": self.reader.pages_read,
+            "retries": self.reader.retries,
+            "last_ms": round(self.last_seconds * 1000, 1) if self.last_seconds is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+async def ndjson_chunks(
+    stream: AsyncIterator[bytes],
+    chunk_size: int,
+    max_line_bytes: int = 1024 * 1024,
+) -> AsyncIterator[List[bytes]]:
+    """
+    Group the non-empty lines of an NDJSON byte stream into lists of up to
+    `chunk_size`; only the current partial line and chunk are held in memory
+    """
+    buffer = b""
+    chunk: List[bytes] = []
+    async for data in stream:
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        if len(buffer) > max_line_bytes:
+            raise ValueError(f"NDJSON line longer than {max_line_bytes} bytes")
+        for line in lines:
+            if line.strip():
+                chunk.append(line)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+    if buffer.strip():
+        chunk.append(buffer)
+    if chunk:
+        yield chunk
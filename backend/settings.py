@@ -0,0 +1,177 @@
+"""
+Backend Settings
+Typed configuration read from the environment (and .env), with the same
+variable names as before. Constructing Settings never fails on missing
+credentials; `check_required()` is called when the app starts instead, so
+the module can be imported (and apps built) without a full environment.
+"""
+from typing import Any, Dict, List
+import os
+from pydantic import field_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+
+# Settings without which the backend cannot serve requests
+REQUIRED = (
+    "encryption_key",
+    "supabase_url",
+    "supabase_anon_key",
+    "google_client_id",
+    "google_client_secret",
+    "google_redirect_uri",
+)
+
+
+class Settings(BaseSettings):
+    """All backend settings; field names are the environment variables, lower-cased"""
+
+    model_config = SettingsConfigDict(env_file=ENV_FILE, extra="ignore")
+
+    # Credentials (required, checked at startup)
+    encryption_key: str = ""
+    supabase_url: str = ""
+    supabase_anon_key: str = ""
+    google_client_id: str = ""
+    google_client_secret: str = ""
+    google_redirect_uri: str = ""
+
+    # Server
+    port: int = 8060
+    frontend_url: str = "https://ai-supply-guardian.zentraid.com"
+
+    # Token encryption
+    token_cipher: str = "aesgcm"
+    encryption_keys_previous: str = ""
+    crypto_workers: int = 4
+
+    # Google endpoints (overridable to point at local stand-ins, see benchmarks/)
+    google_auth_url: str = "https://accounts.google.com/o/oauth2/v2/auth"
+    google_token_url: str = "https://oauth2.googleapis.com/token"
+    google_userinfo_url: str = "https://www.googleapis.com/oauth2/v2/userinfo"
+    google_revoke_url: str = "https://oauth2.googleapis.com/revoke"
+    google_certs_url: str = "https://www.googleapis.com/oauth2/v3/certs"
+    id_token_verification: bool = True
+
+    # Login profiles added to or replacing the built-in "default" and "reauth"
+    # (JSON: {"name": {"scopes": [...], "prompt": "...", ...}}, see login_profiles.py)
+    login_profiles: Dict[str, Dict[str, Any]] = {}
+
+    # Shared upstream HTTP client
+    upstream_http2: bool = True
+    upstream_max_connections: int = 100
+    upstream_max_keepalive: int = 20
+    upstream_keepalive_expiry: float = 30.0
+    upstream_connect_timeout: float = 3.0
+    upstream_read_timeout: float = 10.0
+    upstream_write_timeout: float = 10.0
+    upstream_pool_timeout: float = 5.0
+
+    # Google call resilience
+    upstream_deadline_seconds: float = 8.0
+    upstream_attempt_timeout: float = 3.0
+    upstream_max_attempts: int = 3
+    upstream_retry_backoff_seconds: float = 0.1
+    upstream_retry_budget_ratio: float = 0.1
+    upstream_retry_budget_min_per_second: float = 1.0
+    upstream_breaker_failures: int = 5
+    upstream_breaker_reset_seconds: float = 30.0
+    upstream_max_concurrency: int = 64
+    upstream_queue_timeout_seconds: float = 1.0
+    userinfo_hedge_after_seconds: float = 0.0
+
+    # Admission control (a rate of 0 disables that limiter)
+    admission_enabled: bool = True
+    admission_max_keys: int = 100000
+    admission_ip_rate: float = 5.0
+    admission_ip_burst: float = 20.0
+    admission_user_rate: float = 10.0
+    admission_user_burst: float = 30.0
+    admission_refresh_token_rate: float = 0.1
+    admission_refresh_token_burst: float = 10.0
+
+    # Refresh coalescing and proactive refresh
+    refresh_coalesce_grace_seconds: float = 5.0
+    proactive_refresh_enabled: bool = True
+    proactive_refresh_margin_seconds: float = 300.0
+    proactive_refresh_jitter_seconds: float = 60.0
+    proactive_refresh_concurrency: int = 8
+    proactive_refresh_retry_seconds: float = 60.0
+
+    # Access token broker
+    token_broker_cache_size: int = 10000
+
+    # Session event streams (SSE)
+    session_events_queue_size: int = 16
+    session_events_max_subscribers: int = 10000
+    session_events_heartbeat_seconds: float = 15.0
+    session_events_max_stream_seconds: float = 300.0
+
+    # Generation-0 GC threshold set before a journal restore (0 keeps Python's default)
+    gc_gen0_threshold: int = 0
+
+    # Session and OAuth state storage
+    session_store_backend: str = "memory"
+    redis_url: str = "redis://localhost:6379/0"
+    session_sqlite_path: str = "data/sessions.db"
+    session_sqlite_cache_size: int = 100000
+    session_ttl_seconds: float = 30 * 24 * 3600
+    session_store_max_size: int = 100000
+    session_persistence_dir: str = ""
+    session_snapshot_interval_seconds: float = 300.0
+    session_journal_max_bytes: int = 64 * 1024 * 1024
+    oauth_state_ttl_seconds: float = 600.0
+    oauth_state_max_size: int = 10000
+    oauth_state_mode: str = "store"
+    oauth_pkce_enabled: bool = False
+    oauth_state_secret: str = ""
+
+    # Re-hydration of user sessions from Supabase (POST /api/admin/sessions/rehydrate)
+    session_rehydrate_on_startup: bool = False
+    session_rehydrate_page_size: int = 1000
+    session_rehydrate_concurrency: int = 4
+
+    # Bearer token for /api/admin/... (the admin endpoints are disabled when empty)
+    admin_token: str = ""
+
+    # Supabase write-behind
+    supabase_write_behind: bool = True
+    supabase_write_batch_size: int = 100
+    supabase_write_flush_interval: float = 0.5
+    supabase_write_max_pending: int = 10000
+
+    # Token revocation on logout
+    revocation_log_path: str = ""
+    revocation_concurrency: int = 4
+    revocation_max_retries: int = 5
+    revocation_retry_backoff_seconds: float = 1.0
+    revocation_drain_timeout_seconds: float = 10.0
+
+    # Batch endpoints
+    batch_max_users: int = 10000
+    batch_chunk_size: int = 500
+
+    @field_validator("token_cipher", "session_store_backend", "oauth_state_mode")
+    @classmethod
+    def _lower(cls, value: str) -> str:
+        return value.lower()
+
+    def previous_encryption_keys(self) -> List[str]:
+        """Retired encryption keys, newest first (ENCRYPTION_KEYS_PREVIOUS, comma-separated)"""
+        return [key.strip() for key in self.encryption_keys_previous.split(",") if key.strip()]
+
+    def missing(self) -> List[str]:
+        """Environment variables that are required but not set"""
+        return [name.upper() for name in REQUIRED if not getattr(self, name)]
+
+    def check_required(self) -> None:
+        """Raise ValueError naming every missing required setting"""
+        missing = self.missing()
+        if missing:
+            raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
+
+    def check_combinations(self) -> None:
+        """Raise ValueError for settings that cannot be used together"""
+        if self.session_persistence_dir and self.session_store_backend != "memory":
+            raise ValueError("SESSION_PERSISTENCE_DIR requires SESSION_STORE_BACKEND=memory")
+
@@ -0,0 +1,83 @@
+"""
+Single-Flight Request Coalescing
+Concurrent callers for the same key share one in-flight upstream call, and
+successful results are kept for a short grace window
+"""
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
+import time
+
+
+def hash_key(value: str) -> str:
+    """Hash a secret (e.g. a refresh token) so it is never used as a raw key"""
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent async calls by key
+
+    The first caller for a key starts the work as a task; everyone arriving
+    while it runs awaits the same task. Successful results are cached for
+    `grace_seconds` so callers that arrive just after completion also share
+    them. Failures are never cached.
+    """
+
+    def __init__(self, grace_seconds: float = 5.0, max_cached: int = 10000):
+        self.grace_seconds = grace_seconds
+        self.max_cached = max_cached
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._results: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.executions = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+        self.failures = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        cached = self._results.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self.cache_hits += 1
+                return cached[1]
+            del self._results[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._complete(k, t))
+
+        # Shield so a disconnecting caller does not cancel the shared work
+        return await asyncio.shield(task)
+
+    def _complete(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.failures += 1
+            return
+        if self.grace_seconds > 0:
+            self._results[key] = (time.monotonic() + self.grace_seconds, task.result())
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_cached:
+                self._results.popitem(last=False)
+
+    def forget(self, key: str) -> None:
+        """Drop a cached result (e.g. after logout)"""
+        self._results.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "failures": self.failures,
+            "in_flight": len(self._inflight),
+            "cached": len(self._results),
+        }
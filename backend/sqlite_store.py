@@ -0,0 +1,404 @@
+"""
+SQLite Session Store
+Host-local shared backend for the session and OAuth2 state stores: one
+SQLite database in WAL mode shared by every worker process on the host,
+with a per-process read-through cache kept consistent through a change log
+"""
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import time
+from session_store import SessionStore
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS kv (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value BLOB NOT NULL,
+        expires_at REAL,
+        PRIMARY KEY (namespace, key)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS kv_expiry ON kv (expires_at) WHERE expires_at IS NOT NULL",
+    # One row per committed write, so other processes can drop exactly the
+    # keys that changed from their caches
+    """CREATE TABLE IF NOT EXISTS kv_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        writer TEXT NOT NULL,
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL
+    )""",
+)
+
+# Statements are constant strings, so sqlite3 prepares each once per
+# connection and reuses it from the statement cache
+SQL_GET = "SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)"
+SQL_PUT = "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)"
+# Insert unless a live row exists (an expired one not yet swept is replaced)
+SQL_ADD = (
+    "INSERT INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)"
+    " ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+    " WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ?"
+)
+SQL_POP = "DELETE FROM kv WHERE namespace = ? AND key = ? RETURNING value, expires_at"
+SQL_DELETE = "DELETE FROM kv WHERE namespace = ? AND key = ?"
+SQL_CHANGE = "INSERT INTO kv_changes (writer, namespace, key) VALUES (?, ?, ?)"
+SQL_CHANGES_SINCE = "SELECT seq, writer, namespace, key FROM kv_changes WHERE seq > ? ORDER BY seq"
+SQL_LAST_CHANGE = "SELECT COALESCE(MAX(seq), 0) FROM kv_changes"
+SQL_SCAN = (
+    "SELECT key, value FROM kv WHERE namespace = ? AND key > ? AND (expires_at IS NULL OR expires_at > ?)"
+    " ORDER BY key LIMIT ?"
+)
+SQL_SIZE = "SELECT COUNT(*) FROM kv WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)"
+SQL_SWEEP = "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?"
+SQL_PRUNE_CHANGES = "DELETE FROM kv_changes WHERE seq <= (SELECT MAX(seq) FROM kv_changes) - ?"
+
+OP_PUT = 1
+OP_POP = 2
+OP_DELETE = 3
+OP_SWEEP = 4
+OP_ADD = 5
+
+# Keys per SELECT ... IN (...) in get_many; below SQLite's variable limit
+MANY_CHUNK = 500
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, cached_statements=64)
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    Store shared by the worker processes of one host through SQLite (WAL)
+
+    Reads run on the event loop against a dedicated read connection: a
+    primary-key lookup in a page-cached WAL database takes microseconds,
+    less than handing it to a thread. Every statement is fully consumed so
+    no read transaction stays open.
+
+    Writes go to one writer thread and are group-committed: every write
+    queued while the previous transaction commits goes into the next one,
+    together with a change-log row per key. Callers wait for their commit,
+    so a session written by one worker is visible to the next request on
+    any other worker.
+
+    Decoded values are kept in a per-process read-through LRU cache of
+    `cache_size` entries. Before each read `PRAGMA data_version` (a few
+    microseconds) says whether any other connection has committed since
+    the last check; if so, the change log is read and only the keys other
+    writers touched are dropped. This process's own writes update the cache
+    directly, in commit order. If the log has been pruned past this process's position, the
+    whole cache is cleared.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        prefix: str = "",
+        default_ttl: Optional[float] = None,
+        record_type: Optional[type] = None,
+        cache_size: int = 100000,
+        sweep_interval: float = 60.0,
+        change_log_size: int = 100000,
+    ):
+        self.path = path
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+        self.record_type = record_type
+        self.cache_size = cache_size
+        self.sweep_interval = sweep_interval
+        self.change_log_size = change_log_size
+        # Identifies this store's change-log rows, which its cache already reflects
+        self._writer_id = secrets.token_hex(8)
+        self._reader: Optional[sqlite3.Connection] = None
+        self._writer: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # key -> (value, expires_at)
+        self._cache: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._data_version = None
+        self._last_seq = 0
+        # (op, key, payload, expires_at, value to cache, future), in call order
+        self._pending: List[Tuple[int, str, Optional[bytes], Optional[float], Any, asyncio.Future]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.cache_resets = 0
+        self.transactions = 0
+        self.writes = 0
+        self.expired = 0
+
+    # ------------------------------------------------------------------
+    # Connections
+    # ------------------------------------------------------------------
+
+    def _open(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        writer = _connect(self.path)
+        writer.execute("PRAGMA journal_mode = WAL")
+        with writer:
+            for statement in SCHEMA:
+                writer.execute(statement)
+        self._writer = writer
+        self._reader = _connect(self.path)
+        self._data_version = self._reader.execute("PRAGMA data_version").fetchall()[0][0]
+        self._last_seq = self._reader.execute(SQL_LAST_CHANGE).fetchall()[0][0]
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-store")
+
+    def _sync(self) -> None:
+        """Drop cached keys that other connections changed since the last read"""
+        if self._reader is None:
+            self._open()
+        version = self._reader.execute("PRAGMA data_version").fetchall()[0][0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+        rows = self._reader.execute(SQL_CHANGES_SINCE, (self._last_seq,)).fetchall()
+        if not rows:
+            return
+        if rows[0][0] > self._last_seq + 1 and self._cache:
+            # Rows we never saw were pruned (or rolled back): start over
+            self._cache.clear()
+            self.cache_resets += 1
+        else:
+            for _, writer, namespace, key in rows:
+                if writer != self._writer_id and namespace == self.prefix:
+                    if self._cache.pop(key, None) is not None:
+                        self.invalidations += 1
+        self._last_seq = rows[-1][0]
+
+    # ------------------------------------------------------------------
+    # Cache and encoding
+    # ------------------------------------------------------------------
+
+    def _decode(self, raw: bytes) -> Any:
+        value = json.loads(raw)
+        return self.record_type.from_dict(value) if self.record_type else value
+
+    def _encode(self, value: Any) -> bytes:
+        return json.dumps(value.to_dict() if self.record_type else value, separators=(",", ":")).encode()
+
+    def _remember(self, key: str, value: Any, expires_at: Optional[float]) -> None:
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = (value, expires_at)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _cached(self, key: str, now: float) -> Tuple[bool, Any]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return False, None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._cache[key]
+            return True, None
+        self._cache.move_to_end(key)
+        return True, value
+
+    # ------------------------------------------------------------------
+    # Writer
+    # ------------------------------------------------------------------
+
+    async def _write(
+        self,
+        op: int,
+        key: str,
+        payload: Optional[bytes] = None,
+        expires_at: Optional[float] = None,
+        value: Any = None,
+    ):
+        if self._writer is None:
+            self._open()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((op, key, payload, expires_at, value, future))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush())
+        return await future
+
+    async def _flush(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            batch, self._pending = self._pending, []
+            sweep = time.monotonic() - self._last_sweep >= self.sweep_interval or any(
+                op == OP_SWEEP for op, *_ in batch
+            )
+            if sweep:
+                self._last_sweep = time.monotonic()
+            try:
+                results, expired = await loop.run_in_executor(self._executor, self._commit, batch, sweep)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.transactions += 1
+            self.writes += len(batch)
+            self.expired += expired
+            # Cache updates follow the batch order, before any caller resumes,
+            # so a set and a pop of one key in the same batch end up uncached
+            for (op, key, _, expires_at, value, future), result in zip(batch, results):
+                if op == OP_PUT or (op == OP_ADD and result):
+                    self._remember(key, value, expires_at)
+                elif op in (OP_POP, OP_DELETE, OP_ADD):
+                    self._cache.pop(key, None)
+                if not future.done():
+                    future.set_result(result)
+
+    def _commit(self, batch, sweep: bool) -> Tuple[List[Any], int]:
+        """Apply one batch in a single transaction (writer thread)"""
+        conn = self._writer
+        results: List[Any] = []
+        expired = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for op, key, payload, expires_at, *_ in batch:
+                if op == OP_PUT:
+                    conn.execute(SQL_PUT, (self.prefix, key, payload, expires_at))
+                    results.append(None)
+                elif op == OP_ADD:
+                    results.append(conn.execute(SQL_ADD, (self.prefix, key, payload, expires_at, time.time())).rowcount > 0)
+                elif op == OP_POP:
+                    rows = conn.execute(SQL_POP, (self.prefix, key)).fetchall()
+                    live = rows and (rows[0][1] is None or rows[0][1] > time.time())
+                    results.append(rows[0][0] if live else None)
+                elif op == OP_DELETE:
+                    results.append(conn.execute(SQL_DELETE, (self.prefix, key)).rowcount > 0)
+                else:
+                    results.append(None)
+            conn.executemany(
+                SQL_CHANGE,
+                [(self._writer_id, self.prefix, key) for op, key, *_ in batch if op != OP_SWEEP]
+            )
+            if sweep:
+                expired = conn.execute(SQL_SWEEP, (time.time(),)).rowcount
+                conn.execute(SQL_PRUNE_CHANGES, (self.change_log_size,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return results, expired
+
+    # ------------------------------------------------------------------
+    # SessionStore interface
+    # ------------------------------------------------------------------
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        self._sync()
+        now = time.time()
+        found, value = self._cached(key, now)
+        if found:
+            self.hits += 1
+            return value
+        self.misses += 1
+        rows = self._reader.execute(SQL_GET, (self.prefix, key, now)).fetchall()
+        if not rows:
+            return None
+        value = self._decode(rows[0][0])
+        self._remember(key, value, rows[0][1])
+        return value
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        self._sync()
+        now = time.time()
+        results: Dict[str, Any] = {}
+        missing = []
+        for key in keys:
+            found, value = self._cached(key, now)
+            if found:
+                self.hits += 1
+                results[key] = value
+            else:
+                missing.append(key)
+        self.misses += len(missing)
+        for start in range(0, len(missing), MANY_CHUNK):
+            chunk = missing[start:start + MANY_CHUNK]
+            rows = self._reader.execute(
+                f"SELECT key, value, expires_at FROM kv WHERE namespace = ? AND key IN ({','.join('?' * len(chunk))})"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (self.prefix, *chunk, now),
+            ).fetchall()
+            for key, raw, expires_at in rows:
+                value = results[key] = self._decode(raw)
+                self._remember(key, value, expires_at)
+        return [results.get(key) for key in keys]
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        await self._write(OP_PUT, key, self._encode(value), expires_at, value)
+
+    async def add(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> bool:
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        return await self._write(OP_ADD, key, self._encode(value), expires_at, value)
+
+    async def pop(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self._write(OP_POP, key)
+        return self._decode(raw) if raw is not None else None
+
+    async def delete(self, key: str) -> bool:
+        return await self._write(OP_DELETE, key)
+
+    async def size(self) -> int:
+        if self._reader is None:
+            self._open()
+        return self._reader.execute(SQL_SIZE, (self.prefix, time.time())).fetchall()[0][0]
+
+    async def scan(self, chunk_size: int = 500) -> AsyncIterator[List[Tuple[str, Any]]]:
+        # Keyset pages in key order; the cache is neither read nor filled
+        if self._reader is None:
+            self._open()
+        after = ""
+        while True:
+            rows = self._reader.execute(SQL_SCAN, (self.prefix, after, time.time(), chunk_size)).fetchall()
+            if not rows:
+                return
+            yield [(key, self._decode(raw)) for key, raw in rows]
+            if len(rows) < chunk_size:
+                return
+            after = rows[-1][0]
+
+    async def sweep(self) -> int:
+        # Expired rows are also swept with a write batch every `sweep_interval` seconds
+        expired_before = self.expired
+        await self._write(OP_SWEEP, "")
+        return self.expired - expired_before
+
+    async def close(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            await self._flusher
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for conn in (self._reader, self._writer):
+            if conn is not None:
+                conn.close()
+        self._reader = self._writer = None
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "prefix": self.prefix,
+            "cached": len(self._cache),
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "invalidations": self.invalidations,
+            "cache_resets": self.cache_resets,
+            "transactions": self.transactions,
+            "writes": self.writes,
+            "expired": self.expired,
+        }
@@ -0,0 +1,180 @@
+"""
+Write-Behind Supabase Persistence
+Queues token upserts in memory, merges repeated writes for the same row and
+flushes them as bulk PostgREST upserts from a background task, so request
+handlers never wait on Supabase
+"""
+from typing import Any, Callable, Dict, List, Optional
+from collections import OrderedDict
+import asyncio
+import random
+import httpx
+
+
+class SupabaseWriteBehind:
+    """
+    Batched, non-blocking upserts into one Supabase (PostgREST) table
+
+    Rows are keyed by `conflict_column`; a newer write for a key that is still
+    queued is merged into the pending row. A flush is triggered when
+    `max_batch` rows are queued or `flush_interval` seconds have passed.
+    When `max_pending` rows are waiting, `enqueue` blocks until the flusher
+    catches up. Failed batches are retried with jittered exponential backoff
+    and dropped (and counted) after `max_retries` attempts or on a 4xx.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        client: Callable[[], httpx.AsyncClient],
+        table: str = "google_oauth_tokens",
+        conflict_column: str = "google_user_id",
+        max_batch: int = 100,
+        flush_interval: float = 0.5,
+        max_pending: int = 10000,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+    ):
+        self.url = f"{base_url.rstrip('/')}/rest/v1/{table}"
+        self.headers = {
+            "apikey": api_key,
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "Prefer": "resolution=merge-duplicates,return=minimal",
+        }
+        self._client = client
+        self.conflict_column = conflict_column
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.enqueued = 0
+        self.merged = 0
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+
+    async def enqueue(self, row: Dict[str, Any]) -> None:
+        """Queue a row for upsert, merging it with any pending write for the same key"""
+        if self._task is None:
+            await self.start()
+        key = row[self.conflict_column]
+        if key not in self._pending and len(self._pending) >= self.max_pending:
+            async with self._space:
+                await self._space.wait_for(lambda: len(self._pending) < self.max_pending)
+
+        self.enqueued += 1
+        if key in self._pending:
+            self.merged += 1
+            self._pending[key].update(row)
+        else:
+            self._pending[key] = dict(row)
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the background flusher and write everything still queued"""
+        if self._task is not None:
+            # Let an in-progress flush finish instead of cancelling it mid-batch
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._closing = False
+        while self._pending:
+            await self.flush()
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._pending and not self._closing:
+                await self.flush()
+                if len(self._pending) < self.max_batch:
+                    break
+
+    # ------------------------------------------------------------------
+    # Flushing
+    # ------------------------------------------------------------------
+
+    async def flush(self) -> int:
+        """Write one batch of up to `max_batch` queued rows; returns rows written"""
+        batch: List[Dict[str, Any]] = []
+        while self._pending and len(batch) < self.max_batch:
+            batch.append(self._pending.popitem(last=False)[1])
+        if not batch:
+            return 0
+        async with self._space:
+            self._space.notify_all()
+
+        # PostgREST bulk inserts require every object to have the same keys
+        groups: Dict[frozenset, List[Dict[str, Any]]] = {}
+        for row in batch:
+            groups.setdefault(frozenset(row), []).append(row)
+
+        written = 0
+        for rows in groups.values():
+            if await self._post(rows):
+                written += len(rows)
+        return written
+
+    async def _post(self, rows: List[Dict[str, Any]]) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._client().post(
+                    self.url,
+                    json=rows,
+                    headers=self.headers,
+                    params={"on_conflict": self.conflict_column},
+                )
+                if response.status_code < 300:
+                    self.batches += 1
+                    self.written += len(rows)
+                    return True
+                if response.status_code < 500 and response.status_code != 429:
+                    print(f"❌ Supabase rejected batch of {len(rows)}: {response.text}")
+                    break
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = str(e)
+
+            if attempt < self.max_retries:
+                self.retries += 1
+                delay = self.retry_backoff * (2 ** attempt)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+        else:
+            print(f"❌ Supabase batch of {len(rows)} failed after retries: {error}")
+
+        self.dropped += len(rows)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "pending": len(self._pending),
+            "enqueued": self.enqueued,
+            "merged": self.merged,
+            "written": self.written,
+            "batches": self.batches,
+            "retries": self.retries,
+            "dropped": self.dropped,
+        }
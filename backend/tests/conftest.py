@@ -0,0 +1,31 @@
+import os
+import sys
+import time
+from typing import Optional
+
+import pytest
+
+# Backend modules are imported as top-level modules, as auth_backend does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_record import SCOPE_REGISTRY, SessionRecord  # noqa: E402
+
+
+@pytest.fixture
+def make_record():
+    """Factory for SessionRecords with opaque token bytes"""
+    def make(user_id: str, expires_in: int = 3599, refresh_token: Optional[bytes] = b"refresh", updated_at: Optional[int] = None) -> SessionRecord:
+        now = int(time.time())
+        return SessionRecord(
+            user_id=user_id,
+            email=f"{user_id}@example.com",
+            name=user_id,
+            picture=None,
+            access_token=b"access-" + user_id.encode(),
+            refresh_token=refresh_token,
+            expires_at=now + expires_in,
+            scope_mask=SCOPE_REGISTRY.mask(["openid", "email"]),
+            created_at=now,
+            updated_at=now if updated_at is None else updated_at,
+        )
+    return make
@@ -0,0 +1,87 @@
+"""
+Admission control: token buckets, and the middleware answering 429 with
+Retry-After per client, user and refresh token on the backend's own rules
+"""
+import asyncio
+import httpx
+from fastapi import FastAPI, Request
+from admission import IP, REFRESH_TOKEN, USER, AdmissionMiddleware, TokenBucketTable
+from auth_backend import ADMISSION_RULES
+
+
+def test_bucket_allows_a_burst_then_refills(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("admission.time.monotonic", lambda: now[0])
+    table = TokenBucketTable(rate=2, burst=3, max_keys=2)
+    assert [table.acquire("a") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert table.acquire("a") == 0.5
+    now[0] += 0.5
+    assert table.acquire("a") == 0.0
+
+    # The least recently seen key is evicted and returns with a full bucket
+    table.acquire("b")
+    table.acquire("c")
+    assert len(table) == 2 and table.evictions == 1
+    assert [table.acquire("a") for _ in range(3)] == [0.0, 0.0, 0.0]
+
+
+def run(test, **limiters):
+    app = FastAPI()
+
+    @app.api_route("/{path:path}", methods=["GET", "POST"])
+    async def echo(path: str, request: Request):
+        return {"path": path, "body": (await request.body()).decode()}
+
+    admitted = AdmissionMiddleware(app, {kind: TokenBucketTable(**options) for kind, options in limiters.items()}, ADMISSION_RULES)
+
+    async def main():
+        clients = {}
+        for address in ("10.0.0.1", "10.0.0.2"):
+            transport = httpx.ASGITransport(app=admitted, client=(address, 1234))
+            clients[address] = httpx.AsyncClient(transport=transport, base_url="http://backend")
+        try:
+            await test(clients["10.0.0.1"], clients["10.0.0.2"])
+        finally:
+            for client in clients.values():
+                await client.aclose()
+    asyncio.run(main())
+
+
+def test_per_ip_limit_with_retry_after():
+    async def test(client, other_client):
+        for _ in range(2):
+            assert (await client.get("/api/auth/google/login")).status_code == 200
+        rejected = await client.get("/api/auth/google/login")
+        assert rejected.status_code == 429 and rejected.headers["retry-after"] == "10"
+        assert rejected.json() == {"detail": "Too many requests"}
+
+        assert (await other_client.get("/api/auth/google/login")).status_code == 200
+        # Routes without a rule are never limited
+        assert (await client.get("/api/health")).status_code == 200
+    run(test, **{IP: {"rate": 0.1, "burst": 2}})
+
+
+def test_users_are_keyed_by_path_and_batch_by_client():
+    async def test(client, other_client):
+        assert (await client.get("/api/auth/user/alice")).status_code == 200
+        assert (await client.get("/api/auth/session/alice")).status_code == 429
+        assert (await client.get("/api/auth/token/bob")).status_code == 200
+        assert (await client.post("/api/auth/logout", params={"user_id": "bob"})).status_code == 429
+
+        # The batch route is an exact rule: limited per client, not as user "batch"
+        assert (await client.post("/api/auth/user/batch")).status_code == 200
+        assert (await client.post("/api/auth/user/batch")).status_code == 429
+        assert (await other_client.post("/api/auth/user/batch")).status_code == 200
+    run(test, **{IP: {"rate": 0.1, "burst": 1}, USER: {"rate": 0.1, "burst": 1}})
+
+
+def test_refresh_is_limited_per_token_and_the_body_still_reaches_the_app():
+    async def test(client, other_client):
+        response = await client.post("/api/auth/refresh", json={"refresh_token": "rt-1"})
+        assert response.status_code == 200 and "rt-1" in response.json()["body"]
+        # Another client cannot spend the same token's budget
+        assert (await other_client.post("/api/auth/refresh", json={"refresh_token": "rt-1"})).status_code == 429
+        assert (await other_client.post("/api/auth/refresh", json={"refresh_token": "rt-2"})).status_code == 200
+        # Bodies without a token skip that limiter
+        assert (await client.post("/api/auth/refresh", content=b"not json")).status_code == 200
+    run(test, **{REFRESH_TOKEN: {"rate": 0.1, "burst": 1}})
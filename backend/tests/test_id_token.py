@@ -0,0 +1,83 @@
+"""
+IdTokenVerifier against id_tokens and JWKS from the mock Google endpoints:
+claims, cached keys, rejected tokens and refetches for unknown key ids
+"""
+import asyncio
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+from benchmarks.mock_upstreams import create_mock_app, mock_transport
+from id_token import IdTokenError, IdTokenVerifier
+
+CLIENT_ID = "test-client.apps.googleusercontent.com"
+TOKEN_URL = "https://oauth2.googleapis.com/token"
+
+
+def run(test):
+    async def main():
+        app = create_mock_app(CLIENT_ID)
+        async with httpx.AsyncClient(transport=mock_transport(app)) as client:
+            async def exchange(code: str):
+                response = await client.post(TOKEN_URL, data={"grant_type": "authorization_code", "code": code})
+                return response.json()
+            await test(app, client, exchange)
+    asyncio.run(main())
+
+
+def test_tokens_verify_against_one_cached_jwks_fetch():
+    async def test(app, client, exchange):
+        verifier = IdTokenVerifier(CLIENT_ID, lambda: client)
+        tokens = [await exchange(f"code-{i}") for i in range(5)]
+        results = await asyncio.gather(*(
+            verifier.userinfo(token["id_token"], token["access_token"]) for token in tokens
+        ))
+        assert [info["id"] for info in results] == [token["access_token"].split("-")[1] for token in tokens]
+        assert all(info["email"].endswith("@bench.example.com") for info in results)
+        assert app.state.counters["certs"] == 1 and verifier.jwks_fetches == 1
+        # Cache-Control max-age from the certs endpoint sets the key lifetime
+        assert verifier.stats()["jwks_expires_in"] > 21000
+    run(test)
+
+
+def test_wrong_audience_access_token_or_signer_is_rejected():
+    async def test(app, client, exchange):
+        token = await exchange("code-1")
+        with pytest.raises(IdTokenError):
+            await IdTokenVerifier("another-client", lambda: client).verify(token["id_token"])
+
+        verifier = IdTokenVerifier(CLIENT_ID, lambda: client)
+        with pytest.raises(IdTokenError):
+            await verifier.verify(token["id_token"], access_token="at-someone-else")
+
+        # Same key id, different signing key
+        other = create_mock_app(CLIENT_ID)
+        async with httpx.AsyncClient(transport=mock_transport(other)) as other_client:
+            forged = (await other_client.post(TOKEN_URL, data={"grant_type": "authorization_code", "code": "x"})).json()
+        with pytest.raises(IdTokenError):
+            await verifier.verify(forged["id_token"])
+        assert verifier.failed == 2 and verifier.verified == 0
+    run(test)
+
+
+def test_unknown_key_id_refetches_at_most_once_per_interval():
+    async def test(app, client, exchange):
+        verifier = IdTokenVerifier(CLIENT_ID, lambda: client, min_refetch_interval=30)
+        token = await exchange("code-1")
+        await verifier.verify(token["id_token"], token["access_token"])
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        rotated = jwt.encode({"aud": CLIENT_ID}, key, algorithm="RS256", headers={"kid": "rotated-key"})
+        for _ in range(3):
+            with pytest.raises(IdTokenError, match="Unknown signing key"):
+                await verifier.verify(rotated)
+        assert app.state.counters["certs"] == 1
+
+        verifier.min_refetch_interval = 0
+        with pytest.raises(IdTokenError, match="Unknown signing key"):
+            await verifier.verify(rotated)
+        assert app.state.counters["certs"] == 2
+    run(test)
@@ -0,0 +1,71 @@
+"""
+Signed OAuth2 state tokens: signature, age, PKCE binding and replay
+protection (per process in the signer, across processes through a shared
+store's add)
+"""
+import asyncio
+import time
+import pytest
+from oauth_state import InvalidStateError, StateSigner, pkce_challenge
+from session_store import MemorySessionStore
+from sqlite_store import SqliteSessionStore
+
+
+def test_round_trip_and_pkce():
+    signer = StateSigner(b"secret")
+    token, verifier = signer.issue(prompt="consent", pkce=True)
+    state = signer.verify(token)
+    assert state["prompt"] == "consent" and state["nonce"]
+    assert state["code_verifier"] == verifier
+    assert len(pkce_challenge(verifier)) == 43
+
+    token, verifier = signer.issue()
+    assert verifier is None and "code_verifier" not in signer.verify(token)
+
+
+def test_rejects_forged_expired_and_replayed_states():
+    signer = StateSigner(b"secret", max_age_seconds=600)
+    token, _ = signer.issue()
+    payload, _, signature = token.partition(".")
+
+    with pytest.raises(InvalidStateError):
+        StateSigner(b"other").verify(token)
+    with pytest.raises(InvalidStateError):
+        signer.verify(payload[:-2] + "AA." + signature)
+    with pytest.raises(InvalidStateError):
+        signer.verify("garbage")
+
+    signer.verify(token)
+    with pytest.raises(InvalidStateError, match="already used"):
+        signer.verify(token)
+
+    old = StateSigner(b"secret", max_age_seconds=1)
+    token, _ = old.issue()
+    time.sleep(1.1)
+    with pytest.raises(InvalidStateError, match="expired"):
+        old.verify(token)
+
+
+def test_replay_on_another_worker_is_caught_by_the_shared_store(tmp_path):
+    async def consume(signer, store, token):
+        state = signer.verify(token)
+        return await store.add(f"used:{state['nonce']}", {"used_at": 0}, ttl=signer.replay_window)
+
+    async def main():
+        # Two workers: separate signers (separate in-process caches), one shared database
+        workers = [
+            (StateSigner(b"secret"), SqliteSessionStore(str(tmp_path / "sessions.db"), prefix="oauth_state:"))
+            for _ in range(2)
+        ]
+        token, _ = workers[0][0].issue()
+        assert await consume(*workers[0], token)
+        assert not await consume(*workers[1], token)
+        for _, store in workers:
+            await store.close()
+
+        # A per-process store cannot see the other worker's nonce
+        token, _ = workers[0][0].issue()
+        assert await consume(workers[0][0], MemorySessionStore(), token)
+        assert await consume(workers[1][0], MemorySessionStore(), token)
+
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+"""
+RedisSessionStore against a small fake RESP server: a command cancelled
+mid-reply, or a failed or cancelled AUTH, must not leave a connection that
+hands the next caller someone else's reply
+"""
+from typing import Dict, List, Set
+import asyncio
+import pytest
+from session_store import RedisError, RedisSessionStore
+
+
+class FakeRedis:
+    """Answers AUTH, SELECT, GET and SET (with NX; PX is ignored); replies for `slow` keys and to AUTH can be delayed"""
+
+    def __init__(self, password: str = "", delay: float = 0.2):
+        self.password = password
+        self.delay = delay
+        self.slow: Set[bytes] = set()
+        self.slow_auth = False
+        self.data: Dict[bytes, bytes] = {}
+        self.connections = 0
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    @staticmethod
+    async def read_command(reader: asyncio.StreamReader) -> List[bytes]:
+        count = int((await reader.readline())[1:-2])
+        args = []
+        for _ in range(count):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                name, *args = await self.read_command(reader)
+                name = name.upper()
+                if name == b"AUTH":
+                    if self.slow_auth:
+                        await asyncio.sleep(self.delay)
+                    reply = b"+OK\r\n" if args[-1].decode() == self.password else b"-WRONGPASS invalid password\r\n"
+                elif name == b"SELECT":
+                    reply = b"+OK\r\n"
+                elif name == b"SET":
+                    if b"NX" in args[2:] and args[0] in self.data:
+                        reply = b"$-1\r\n"
+                    else:
+                        self.data[args[0]] = args[1]
+                        reply = b"+OK\r\n"
+                elif name == b"GET":
+                    if args[0] in self.slow:
+                        await asyncio.sleep(self.delay)
+                    value = self.data.get(args[0])
+                    reply = b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+                else:
+                    reply = b"-ERR unknown command\r\n"
+                writer.write(reply)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def run(test):
+    async def main():
+        fake = FakeRedis(password="secret")
+        port = await fake.start()
+        store = RedisSessionStore(f"redis://:secret@127.0.0.1:{port}/1")
+        try:
+            await test(fake, store)
+        finally:
+            await store.close()
+            await fake.stop()
+    asyncio.run(main())
+
+
+def test_cancelled_command_does_not_leak_reply():
+    async def test(fake, store):
+        await store.set("alice", {"user": "alice"})
+        await store.set("bob", {"user": "bob"})
+        fake.slow.add(b"alice")
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(store.get("alice"), timeout=fake.delay / 4)
+        assert store._writer is None
+
+        # Let the delayed reply for alice arrive on the old socket
+        await asyncio.sleep(fake.delay * 1.5)
+        assert await store.get("bob") == {"user": "bob"}
+        assert fake.connections == 2
+
+    run(test)
+
+
+def test_failed_auth_is_not_reused():
+    async def test(fake, store):
+        fake.password = "rotated"
+        with pytest.raises(RedisError):
+            await store.get("alice")
+        assert store._reader is None and store._writer is None
+
+        fake.password = "secret"
+        await store.set("alice", {"user": "alice"})
+        assert await store.get("alice") == {"user": "alice"}
+
+    run(test)
+
+
+def test_cancelled_auth_is_not_reused():
+    async def test(fake, store):
+        fake.slow_auth = True
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(store.get("alice"), timeout=fake.delay / 4)
+        assert store._reader is None and store._writer is None
+
+        fake.slow_auth = False
+        await store.set("alice", {"user": "alice"})
+        assert await store.get("alice") == {"user": "alice"}
+
+    run(test)
+
+
+def test_add_only_stores_absent_keys():
+    async def test(fake, store):
+        assert await store.add("nonce", {"used_at": 1}, ttl=60)
+        assert not await store.add("nonce", {"used_at": 2}, ttl=60)
+        assert await store.get("nonce") == {"used_at": 1}
+
+    run(test)
@@ -0,0 +1,70 @@
+"""
+RefreshScheduler: due refreshes run under the concurrency cap, failures are
+retried, cancelled users are skipped, and overdue deadlines are spread out
+"""
+import asyncio
+import time
+from refresh_scheduler import RefreshScheduler
+
+
+class Recorder:
+    def __init__(self, fail_first: int = 0):
+        self.calls = []
+        self.running = 0
+        self.peak = 0
+        self.fail_first = fail_first
+
+    async def refresh(self, user_id: str) -> None:
+        self.calls.append(user_id)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            if len(self.calls) <= self.fail_first:
+                raise RuntimeError("upstream error")
+        finally:
+            self.running -= 1
+
+
+def test_due_refreshes_respect_concurrency_and_cancel():
+    async def main():
+        recorder = Recorder()
+        scheduler = RefreshScheduler(recorder.refresh, margin_seconds=60, jitter_seconds=0, max_concurrency=2)
+        now = time.time()
+        for i in range(10):
+            scheduler.schedule(f"user{i}", now + 60)
+        scheduler.schedule("later", now + 3600)
+        scheduler.cancel("user9")
+        await scheduler.start()
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+
+        assert sorted(recorder.calls) == sorted(f"user{i}" for i in range(9))
+        assert recorder.peak == 2
+        assert scheduler.stats()["scheduled"] == 1
+
+    asyncio.run(main())
+
+
+def test_failed_refresh_is_retried():
+    async def main():
+        recorder = Recorder(fail_first=1)
+        scheduler = RefreshScheduler(recorder.refresh, margin_seconds=0, jitter_seconds=0, retry_seconds=0.05)
+        scheduler.schedule("alice", time.time())
+        await scheduler.start()
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        assert recorder.calls == ["alice", "alice"]
+        assert (scheduler.failed, scheduler.refreshed) == (1, 1)
+
+    asyncio.run(main())
+
+
+def test_overdue_deadlines_are_spread_over_the_jitter_window():
+    scheduler = RefreshScheduler(Recorder().refresh, margin_seconds=300, jitter_seconds=60)
+    now = time.time()
+    for i in range(200):
+        scheduler.schedule(f"user{i}", now - 3600)
+    due = list(scheduler._due.values())
+    assert all(now <= at <= time.time() + 60 for at in due)
+    assert max(due) - min(due) > 30
@@ -0,0 +1,166 @@
+"""
+ResilientUpstream against the mock Google endpoints with injected faults:
+retries, circuit breaker, retry budget, deadlines, hedged reads and the
+concurrency cap, and a Google outage answered with 503 by the backend
+"""
+import asyncio
+import time
+import httpx
+import pytest
+from benchmarks import BENCH_ENV
+from benchmarks.load import backend_client
+from benchmarks.mock_upstreams import MockFaults, create_mock_app, mock_transport
+from resilience import (
+    CLOSED, OPEN, ResilientUpstream, RetryBudget, UpstreamUnavailable, deadline, remaining_time,
+)
+
+TOKEN_URL = "https://oauth2.googleapis.com/token"
+USERINFO_URL = "https://www.googleapis.com/oauth2/v2/userinfo"
+
+
+def resilient(**kwargs) -> ResilientUpstream:
+    options = {"attempt_timeout": 1.0, "default_deadline": 5.0, "backoff": 0.001, "max_backoff": 0.005}
+    options.update(kwargs)
+    return ResilientUpstream(options.pop("budget", RetryBudget()), **options)
+
+
+def run(test, **fault_options):
+    async def main():
+        faults = MockFaults(seed=7, **fault_options)
+        app = create_mock_app("test-client", issue_id_tokens=False, faults=faults)
+        async with httpx.AsyncClient(transport=mock_transport(app)) as client:
+            def refresh(timeout: float):
+                return client.post(TOKEN_URL, data={"grant_type": "refresh_token", "refresh_token": "rt-1"}, timeout=timeout)
+
+            def userinfo(timeout: float):
+                return client.get(USERINFO_URL, headers={"Authorization": "Bearer at-1-2"}, timeout=timeout)
+
+            await test(app, faults, refresh, userinfo)
+    asyncio.run(main())
+
+
+def test_idempotent_calls_retry_through_flaky_upstream():
+    async def test(app, faults, refresh, userinfo):
+        upstream = resilient(max_attempts=5, failure_threshold=100)
+        for _ in range(20):
+            response = await upstream.call("google_token", refresh, idempotent=True)
+            assert response.status_code == 200
+        assert faults.injected["errors"] > 0
+        assert app.state.counters["token"] == 20 + faults.injected["errors"]
+
+        # A request that reached the upstream is not repeated unless idempotent
+        faults.error_rate = 1.0
+        calls = app.state.counters["token"]
+        with pytest.raises(UpstreamUnavailable, match="HTTP 503"):
+            await upstream.call("google_token", refresh)
+        assert app.state.counters["token"] == calls + 1
+    run(test, error_rate=0.3)
+
+
+def test_breaker_opens_on_outage_and_closes_after_a_probe():
+    async def test(app, faults, refresh, userinfo):
+        upstream = resilient(max_attempts=1, failure_threshold=3, reset_timeout=0.05)
+        for _ in range(3):
+            with pytest.raises(UpstreamUnavailable):
+                await upstream.call("google_token", refresh)
+        breaker = upstream.breaker("google_token")
+        assert breaker.state == OPEN
+
+        with pytest.raises(UpstreamUnavailable, match="circuit open") as rejected:
+            await upstream.call("google_token", refresh)
+        assert app.state.counters["token"] == 3
+        assert rejected.value.retry_after_header == "1"
+
+        # After the reset timeout one probe goes through; a failed probe reopens
+        await asyncio.sleep(0.06)
+        with pytest.raises(UpstreamUnavailable, match="HTTP 503"):
+            await upstream.call("google_token", refresh)
+        assert breaker.state == OPEN and app.state.counters["token"] == 4
+
+        faults.error_rate = 0.0
+        await asyncio.sleep(0.06)
+        assert (await upstream.call("google_token", refresh)).status_code == 200
+        assert breaker.state == CLOSED and breaker.opened == 2
+    run(test, error_rate=1.0)
+
+
+def test_retry_budget_caps_retries_across_calls():
+    async def test(app, faults, refresh, userinfo):
+        budget = RetryBudget(ratio=0.0, min_per_second=0.0, max_tokens=2)
+        upstream = resilient(budget=budget, max_attempts=5, failure_threshold=100)
+        for _ in range(5):
+            with pytest.raises(UpstreamUnavailable):
+                await upstream.call("google_token", refresh, idempotent=True)
+        # Five first attempts plus the two retries the budget allowed
+        assert app.state.counters["token"] == 7
+        assert budget.allowed == 2 and budget.rejected == 5
+    run(test, error_rate=1.0)
+
+
+def test_deadline_bounds_slow_calls_and_nested_deadlines_only_shorten():
+    async def test(app, faults, refresh, userinfo):
+        upstream = resilient(max_attempts=3, failure_threshold=100)
+        started = time.perf_counter()
+        with deadline(0.1):
+            with deadline(10):
+                assert remaining_time() <= 0.1
+            with pytest.raises(UpstreamUnavailable):
+                await upstream.call("google_token", refresh, idempotent=True)
+        assert time.perf_counter() - started < 0.5
+        assert remaining_time() is None
+    run(test, slow_rate=1.0, slow_seconds=2.0)
+
+
+def test_hedged_read_returns_the_faster_response():
+    async def test(app, faults, refresh, userinfo):
+        upstream = resilient(failure_threshold=100)
+
+        async def first_one_slow(timeout: float):
+            slow = app.state.counters["userinfo"] == 0
+            faults.slow_rate = 1.0 if slow else 0.0
+            return await userinfo(timeout)
+
+        started = time.perf_counter()
+        response = await upstream.hedged("google_userinfo", first_one_slow, hedge_after=0.02)
+        assert response.status_code == 200 and time.perf_counter() - started < 0.5
+        assert upstream.hedges == 1 and upstream.hedge_wins == 1
+
+        # Without retry budget there is no hedge: the caller waits for the first request
+        upstream.budget = RetryBudget(ratio=0.0, min_per_second=0.0, max_tokens=0)
+        faults.slow_seconds = 0.05
+        app.state.counters["userinfo"] = 0
+        await upstream.hedged("google_userinfo", first_one_slow, hedge_after=0.01)
+        assert upstream.hedges == 1 and app.state.counters["userinfo"] == 1
+    run(test, slow_seconds=1.0, endpoints=("userinfo",))
+
+
+def test_concurrency_limit_sheds_callers_that_wait_too_long():
+    async def test(app, faults, refresh, userinfo):
+        upstream = resilient(max_concurrency=1, queue_timeout=0.02)
+        results = await asyncio.gather(
+            *(upstream.call("google_token", refresh) for _ in range(3)), return_exceptions=True
+        )
+        assert results[0].status_code == 200
+        assert all(isinstance(result, UpstreamUnavailable) and result.reason == "concurrency limit" for result in results[1:])
+        assert upstream.breaker("google_token").state == CLOSED
+        assert upstream.slots.stats()["in_use"] == 0
+    run(test, slow_rate=1.0, slow_seconds=0.1)
+
+
+def test_backend_answers_503_with_retry_after_during_an_outage(monkeypatch):
+    for name, value in BENCH_ENV.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setenv("UPSTREAM_BREAKER_FAILURES", "3")
+    monkeypatch.setenv("UPSTREAM_BREAKER_RESET_SECONDS", "30")
+
+    async def main():
+        faults = MockFaults(error_rate=1.0)
+        async with backend_client(None, 0, faults) as client:
+            import auth_backend
+            responses = [await client.post("/api/auth/refresh", json={"refresh_token": "rt-x"}) for _ in range(6)]
+            assert all(response.status_code == 503 for response in responses)
+            # Once the breaker opens, requests are shed without reaching Google
+            assert responses[-1].headers["retry-after"] == "30"
+            assert faults.injected["errors"] == 3
+            assert auth_backend.google_upstream.stats()["breakers"]["token"]["state"] == "open"
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+SessionEventHub fan-out, bounded queues and subscriber cap, and the SSE
+response releasing its subscription when the client goes away early
+"""
+import asyncio
+import time
+import auth_backend
+from session_events import LOGOUT, REFRESH, SessionEventHub
+
+
+def test_publish_reaches_every_stream_and_logout_ends_them():
+    async def main():
+        hub = SessionEventHub(queue_size=4)
+        first = hub.subscribe("user-1")
+        second = hub.subscribe("user-1")
+        hub.subscribe("user-2")
+
+        assert hub.publish("user-1", REFRESH, {"expires_in": 3599}) == 2
+        assert hub.publish("user-1", LOGOUT, {"reason": "logout"}) == 2
+
+        frames = [frame async for frame in hub.stream(first, heartbeat=1, max_seconds=5)]
+        assert frames[0].startswith(b"retry: ")
+        assert b"event: refresh" in frames[1] and b"event: logout" in frames[2]
+        assert len(frames) == 3
+        assert second.queue.qsize() == 3
+        assert hub.stats()["subscribers"] == 2
+    asyncio.run(main())
+
+
+def test_slow_stream_drops_oldest_frames():
+    async def main():
+        hub = SessionEventHub(queue_size=2)
+        subscription = hub.subscribe("user-1")
+        for i in range(5):
+            hub.publish("user-1", REFRESH, {"n": i})
+        frames = [subscription.queue.get_nowait() for _ in range(2)]
+        assert b'"n":3' in frames[0] and b'"n":4' in frames[1]
+        hub.unsubscribe(subscription)
+        assert hub.stats()["dropped"] == 3
+    asyncio.run(main())
+
+
+def test_subscriber_cap_and_expiry_callback():
+    async def main():
+        expired = []
+        hub = SessionEventHub(max_subscribers=1, on_expiry=expired.append)
+        subscription = hub.subscribe("user-1", expires_at=int(time.time()))
+        assert hub.subscribe("user-2") is None and hub.rejected == 1
+        await asyncio.sleep(0.01)
+        assert expired == ["user-1"]
+        hub.unsubscribe(subscription)
+        hub.unsubscribe(subscription)
+        assert hub.subscribe("user-2") is not None
+    asyncio.run(main())
+
+
+def test_disconnect_before_body_releases_subscription():
+    async def main():
+        hub = SessionEventHub(max_subscribers=1)
+        response = auth_backend.EventStreamResponse(hub, hub.subscribe("user-1"), heartbeat=1, max_seconds=5)
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            # The response start never gets through, so the body is never iterated
+            await asyncio.sleep(10)
+
+        await response({"type": "http", "asgi": {"spec_version": "2.0"}}, receive, send)
+        assert hub.stats()["subscribers"] == 0
+        assert hub.subscribe("user-1") is not None
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+"""
+JournaledSessionStore: sessions survive a restart through the journal and
+snapshot, a restore that fails still lets lookups complete, and nothing is
+opened on disk before the app starts
+"""
+import asyncio
+import os
+import pytest
+import auth_backend
+from session_journal import (
+    FRAME, OP_PUT, SNAPSHOT_HEADER, SNAPSHOT_MAGIC,
+    JournaledSessionStore, SessionJournal, encode_frame,
+)
+from session_store import MemorySessionStore
+from settings import Settings
+
+
+def journaled(directory: str) -> JournaledSessionStore:
+    return JournaledSessionStore(MemorySessionStore(default_ttl=3600), SessionJournal(directory))
+
+
+def test_sessions_survive_restart(tmp_path, make_record):
+    async def main():
+        store = journaled(str(tmp_path))
+        await store.restore()
+        await store.set("alice", make_record("alice"))
+        await store.set("bob", make_record("bob"))
+        await store.set("carol", make_record("carol"))
+        await store.pop("bob")
+        await store.close()
+
+        restarted = journaled(str(tmp_path))
+        assert await restarted.restore() == 2
+        assert (await restarted.get("alice")).email == "alice@example.com"
+        assert await restarted.get("bob") is None
+        assert sorted(key for chunk in [c async for c in restarted.scan()] for key, _ in chunk) == ["alice", "carol"]
+        await restarted.close()
+
+    asyncio.run(main())
+
+
+def test_journal_without_snapshot_is_replayed(tmp_path, make_record):
+    async def main():
+        store = journaled(str(tmp_path))
+        await store.restore()
+        await store.set("alice", make_record("alice"))
+        # Simulate a crash: the journal is flushed but never compacted
+        store.journal.close()
+
+        restarted = journaled(str(tmp_path))
+        assert await restarted.restore() == 1
+        assert (await restarted.get("alice")).user_id == "alice"
+        await restarted.close()
+
+    asyncio.run(main())
+
+
+def test_lookups_do_not_hang_after_failed_restore(tmp_path, make_record):
+    # A frame with a valid checksum but a truncated PUT payload
+    snapshot = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, 1) + encode_frame(bytes([OP_PUT]) + b"\x00" * (FRAME.size))
+    path = os.path.join(str(tmp_path), "snapshot")
+    with open(path, "wb") as f:
+        f.write(snapshot)
+
+    async def main():
+        store = journaled(str(tmp_path))
+        restore = asyncio.create_task(store.restore())
+        lookup = asyncio.create_task(store.get("alice"))
+        try:
+            await restore
+        except Exception:
+            pass
+        assert store.restore_error
+        assert await asyncio.wait_for(lookup, timeout=1) is None
+        assert await asyncio.wait_for(store.pop("alice"), timeout=1) is None
+        assert await asyncio.wait_for(store.get_many(["alice", "bob"]), timeout=1) == [None, None]
+
+        # New sessions are still served and journaled
+        await store.set("bob", make_record("bob"))
+        assert (await store.get("bob")).user_id == "bob"
+        await store.close()
+
+    asyncio.run(main())
+    # The unreadable snapshot is left for inspection rather than compacted over
+    with open(path, "rb") as f:
+        assert f.read() == snapshot
+
+
+def test_configure_opens_no_files_and_rejects_shared_backends(tmp_path):
+    directory = tmp_path / "sessions"
+    auth_backend.configure(Settings(_env_file=None, session_persistence_dir=str(directory)))
+    assert isinstance(auth_backend.user_sessions, JournaledSessionStore)
+    assert not directory.exists()
+
+    with pytest.raises(ValueError, match="SESSION_PERSISTENCE_DIR"):
+        auth_backend.configure(Settings(
+            _env_file=None,
+            session_persistence_dir=str(directory),
+            session_store_backend="sqlite",
+            session_sqlite_path=str(tmp_path / "sessions.db"),
+        ))
+    assert not (tmp_path / "sessions.db").exists()
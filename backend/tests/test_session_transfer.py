@@ -0,0 +1,142 @@
+"""
+Session transfer: keyset pages from the mock Supabase table, re-hydration
+counts and failures, NDJSON chunking, and the admin rehydrate, export and
+import endpoints end to end
+"""
+import asyncio
+import httpx
+import pytest
+from benchmarks import BENCH_ENV
+from benchmarks.load import backend_client
+from benchmarks.mock_upstreams import create_mock_app, mock_transport
+from benchmarks.transfer import HEADERS, ADMIN_TOKEN, seed_supabase, token_rows, wipe_sessions
+from session_store import MemorySessionStore
+from session_transfer import SessionRehydrator, SupabaseReadError, SupabaseTokenReader, ndjson_chunks
+
+SUPABASE_URL = "http://supabase.test"
+
+
+class FailingTransport(httpx.AsyncBaseTransport):
+    """Answers the first `failures` requests with `status`, then passes through"""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, failures: int = 0, status: int = 503):
+        self.inner = inner
+        self.failures = failures
+        self.status = status
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.failures > 0:
+            self.failures -= 1
+            return httpx.Response(self.status, json={"message": "injected"})
+        return await self.inner.handle_async_request(request)
+
+
+def run(test, rows: int, failures: int = 0, status: int = 503):
+    async def main():
+        app = create_mock_app("test-client", issue_id_tokens=False)
+        transport = FailingTransport(mock_transport(app))
+        async with httpx.AsyncClient(transport=transport, base_url=SUPABASE_URL) as client:
+            await client.post("/rest/v1/google_oauth_tokens", json=token_rows(rows), params={"on_conflict": "google_user_id"})
+            transport.failures, transport.status = failures, status
+            reader = SupabaseTokenReader(SUPABASE_URL, "anon-key", lambda: client, page_size=10, retry_backoff=0.001)
+            await test(app, transport, client, reader)
+    asyncio.run(main())
+
+
+def test_keyset_pages_cover_the_table_once():
+    async def test(app, transport, client, reader):
+        keys = []
+        async for page in reader.pages():
+            keys += [row["google_user_id"] for row in page]
+            # A row sorting before the cursor, written mid-read, does not shift later pages
+            await client.post(
+                "/rest/v1/google_oauth_tokens",
+                json=[{**page[0], "google_user_id": "0"}],
+                params={"on_conflict": "google_user_id"},
+            )
+        assert keys == sorted(keys) and len(set(keys)) == 25
+        assert reader.pages_read == 3 and app.state.counters["supabase_reads"] == 3
+    run(test, rows=25)
+
+
+def test_reads_retry_server_errors_but_not_rejections():
+    async def test(app, transport, client, reader):
+        assert sum([len(page) async for page in reader.pages()]) == 5
+        assert reader.retries == 2
+    run(test, rows=5, failures=2)
+
+    async def test(app, transport, client, reader):
+        with pytest.raises(SupabaseReadError, match="HTTP 401"):
+            [page async for page in reader.pages()]
+        assert reader.retries == 0
+    run(test, rows=5, failures=1, status=401)
+
+
+def test_rehydrator_counts_restored_skipped_and_failed_rows(make_record):
+    def build(row):
+        if row["google_user_id"].endswith("3"):
+            raise ValueError("corrupt row")
+        if row["google_user_id"].endswith("7"):
+            return None
+        return make_record(row["google_user_id"])
+
+    async def test(app, transport, client, reader):
+        store = MemorySessionStore()
+
+        async def save(records):
+            for record in records:
+                await store.set(record.user_id, record)
+            return len(records)
+
+        rehydrator = SessionRehydrator(reader, build, save, concurrency=3)
+        result = await rehydrator.run()
+        assert (result["rows"], result["restored"], result["skipped"], result["failed"]) == (42, 34, 4, 4)
+        assert await store.size() == 34 and rehydrator.stats()["pages"] == 5
+
+        # A failed read ends the run with the error recorded
+        reader.max_retries = 0
+        app.state.tables.clear()
+        transport.failures = 1
+        with pytest.raises(SupabaseReadError):
+            await rehydrator.run()
+        assert rehydrator.last_error and rehydrator.runs == 2
+    run(test, rows=42)
+
+
+def test_ndjson_chunks_split_on_lines_not_reads():
+    async def stream(*parts):
+        for part in parts:
+            yield part
+
+    async def main():
+        chunks = [chunk async for chunk in ndjson_chunks(stream(b'{"a":1}\n{"b', b'":2}\n\n{"c":3}\n', b'{"d":4}'), 2)]
+        assert chunks == [[b'{"a":1}', b'{"b":2}'], [b'{"c":3}', b'{"d":4}']]
+        with pytest.raises(ValueError, match="longer than"):
+            [chunk async for chunk in ndjson_chunks(stream(b"x" * 100), 2, max_line_bytes=50)]
+    asyncio.run(main())
+
+
+def test_rehydrate_export_and_import_round_trip(monkeypatch):
+    for name, value in BENCH_ENV.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setenv("ADMIN_TOKEN", ADMIN_TOKEN)
+
+    async def main():
+        async with backend_client(None, 0) as client:
+            import auth_backend
+            await seed_supabase(auth_backend, 120)
+            assert (await client.post("/api/admin/sessions/rehydrate")).status_code in (401, 403)
+
+            rehydrated = (await client.post("/api/admin/sessions/rehydrate", headers=HEADERS)).json()
+            assert rehydrated["restored"] == 120
+
+            exported = (await client.get("/api/admin/sessions/export", headers=HEADERS)).content
+            assert exported.count(b"\n") == 120
+            await wipe_sessions(auth_backend)
+            assert await auth_backend.user_sessions.size() == 0
+
+            imported = (await client.post("/api/admin/sessions/import", headers=HEADERS, content=exported)).json()
+            assert imported["imported"] == 120 and imported["failed"] == 0
+            session = (await client.get(f"/api/auth/session/{token_rows(1)[0]['google_user_id']}")).json()
+            assert session["user"]["email"] == "user0@bench.example.com"
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+SingleFlight: concurrent refreshes of one token reach the mock Google token
+endpoint once, results are reused for the grace window, failures are not
+"""
+import asyncio
+import httpx
+import pytest
+from benchmarks.mock_upstreams import MockFaults, MockLatency, create_mock_app, mock_transport
+from singleflight import SingleFlight, hash_key
+
+TOKEN_URL = "https://oauth2.googleapis.com/token"
+
+
+def run(test, latency: float = 0.02, **fault_options):
+    async def main():
+        faults = MockFaults(endpoints=("token",), seed=1, **fault_options)
+        app = create_mock_app("test-client", MockLatency(token=latency), issue_id_tokens=False, faults=faults)
+        async with httpx.AsyncClient(transport=mock_transport(app)) as client:
+            async def refresh(refresh_token: str):
+                response = await client.post(TOKEN_URL, data={"grant_type": "refresh_token", "refresh_token": refresh_token})
+                response.raise_for_status()
+                return response.json()
+            await test(app, faults, refresh)
+    asyncio.run(main())
+
+
+def test_concurrent_callers_share_one_upstream_call():
+    async def test(app, faults, refresh):
+        flights = SingleFlight(grace_seconds=5)
+        key = hash_key("rt-alice")
+        results = await asyncio.gather(*(flights.do(key, lambda: refresh("rt-alice")) for _ in range(20)))
+        assert app.state.counters["token"] == 1
+        assert len({result["access_token"] for result in results}) == 1
+        assert flights.stats()["coalesced"] == 19
+
+        # Inside the grace window the result is reused; forget() drops it
+        await flights.do(key, lambda: refresh("rt-alice"))
+        assert app.state.counters["token"] == 1 and flights.cache_hits == 1
+        flights.forget(key)
+        await flights.do(key, lambda: refresh("rt-alice"))
+        assert app.state.counters["token"] == 2
+    run(test)
+
+
+def test_failures_are_shared_but_not_cached():
+    async def test(app, faults, refresh):
+        flights = SingleFlight(grace_seconds=5)
+        key = hash_key("rt-bob")
+        results = await asyncio.gather(
+            *(flights.do(key, lambda: refresh("rt-bob")) for _ in range(5)), return_exceptions=True
+        )
+        assert all(isinstance(result, httpx.HTTPStatusError) for result in results)
+        assert app.state.counters["token"] == 1 and flights.failures == 1
+
+        faults.error_rate = 0.0
+        assert (await flights.do(key, lambda: refresh("rt-bob")))["access_token"]
+        assert app.state.counters["token"] == 2
+    run(test, error_rate=1.0)
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    async def test(app, faults, refresh):
+        flights = SingleFlight(grace_seconds=0)
+        key = hash_key("rt-carol")
+        first = asyncio.ensure_future(flights.do(key, lambda: refresh("rt-carol")))
+        second = asyncio.ensure_future(flights.do(key, lambda: refresh("rt-carol")))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert (await second)["access_token"]
+        assert app.state.counters["token"] == 1 and flights.stats()["cached"] == 0
+    run(test)
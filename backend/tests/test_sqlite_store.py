@@ -0,0 +1,108 @@
+"""
+SqliteSessionStore: group-committed writes, the per-process read cache and
+its invalidation when another process (here: another store on the same
+file) writes
+"""
+import asyncio
+from session_record import SessionRecord
+from sqlite_store import SqliteSessionStore
+
+
+def open_store(tmp_path, **kwargs) -> SqliteSessionStore:
+    return SqliteSessionStore(str(tmp_path / "sessions.db"), prefix="session:", record_type=SessionRecord, **kwargs)
+
+
+def test_set_and_pop_in_one_batch_leave_nothing_cached(tmp_path, make_record):
+    async def main():
+        store = open_store(tmp_path)
+        await store.set("alice", make_record("alice"))
+        # Queued together, so committed in one transaction
+        _, popped = await asyncio.gather(store.set("alice", make_record("alice")), store.pop("alice"))
+        assert popped.user_id == "alice"
+        assert await store.get("alice") is None
+        assert store.stats()["cached"] == 0
+
+        popped, _ = await asyncio.gather(store.pop("alice"), store.set("alice", make_record("alice")))
+        assert popped is None
+        assert (await store.get("alice")).user_id == "alice"
+        await store.close()
+
+    asyncio.run(main())
+
+
+def test_delete_after_set_in_one_batch(tmp_path, make_record):
+    async def main():
+        store = open_store(tmp_path)
+        await asyncio.gather(store.set("bob", make_record("bob")), store.delete("bob"))
+        assert await store.get("bob") is None
+        await store.close()
+
+    asyncio.run(main())
+
+
+def test_writes_from_another_process_invalidate_the_cache(tmp_path, make_record):
+    async def main():
+        first, second = open_store(tmp_path), open_store(tmp_path)
+        await first.set("alice", make_record("alice"))
+        assert (await second.get("alice")).user_id == "alice"
+        assert (await second.get("alice")).user_id == "alice"
+        assert second.hits == 1
+
+        await first.pop("alice")
+        assert await second.get("alice") is None
+        assert second.invalidations == 1
+
+        await first.set("carol", make_record("carol"))
+        assert [record.user_id for record in await second.get_many(["carol", "alice"]) if record] == ["carol"]
+        await first.close()
+        await second.close()
+
+    asyncio.run(main())
+
+
+def test_expired_entries_are_not_returned(tmp_path, make_record):
+    async def main():
+        store = open_store(tmp_path)
+        await store.set("dave", make_record("dave"), ttl=0.05)
+        assert (await store.get("dave")).user_id == "dave"
+        await asyncio.sleep(0.1)
+        assert await store.get("dave") is None
+        assert await store.sweep() == 1
+        assert await store.size() == 0
+        await store.close()
+
+    asyncio.run(main())
+
+
+def test_scan_pages_through_every_key(tmp_path, make_record):
+    async def main():
+        store = open_store(tmp_path)
+        await asyncio.gather(*(store.set(f"user{i:03d}", make_record(f"user{i:03d}")) for i in range(25)))
+        chunks = [chunk async for chunk in store.scan(chunk_size=10)]
+        assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+        assert [key for chunk in chunks for key, _ in chunk] == [f"user{i:03d}" for i in range(25)]
+        await store.close()
+
+    asyncio.run(main())
+
+
+def test_add_is_atomic_across_processes(tmp_path):
+    async def main():
+        first = SqliteSessionStore(str(tmp_path / "sessions.db"), prefix="oauth_state:")
+        second = SqliteSessionStore(str(tmp_path / "sessions.db"), prefix="oauth_state:")
+        results = await asyncio.gather(
+            first.add("used:nonce", {"worker": 1}, ttl=60),
+            second.add("used:nonce", {"worker": 2}, ttl=60),
+            first.add("used:nonce", {"worker": 1}, ttl=60),
+        )
+        assert sorted(results) == [False, False, True]
+
+        # An expired entry that has not been swept yet does not block a new one
+        await first.add("used:old", {"worker": 1}, ttl=0.05)
+        await asyncio.sleep(0.1)
+        assert await second.add("used:old", {"worker": 2}, ttl=60)
+        assert await first.get("used:old") == {"worker": 2}
+        await first.close()
+        await second.close()
+
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""
+SupabaseWriteBehind against the mock Supabase table: merged rows, bulk
+batches, back-pressure, retries and dropped batches
+"""
+import asyncio
+import httpx
+from benchmarks.mock_upstreams import create_mock_app, mock_transport
+from supabase_writer import SupabaseWriteBehind
+
+SUPABASE_URL = "http://supabase.test"
+
+
+class FailingTransport(httpx.AsyncBaseTransport):
+    """Answers the first `failures` requests with `status`, then passes through"""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, failures: int, status: int = 503):
+        self.inner = inner
+        self.failures = failures
+        self.status = status
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.failures > 0:
+            self.failures -= 1
+            return httpx.Response(self.status, json={"message": "injected"})
+        return await self.inner.handle_async_request(request)
+
+
+def run(test, failures: int = 0, status: int = 503):
+    async def main():
+        app = create_mock_app("test-client", issue_id_tokens=False)
+        transport = FailingTransport(mock_transport(app), failures, status)
+        async with httpx.AsyncClient(transport=transport) as client:
+            await test(app, lambda **kwargs: SupabaseWriteBehind(
+                SUPABASE_URL, "anon-key", lambda: client, retry_backoff=0.001, **kwargs
+            ))
+    asyncio.run(main())
+
+
+def rows(app):
+    table = app.state.tables.get("google_oauth_tokens")
+    return table.rows if table else {}
+
+
+def token_row(user_id: str, **columns):
+    return {"google_user_id": user_id, "email": f"{user_id}@example.com", **columns}
+
+
+def test_rows_are_merged_and_written_in_bulk():
+    async def test(app, writer):
+        queue = writer(max_batch=50, flush_interval=10)
+        for i in range(120):
+            await queue.enqueue(token_row(f"user-{i}", access_token="a"))
+        await queue.enqueue(token_row("user-0", access_token="b"))
+        await queue.close()
+
+        assert len(rows(app)) == 120 and rows(app)["user-0"]["access_token"] == "b"
+        assert queue.merged == 1 and queue.written == 120
+        assert app.state.counters["supabase"] == queue.batches == 3
+    run(test)
+
+
+def test_enqueue_waits_for_the_flusher_when_full():
+    async def test(app, writer):
+        queue = writer(max_batch=10, max_pending=10, flush_interval=0.01)
+        await asyncio.wait_for(asyncio.gather(*(queue.enqueue(token_row(f"user-{i}")) for i in range(100))), 5)
+        await queue.close()
+        assert len(rows(app)) == 100 and queue.dropped == 0
+    run(test)
+
+
+def test_server_errors_are_retried():
+    async def test(app, writer):
+        queue = writer(max_retries=3)
+        await queue.enqueue(token_row("user-1"))
+        await queue.close()
+        assert queue.retries == 2 and queue.written == 1 and "user-1" in rows(app)
+    run(test, failures=2)
+
+
+def test_rejected_and_exhausted_batches_are_dropped():
+    async def test(app, writer):
+        queue = writer(max_retries=3)
+        await queue.enqueue(token_row("user-1"))
+        await queue.close()
+        assert queue.retries == 0 and queue.dropped == 1 and not rows(app)
+    run(test, failures=1, status=400)
+
+    async def test(app, writer):
+        queue = writer(max_retries=2)
+        await queue.enqueue(token_row("user-1"))
+        await queue.close()
+        assert queue.retries == 2 and queue.dropped == 1 and not rows(app)
+    run(test, failures=3)
@@ -0,0 +1,105 @@
+"""
+AccessTokenBroker: cache hits, the min_ttl guarantee, coalesced lookups,
+invalidation, and verification of cached tokens against a shared store
+"""
+import asyncio
+import time
+from token_broker import AccessTokenBroker, BrokeredToken
+
+
+class FakeSessions:
+    """Stored tokens by user, standing in for the session store and Google"""
+
+    def __init__(self):
+        self.tokens = {}
+        self.loads = 0
+        self.refreshes = 0
+
+    def store(self, user_id: str, access_token: str, ttl: int) -> BrokeredToken:
+        token = self.tokens[user_id] = BrokeredToken(access_token, int(time.time()) + ttl, ["openid"])
+        return token
+
+    async def load(self, user_id: str):
+        self.loads += 1
+        await asyncio.sleep(0.01)
+        return self.tokens.get(user_id)
+
+    async def refresh(self, user_id: str):
+        self.refreshes += 1
+        await asyncio.sleep(0.01)
+        return self.store(user_id, f"refreshed-{self.refreshes}", 3599)
+
+    async def verify(self, user_id: str, token: BrokeredToken) -> bool:
+        stored = self.tokens.get(user_id)
+        return stored is not None and stored.expires_at == token.expires_at
+
+
+def test_hits_and_min_ttl_refresh():
+    async def main():
+        sessions = FakeSessions()
+        sessions.store("alice", "stored", 600)
+        broker = AccessTokenBroker(sessions.load, sessions.refresh)
+
+        assert (await broker.get("alice", 60)).access_token == "stored"
+        assert (await broker.get("alice", 60)).access_token == "stored"
+        assert (sessions.loads, broker.hits) == (1, 1)
+
+        # Less than min_ttl left: refreshed, and the new token is cached
+        token = await broker.get("alice", 1200)
+        assert token.access_token == "refreshed-1" and token.ttl() >= 1200
+        assert (await broker.get("alice", 1200)).access_token == "refreshed-1"
+        assert sessions.refreshes == 1
+
+        assert await broker.get("nobody", 60) is None
+
+    asyncio.run(main())
+
+
+def test_concurrent_lookups_share_one_refresh():
+    async def main():
+        sessions = FakeSessions()
+        sessions.store("alice", "stored", 30)
+        broker = AccessTokenBroker(sessions.load, sessions.refresh)
+        tokens = await asyncio.gather(*(broker.get("alice", 300) for _ in range(20)))
+        assert {token.access_token for token in tokens} == {"refreshed-1"}
+        assert (sessions.loads, sessions.refreshes) == (1, 1)
+
+    asyncio.run(main())
+
+
+def test_invalidate_during_lookup_is_not_cached():
+    async def main():
+        sessions = FakeSessions()
+        sessions.store("alice", "stored", 600)
+        broker = AccessTokenBroker(sessions.load, sessions.refresh)
+        lookup = asyncio.create_task(broker.get("alice", 60))
+        # Logout while the stored session is being loaded
+        await asyncio.sleep(0.005)
+        broker.invalidate("alice")
+        await lookup
+        assert broker.stats()["cached"] == 0
+
+    asyncio.run(main())
+
+
+def test_verify_drops_tokens_changed_by_another_process():
+    async def main():
+        sessions = FakeSessions()
+        sessions.store("alice", "stored", 600)
+        broker = AccessTokenBroker(sessions.load, sessions.refresh, verify=sessions.verify)
+        assert (await broker.get("alice", 60)).access_token == "stored"
+        assert (await broker.get("alice", 60)).access_token == "stored"
+        assert broker.hits == 1
+
+        # Another worker logs the user out: this worker's cache must not answer
+        del sessions.tokens["alice"]
+        assert await broker.get("alice", 60) is None
+        assert broker.stale == 1
+
+        # ... or logs them in again with a new token
+        sessions.store("alice", "relogin", 900)
+        assert (await broker.get("alice", 60)).access_token == "relogin"
+        sessions.store("alice", "other-worker", 1800)
+        assert (await broker.get("alice", 60)).access_token == "other-worker"
+
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+"""
+Token ciphers: round trips, reading tokens written before a key rotation or
+a cipher switch, and which tokens need re-encrypting
+"""
+import pytest
+from token_cipher import AesGcmCipher, FernetCipher, TokenDecryptionError, create_token_cipher
+
+TOKEN = b"ya29.a0AfB_byC-access-token"
+
+
+@pytest.mark.parametrize("name", ["aesgcm", "fernet"])
+def test_round_trip_and_rotation(name):
+    old = create_token_cipher("old-key", name)
+    written_before = old.encrypt(TOKEN)
+    assert old.decrypt(written_before) == TOKEN and not old.needs_rotation(written_before)
+
+    rotated = create_token_cipher("new-key", name, ["old-key"])
+    assert rotated.decrypt(written_before) == TOKEN
+    assert rotated.needs_rotation(written_before)
+    written_after = rotated.encrypt(TOKEN)
+    assert not rotated.needs_rotation(written_after)
+
+    # Once the old key is retired its tokens no longer decrypt
+    with pytest.raises(TokenDecryptionError):
+        create_token_cipher("new-key", name).decrypt(written_before)
+
+
+def test_switching_ciphers_keeps_old_tokens_readable():
+    fernet_token = FernetCipher(["key"]).encrypt(TOKEN)
+    aesgcm = AesGcmCipher(["key"])
+    assert aesgcm.decrypt(fernet_token) == TOKEN and aesgcm.needs_rotation(fernet_token)
+
+    gcm_token = aesgcm.encrypt(TOKEN)
+    assert len(gcm_token) == 1 + 4 + 12 + len(TOKEN) + 16
+    assert FernetCipher(["key"]).needs_rotation(gcm_token)
+
+
+def test_tampered_and_unknown_tokens_are_rejected():
+    cipher = AesGcmCipher(["key"])
+    token = bytearray(cipher.encrypt(TOKEN))
+    token[-1] ^= 1
+    for bad in (bytes(token), b"\x02garbage", AesGcmCipher(["other"]).encrypt(TOKEN)):
+        with pytest.raises(TokenDecryptionError):
+            cipher.decrypt(bad)
+
+    with pytest.raises(ValueError):
+        AesGcmCipher(["key", "key"])
+    with pytest.raises(ValueError):
+        create_token_cipher("key", "rot13")
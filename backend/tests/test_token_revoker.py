@@ -0,0 +1,80 @@
+"""
+TokenRevoker against the mock Google revoke endpoint: retries, dead
+letters, and pending revocations surviving a restart through the log
+"""
+import asyncio
+import httpx
+from benchmarks.mock_upstreams import MockFaults, create_mock_app, mock_transport
+from token_revoker import TokenRevoker
+
+REVOKE_URL = "https://oauth2.googleapis.com/revoke"
+
+
+def revoker(client: httpx.AsyncClient, **kwargs) -> TokenRevoker:
+    return TokenRevoker(
+        client=lambda: client,
+        revoke_url=REVOKE_URL,
+        decrypt=lambda token: token.decode(),
+        retry_backoff=0.01,
+        **kwargs,
+    )
+
+
+def run(test, **fault_options):
+    async def main():
+        faults = MockFaults(endpoints=("revoke",), seed=1, **fault_options)
+        app = create_mock_app("test-client", faults=faults, issue_id_tokens=False)
+        async with httpx.AsyncClient(transport=mock_transport(app)) as client:
+            await test(app, faults, client)
+    asyncio.run(main())
+
+
+def test_flaky_revocations_are_retried():
+    async def test(app, faults, client):
+        queue = revoker(client, max_retries=10)
+        await queue.start()
+        for i in range(20):
+            queue.enqueue(f"token-{i}".encode())
+        await queue.close(timeout=5)
+        assert queue.revoked == 20
+        assert queue.retries > 0 and queue.dead_lettered == 0
+
+    run(test, error_rate=0.3)
+
+
+def test_outage_dead_letters_after_max_retries():
+    async def test(app, faults, client):
+        queue = revoker(client, max_retries=2)
+        await queue.start()
+        queue.enqueue(b"token")
+        await queue.close(timeout=5)
+        assert queue.dead_lettered == 1
+        assert app.state.counters["revoke"] == 3
+
+    run(test, error_rate=1.0)
+
+
+def test_pending_revocations_survive_restart(tmp_path):
+    log_path = str(tmp_path / "revocations.log")
+
+    async def test(app, faults, client):
+        first = revoker(client, max_retries=100, log_path=log_path)
+        await first.start()
+        first.enqueue(b"token-a")
+        first.enqueue(b"token-b")
+        await first.close(timeout=0.05)
+        assert first.revoked == 0
+
+        faults.error_rate = 0.0
+        second = revoker(client, log_path=log_path)
+        await second.start()
+        assert second.stats()["pending"] == 2
+        await second.close(timeout=5)
+        assert second.revoked == 2
+
+        third = revoker(client, log_path=log_path)
+        await third.start()
+        assert third.stats()["pending"] == 0
+        await third.close()
+
+    run(test, error_rate=1.0)
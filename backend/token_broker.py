@@ -0,0 +1,129 @@
+"""
+Access Token Broker
+Hands server-side consumers an access token that stays valid for at least
+a requested number of seconds, refreshing it when needed; repeat requests
+are answered from memory
+"""
+from typing import Awaitable, Callable, Dict, List, Optional
+from collections import OrderedDict
+import time
+from singleflight import SingleFlight
+
+
+class BrokeredToken:
+    """A plaintext access token and its epoch expiry"""
+
+    __slots__ = ("access_token", "expires_at", "scopes")
+
+    def __init__(self, access_token: str, expires_at: int, scopes: List[str]):
+        self.access_token = access_token
+        self.expires_at = expires_at
+        self.scopes = scopes
+
+    def ttl(self, now: Optional[float] = None) -> float:
+        return self.expires_at - (time.time() if now is None else now)
+
+
+class AccessTokenBroker:
+    """
+    Per-user access tokens with a freshness guarantee
+
+    A cache hit is a dict lookup and an expiry comparison. On a miss (or a
+    cached token with less than `min_ttl` left) the session is loaded with
+    `load`; if its token is also too close to expiry, `refresh` exchanges
+    the refresh token. Both run in one single-flight per user, so a burst
+    of jobs asking for the same user costs at most one load and one refresh.
+
+    Decrypted tokens are kept for at most `max_size` users (LRU), only for
+    users someone asked for, and only until they expire; `max_size=0`
+    disables the cache (every call loads and decrypts). `invalidate` drops
+    a user (on logout) and keeps an in-flight lookup from caching its result.
+
+    The cache is per process and `invalidate` only reaches this one. When
+    the session store is shared by several processes, pass `verify`: every
+    hit is checked against the stored session (a cheap lookup, no decrypt),
+    and a token whose session was logged out, refreshed or replaced by
+    another process is dropped and resolved again.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[str], Awaitable[Optional[BrokeredToken]]],
+        refresh: Callable[[str], Awaitable[Optional[BrokeredToken]]],
+        max_size: int = 10000,
+        verify: Optional[Callable[[str, BrokeredToken], Awaitable[bool]]] = None,
+    ):
+        self._load = load
+        self._refresh = refresh
+        self._verify = verify
+        self.max_size = max_size
+        self._cache: "OrderedDict[str, BrokeredToken]" = OrderedDict()
+        self._flights = SingleFlight(grace_seconds=0)
+        self._invalidations = 0
+        self.hits = 0
+        self.stale = 0
+        self.loaded = 0
+        self.refreshed = 0
+
+    async def get(self, user_id: str, min_ttl: float) -> Optional[BrokeredToken]:
+        """A token valid for at least `min_ttl` seconds, or None if there is no session"""
+        token = self._cache.get(user_id)
+        if token is not None and token.ttl() >= min_ttl:
+            if self._verify is None or await self._verify(user_id, token):
+                if user_id in self._cache:
+                    self._cache.move_to_end(user_id)
+                self.hits += 1
+                return token
+            if self._cache.get(user_id) is token:
+                del self._cache[user_id]
+            self.stale += 1
+
+        token = await self._flights.do(user_id, lambda: self._resolve(user_id, min_ttl))
+        if token is not None and token.ttl() < min_ttl:
+            # Joined a lookup started for a smaller min_ttl; resolve again for ours
+            token = await self._flights.do(user_id, lambda: self._resolve(user_id, min_ttl))
+        return token
+
+    async def _resolve(self, user_id: str, min_ttl: float) -> Optional[BrokeredToken]:
+        invalidations = self._invalidations
+        token = await self._load(user_id)
+        if token is None:
+            return None
+        if token.ttl() < min_ttl:
+            token = await self._refresh(user_id)
+            self.refreshed += 1
+        else:
+            self.loaded += 1
+        if token is not None and invalidations == self._invalidations:
+            self._put(user_id, token)
+        return token
+
+    def _put(self, user_id: str, token: BrokeredToken) -> None:
+        if self.max_size <= 0:
+            return
+        self._cache[user_id] = token
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def replace(self, user_id: str, token: BrokeredToken) -> None:
+        """Swap in a newer token for a cached user (e.g. after a refresh); others are not added"""
+        if user_id in self._cache:
+            self._cache[user_id] = token
+
+    def invalidate(self, user_id: str) -> None:
+        """Forget a user's token (e.g. on logout)"""
+        self._cache.pop(user_id, None)
+        self._invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "cached": len(self._cache),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "stale": self.stale,
+            "loaded": self.loaded,
+            "refreshed": self.refreshed,
+            "coalesced": self._flights.coalesced,
+            "in_flight": self._flights.stats()["in_flight"],
+        }
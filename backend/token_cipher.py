@@ -0,0 +1,172 @@
+"""
+Token Cipher
+Pluggable encryption for OAuth tokens held in session records, with an
+AES-GCM fast path, key rotation and transparent reading of Fernet tokens
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, List, Sequence
+import base64
+import hashlib
+import os
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# AES-GCM token layout: version (1) | key id (4) | nonce (12) | ciphertext + tag (16)
+GCM_VERSION = b"\x01"
+KEY_ID_SIZE = 4
+NONCE_SIZE = 12
+HEADER_SIZE = 1 + KEY_ID_SIZE
+
+# Fernet tokens start with version byte 0x80: "gA" once base64-encoded
+FERNET_VERSION = 0x80
+FERNET_TEXT_PREFIX = b"gA"
+
+
+class TokenDecryptionError(Exception):
+    """Ciphertext is malformed, tampered with, or under an unknown key"""
+
+
+def fernet_key(secret: str) -> bytes:
+    """Fernet key derived from a passphrase (the original derivation)"""
+    return base64.urlsafe_b64encode(hashlib.sha256(secret.encode()).digest())
+
+
+def _is_fernet(token: bytes) -> bool:
+    return token[:1] == bytes([FERNET_VERSION]) or token[:2] == FERNET_TEXT_PREFIX
+
+
+def _fernet_text(token: bytes) -> bytes:
+    """Fernet token in its base64 form, whether stored raw or encoded"""
+    if token[0] == FERNET_VERSION:
+        return base64.urlsafe_b64encode(token)
+    return token
+
+
+class TokenCipher(ABC):
+    """
+    Encrypts token bytes with the current key, decrypts under any known key
+
+    `secrets` are passphrases, newest first: the first encrypts, the rest
+    are only used to read tokens written before a rotation.
+    """
+
+    def __init__(self, secrets: Sequence[str]):
+        if not secrets:
+            raise ValueError("At least one encryption secret is required")
+        self._fernet = MultiFernet([Fernet(fernet_key(secret)) for secret in secrets])
+
+    @abstractmethod
+    def encrypt(self, plaintext: bytes) -> bytes:
+        """Encrypt with the current key"""
+
+    @abstractmethod
+    def decrypt(self, token: bytes) -> bytes:
+        """Decrypt a token written by this cipher or any earlier configuration"""
+
+    @abstractmethod
+    def needs_rotation(self, token: bytes) -> bool:
+        """True if `token` is not in the current format under the current key"""
+
+    def _decrypt_fernet(self, token: bytes) -> bytes:
+        try:
+            return self._fernet.decrypt(_fernet_text(token))
+        except InvalidToken as e:
+            raise TokenDecryptionError("Invalid Fernet token") from e
+
+
+class FernetCipher(TokenCipher):
+    """AES-128-CBC + HMAC-SHA256 (Fernet), base64 output; the original format"""
+
+    name = "fernet"
+
+    def __init__(self, secrets: Sequence[str]):
+        super().__init__(secrets)
+        self._current = Fernet(fernet_key(secrets[0]))
+        self._rotating = len(secrets) > 1
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        return self._current.encrypt(plaintext)
+
+    def decrypt(self, token: bytes) -> bytes:
+        return self._decrypt_fernet(token)
+
+    def needs_rotation(self, token: bytes) -> bool:
+        if not _is_fernet(token):
+            return True
+        if not self._rotating:
+            return False
+        # Fernet tokens carry no key id; only pay for a trial decrypt while rotating
+        try:
+            self._current.decrypt(_fernet_text(token))
+            return False
+        except InvalidToken:
+            return True
+
+
+class AesGcmCipher(TokenCipher):
+    """
+    AES-256-GCM with a versioned key-id header and raw (binary) output
+
+    One AEAD call per operation and no base64, against Fernet's CBC + HMAC
+    and encoding in both directions. The header is authenticated as
+    associated data. Fernet tokens under any configured secret still
+    decrypt, so switching ciphers does not log anyone out.
+    """
+
+    name = "aesgcm"
+
+    def __init__(self, secrets: Sequence[str]):
+        super().__init__(secrets)
+        self._keys: Dict[bytes, AESGCM] = {}
+        self._key_ids: List[bytes] = []
+        for secret in secrets:
+            key_id = hashlib.sha256(b"token-cipher:key-id:" + secret.encode()).digest()[:KEY_ID_SIZE]
+            if key_id in self._keys:
+                raise ValueError("Encryption secrets must be distinct")
+            self._keys[key_id] = AESGCM(hashlib.sha256(b"token-cipher:aesgcm:" + secret.encode()).digest())
+            self._key_ids.append(key_id)
+        self._header = GCM_VERSION + self._key_ids[0]
+        self._current = self._keys[self._key_ids[0]]
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        nonce = os.urandom(NONCE_SIZE)
+        return self._header + nonce + self._current.encrypt(nonce, plaintext, self._header)
+
+    def decrypt(self, token: bytes) -> bytes:
+        if token[:1] != GCM_VERSION:
+            if _is_fernet(token):
+                return self._decrypt_fernet(token)
+            raise TokenDecryptionError("Unknown token format")
+        header = token[:HEADER_SIZE]
+        key = self._keys.get(header[1:])
+        if key is None:
+            raise TokenDecryptionError("Token encrypted under an unknown key")
+        nonce = token[HEADER_SIZE:HEADER_SIZE + NONCE_SIZE]
+        try:
+            return key.decrypt(nonce, token[HEADER_SIZE + NONCE_SIZE:], header)
+        except InvalidTag as e:
+            raise TokenDecryptionError("Invalid AES-GCM token") from e
+
+    def needs_rotation(self, token: bytes) -> bool:
+        return token[:HEADER_SIZE] != self._header
+
+
+CIPHERS = {cipher.name: cipher for cipher in (AesGcmCipher, FernetCipher)}
+
+
+def create_token_cipher(
+    current_secret: str,
+    name: str = "aesgcm",
+    previous_secrets: Sequence[str] = (),
+) -> TokenCipher:
+    """
+    Build the cipher selected by TOKEN_CIPHER (aesgcm or fernet)
+
+    Previous secrets, newest first (ENCRYPTION_KEYS_PREVIOUS), are kept only
+    for decryption.
+    """
+    name = name.lower()
+    if name not in CIPHERS:
+        raise ValueError(f"Unknown TOKEN_CIPHER: {name}")
+    return CIPHERS[name]([current_secret, *previous_secrets])
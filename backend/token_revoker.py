@@ -0,0 +1,275 @@
+"""
+Background Token Revocation
+Revokes Google tokens after logout from a background queue, so logout never
+waits on Google and failed revocations are retried and counted, not lost
+"""
+from typing import Callable, Dict, Optional, Tuple
+from collections import deque
+import asyncio
+import os
+import random
+import secrets
+import struct
+import time
+import httpx
+from session_journal import encode_frame, iter_frames
+
+# Durable log frames: op (1) | item id (8) [| attempts (2) | encrypted token]
+LOG_ENTRY = struct.Struct("<B8s")
+LOG_ATTEMPTS = struct.Struct("<H")
+OP_ENQUEUE = 1
+OP_DONE = 2
+
+
+class TokenRevoker:
+    """
+    Revocation queue with bounded concurrency, retries and a dead letter
+
+    Tokens are queued still encrypted (`decrypt` is applied right before the
+    call), so with `log_path` set the queue is persisted without holding any
+    plaintext token at rest: each enqueue and completion is appended to a
+    small framed log that is replayed on start and rewritten when it grows.
+
+    `max_concurrency` workers post to the revoke endpoint. Network errors,
+    429 and 5xx are retried with jittered exponential backoff, without
+    holding a worker while waiting; after `max_retries` attempts, or on an
+    unexpected 4xx, the token is dead-lettered (counted, and the failure
+    kept for inspection without the token). A 400 means Google already
+    considers the token invalid (expired, or revoked along with its grant),
+    which is the desired outcome.
+    """
+
+    def __init__(
+        self,
+        client: Callable[[], httpx.AsyncClient],
+        revoke_url: str,
+        decrypt: Callable[[bytes], str],
+        max_concurrency: int = 4,
+        max_retries: int = 5,
+        retry_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        log_path: Optional[str] = None,
+        max_log_bytes: int = 1024 * 1024,
+        dead_letter_size: int = 1000,
+    ):
+        self._client = client
+        self.revoke_url = revoke_url
+        self._decrypt = decrypt
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.log_path = log_path
+        self.max_log_bytes = max_log_bytes
+        # item id -> (encrypted token, attempts so far)
+        self._pending: Dict[bytes, Tuple[bytes, int]] = {}
+        self._queue: "asyncio.Queue[bytes]" = asyncio.Queue()
+        self._retry_handles: Dict[bytes, asyncio.TimerHandle] = {}
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers: list = []
+        self._log = None
+        self._log_bytes = 0
+        self.dead_letters: "deque[Dict[str, object]]" = deque(maxlen=dead_letter_size)
+        self.enqueued = 0
+        self.revoked = 0
+        self.already_invalid = 0
+        self.retries = 0
+        self.dead_lettered = 0
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Replay the durable log (if any) and start the workers"""
+        if self._workers:
+            return
+        if self.log_path:
+            restored = self._open_log()
+            if restored:
+                print(f"✅ Resuming {restored} pending token revocations")
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Drain the queue (waiting at most `timeout` seconds), then stop the workers"""
+        if self._workers and self._pending:
+            # Waiting retries are due now; shutdown is their last chance in this process
+            for item_id, handle in list(self._retry_handles.items()):
+                handle.cancel()
+                self._retry_handles.pop(item_id)
+                self._queue.put_nowait(item_id)
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                kept = "kept in the log" if self._log else "lost"
+                print(f"⚠️ {len(self._pending)} token revocations still pending at shutdown ({kept})")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for handle in self._retry_handles.values():
+            handle.cancel()
+        self._retry_handles.clear()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    # ------------------------------------------------------------------
+    # Queue
+    # ------------------------------------------------------------------
+
+    def enqueue(self, encrypted_token: bytes) -> None:
+        """Queue one encrypted token for revocation; never blocks"""
+        if not self._workers:
+            # Used before start() (e.g. without the lifespan): run without the log
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+        item_id = secrets.token_bytes(8)
+        self._pending[item_id] = (encrypted_token, 0)
+        self._append(OP_ENQUEUE, item_id, encrypted_token, 0)
+        self.enqueued += 1
+        self._idle.clear()
+        self._queue.put_nowait(item_id)
+
+    def _finish(self, item_id: bytes) -> None:
+        self._pending.pop(item_id, None)
+        self._append(OP_DONE, item_id)
+        if not self._pending:
+            self._idle.set()
+            self._truncate_log()
+
+    def _schedule_retry(self, item_id: bytes, attempts: int) -> None:
+        delay = min(self.max_backoff, self.retry_backoff * (2 ** (attempts - 1)))
+        self._retry_handles[item_id] = asyncio.get_running_loop().call_later(
+            delay * random.uniform(0.5, 1.5), self._requeue, item_id
+        )
+
+    def _requeue(self, item_id: bytes) -> None:
+        self._retry_handles.pop(item_id, None)
+        self._queue.put_nowait(item_id)
+
+    async def _worker(self) -> None:
+        while True:
+            item_id = await self._queue.get()
+            entry = self._pending.get(item_id)
+            if entry is None:
+                continue
+            encrypted_token, attempts = entry
+            try:
+                outcome = await self._revoke(encrypted_token)
+            except Exception as e:
+                outcome = f"error: {str(e)}"
+            attempts += 1
+
+            if outcome in ("revoked", "invalid"):
+                if outcome == "revoked":
+                    self.revoked += 1
+                else:
+                    self.already_invalid += 1
+                self._finish(item_id)
+            elif outcome.startswith("retry") and attempts <= self.max_retries:
+                self.retries += 1
+                self._pending[item_id] = (encrypted_token, attempts)
+                self._append(OP_ENQUEUE, item_id, encrypted_token, attempts)
+                self._schedule_retry(item_id, attempts)
+            else:
+                self.dead_lettered += 1
+                self.dead_letters.append({
+                    "item": item_id.hex(),
+                    "attempts": attempts,
+                    "reason": outcome,
+                    "at": int(time.time()),
+                })
+                print(f"❌ Token revocation dead-lettered after {attempts} attempts: {outcome}")
+                self._finish(item_id)
+
+    async def _revoke(self, encrypted_token: bytes) -> str:
+        token = self._decrypt(encrypted_token)
+        try:
+            response = await self._client().post(
+                self.revoke_url,
+                data={"token": token},
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
+        except httpx.HTTPError as e:
+            return f"retry: {type(e).__name__}"
+        if response.status_code == 200:
+            return "revoked"
+        if response.status_code == 400:
+            return "invalid"
+        if response.status_code == 429 or response.status_code >= 500:
+            return f"retry: HTTP {response.status_code}"
+        return f"rejected: HTTP {response.status_code}"
+
+    # ------------------------------------------------------------------
+    # Durable log
+    # ------------------------------------------------------------------
+
+    def _append(self, op: int, item_id: bytes, encrypted_token: bytes = b"", attempts: int = 0) -> None:
+        if self._log is None:
+            return
+        payload = LOG_ENTRY.pack(op, item_id)
+        if op == OP_ENQUEUE:
+            payload += LOG_ATTEMPTS.pack(attempts) + encrypted_token
+        frame = encode_frame(payload)
+        self._log.write(frame)
+        self._log.flush()
+        self._log_bytes += len(frame)
+        if self._log_bytes > self.max_log_bytes:
+            self._rewrite_log()
+
+    def _open_log(self) -> int:
+        directory = os.path.dirname(self.log_path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                data = f.read()
+            for payload in iter_frames(data):
+                op, item_id = LOG_ENTRY.unpack_from(payload)
+                if op == OP_ENQUEUE:
+                    (attempts,) = LOG_ATTEMPTS.unpack_from(payload, LOG_ENTRY.size)
+                    self._pending[item_id] = (bytes(payload[LOG_ENTRY.size + LOG_ATTEMPTS.size:]), attempts)
+                else:
+                    self._pending.pop(item_id, None)
+        self._rewrite_log()
+        for item_id in self._pending:
+            self._queue.put_nowait(item_id)
+        if self._pending:
+            self._idle.clear()
+        return len(self._pending)
+
+    def _rewrite_log(self) -> None:
+        """Replace the log with one ENQUEUE frame per pending item"""
+        if self._log is not None:
+            self._log.close()
+        temp_path = self.log_path + ".tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            for item_id, (encrypted_token, attempts) in self._pending.items():
+                f.write(encode_frame(
+                    LOG_ENTRY.pack(OP_ENQUEUE, item_id) + LOG_ATTEMPTS.pack(attempts) + encrypted_token
+                ))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.log_path)
+        self._log = open(self.log_path, "ab")
+        self._log_bytes = self._log.tell()
+
+    def _truncate_log(self) -> None:
+        if self._log is not None and self._log_bytes:
+            self._log.truncate(0)
+            self._log_bytes = 0
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "running": bool(self._workers),
+            "durable": self._log is not None,
+            "pending": len(self._pending),
+            "waiting_retry": len(self._retry_handles),
+            "enqueued": self.enqueued,
+            "revoked": self.revoked,
+            "already_invalid": self.already_invalid,
+            "retries": self.retries,
+            "dead_lettered": self.dead_lettered,
+        }
@@ -0,0 +1,190 @@
+"""
+Shared Upstream HTTP Client
+One pooled, keep-alive (HTTP/2 when available) client per process for all
+calls to Google and Supabase, created and closed by the app lifespan hook
+"""
+from typing import Optional, Dict, Any, Callable
+import importlib.util
+import time
+import httpx
+
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]")
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class _CountingTransport(httpx.AsyncBaseTransport):
+    """Wraps the pooled transport to keep cheap request counters"""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, owner: "UpstreamClient"):
+        self.inner = inner
+        self.owner = owner
+        self.requests_total = 0
+        self.requests_in_flight = 0
+        self.errors_total = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests_total += 1
+        self.requests_in_flight += 1
+        observer = self.owner.observer
+        started = time.perf_counter() if observer else 0.0
+        try:
+            response = await self.inner.handle_async_request(request)
+        except Exception:
+            self.errors_total += 1
+            if observer:
+                observer(request, None, time.perf_counter() - started)
+            raise
+        finally:
+            self.requests_in_flight -= 1
+        if observer:
+            observer(request, response.status_code, time.perf_counter() - started)
+        if response.status_code >= 500:
+            self.errors_total += 1
+        return response
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+class UpstreamClient:
+    """
+    App-lifetime holder for the shared httpx clients
+
+    `client` is the async client used by the endpoints, `sync_client` is used
+    by the fallback Supabase table client. Both are created lazily so the
+    module can be used before (or without) the lifespan hook running.
+    """
+
+    def __init__(
+        self,
+        http2: bool = True,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 10.0,
+        write_timeout: float = 10.0,
+        pool_timeout: float = 5.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=write_timeout,
+            pool=pool_timeout,
+        )
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._counter: Optional[_CountingTransport] = None
+        self._sync_client: Optional[httpx.Client] = None
+        # Called as observer(request, status or None on error, seconds) per request
+        self.observer: Optional[Callable[[httpx.Request, Optional[int], float], None]] = None
+
+    @classmethod
+    def from_settings(cls, settings) -> "UpstreamClient":
+        """Build a client from the UPSTREAM_* settings"""
+        return cls(
+            http2=settings.upstream_http2,
+            max_connections=settings.upstream_max_connections,
+            max_keepalive_connections=settings.upstream_max_keepalive,
+            keepalive_expiry=settings.upstream_keepalive_expiry,
+            connect_timeout=settings.upstream_connect_timeout,
+            read_timeout=settings.upstream_read_timeout,
+            write_timeout=settings.upstream_write_timeout,
+            pool_timeout=settings.upstream_pool_timeout,
+        )
+
+    def use_transport(self, transport: httpx.AsyncBaseTransport) -> None:
+        """Route async requests through `transport` (e.g. local stand-ins); call before first use"""
+        if self._client is not None:
+            raise RuntimeError("Upstream client already created")
+        self._transport = transport
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Create the shared async client (called from the lifespan hook)"""
+        _ = self.client
+
+    async def aclose(self) -> None:
+        """Close both clients and drop their pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._counter = None
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            inner = self._transport or httpx.AsyncHTTPTransport(
+                http2=self.http2,
+                limits=self.limits,
+            )
+            self._counter = _CountingTransport(inner, self)
+            self._client = httpx.AsyncClient(
+                transport=self._counter,
+                timeout=self.timeout,
+            )
+        return self._client
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(
+                http2=self.http2,
+                limits=self.limits,
+                timeout=self.timeout,
+            )
+        return self._sync_client
+
+    def stats(self) -> Dict[str, Any]:
+        """Report pool configuration, connection counts and request counters"""
+        counter = self._counter
+        connections = []
+        if counter is not None:
+            pool = getattr(counter.inner, "_pool", None)
+            connections = list(getattr(pool, "connections", []) or [])
+
+        idle = sum(1 for conn in connections if conn.is_idle())
+        http2_connections = sum(
+            1 for conn in connections
+            if "HTTP/2" in getattr(conn, "info", lambda: "")()
+        )
+
+        return {
+            "started": self._client is not None,
+            "http2": self.http2,
+            "limits": {
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "keepalive_expiry": self.limits.keepalive_expiry,
+            },
+            "timeouts": {
+                "connect": self.timeout.connect,
+                "read": self.timeout.read,
+                "write": self.timeout.write,
+                "pool": self.timeout.pool,
+            },
+            "connections": {
+                "total": len(connections),
+                "idle": idle,
+                "active": len(connections) - idle,
+                "http2": http2_connections,
+            },
+            "requests": {
+                "total": counter.requests_total if counter else 0,
+                "in_flight": counter.requests_in_flight if counter else 0,
+                "errors": counter.errors_total if counter else 0,
+            },
+        }
@@ -20,6 +20,20 @@ function App() {
     checkExistingSession()
   }, [])
 
+  // Follow refreshes and logouts pushed by the backend (e.g. from another tab)
+  useEffect(() => {
+    return authTokenManager.subscribe((event) => {
+      if (event === 'logout') {
+        setUser(null);
+        setAccessToken(null);
+        setRefreshToken(null);
+        showMessage('You have been logged out.', 'info');
+      } else {
+        updateAppStateFromAuthManager();
+      }
+    });
+  }, [])
+
   const checkAuthCallback = async () => {
     const urlParams = new URLSearchParams(window.location.search)
     const authStatus = urlParams.get('auth')
@@ -1,6 +1,9 @@
 /**
  * Token Manager for Google OAuth2
  * Handles automatic token refresh and storage
+ *
+ * While the session event stream is open the backend refreshes tokens and
+ * pushes them to every tab, so tabs don't run their own refresh timers
  */
 
 const BACKEND_URL = import.meta.env.VITE_BACKEND_URL || 'http://localhost:8060';
@@ -13,6 +16,9 @@ class AuthTokenManager {
     this.expiresAt = null;
     this.scopes = []; // Initialize scopes
     this.refreshTimer = null;
+    this.eventSource = null;
+    this.sessionEtag = null;
+    this.listeners = new Set();
   }
 
   /**
@@ -20,60 +26,163 @@ class AuthTokenManager {
    */
   async initialize(userId) {
     try {
-      const response = await fetch(`${BACKEND_URL}/api/auth/validate?user_id=${userId}`);
-      const data = await response.json();
+      // Subscribe before reading the session so no change falls in between
+      this.openEventStream(userId);
+      const initialized = await this.loadSession(userId);
+      if (!initialized) {
+        this.closeEventStream();
+      }
+      return initialized;
+    } catch (error) {
+      console.error('Failed to initialize token manager:', error);
+      this.closeEventStream();
+      return false;
+    }
+  }
 
-      if (data.valid) {
-        this.user = data.user;
+  /**
+   * Load validity, profile and tokens in one request
+   * Sends the last ETag, so an unchanged session costs a 304
+   */
+  async loadSession(userId) {
+    const headers = this.sessionEtag ? { 'If-None-Match': this.sessionEtag } : {};
+    const response = await fetch(`${BACKEND_URL}/api/auth/session/${userId}`, { headers });
 
-        // Get full session data
-        const sessionResponse = await fetch(`${BACKEND_URL}/api/auth/user/${userId}`);
-        if (sessionResponse.ok) {
-          const session = await sessionResponse.json();
-          this.accessToken = session.access_token;
-          this.refreshToken = session.refresh_token;
-          this.expiresAt = new Date(session.expires_at);
-          this.scopes = session.scopes || []; // Store scopes
+    if (response.status === 304) {
+      return this.isAuthenticated();
+    }
 
-          // Start auto-refresh
-          this.scheduleTokenRefresh();
-        }
+    const data = await response.json();
+    this.sessionEtag = response.headers.get('ETag');
 
-        return true;
-      } else if (data.requires_refresh && this.refreshToken) {
-        // Token expired, try to refresh
-        return await this.refreshAccessToken();
-      }
+    if (data.session) {
+      this.applySession(data.session);
+    }
 
-      return false;
-    } catch (error) {
-      console.error('Failed to initialize token manager:', error);
-      return false;
+    if (data.valid) {
+      this.scheduleTokenRefresh();
+      return true;
+    } else if (data.requires_refresh && this.refreshToken) {
+      // Token expired, try to refresh
+      return await this.refreshAccessToken();
     }
+
+    return false;
   }
 
   /**
    * Store user session after login
    */
   storeSession(userData) {
-    this.user = {
-      user_id: userData.user_id,
-      email: userData.email,
-      name: userData.name,
-      picture: userData.picture
-    };
-    this.accessToken = userData.access_token;
-    this.refreshToken = userData.refresh_token;
-    this.expiresAt = new Date(userData.expires_at);
-    this.scopes = userData.scopes || []; // Store scopes
+    this.applySession(userData);
 
     // Store user ID in localStorage
     localStorage.setItem('user_id', userData.user_id);
 
+    this.openEventStream(userData.user_id);
+
     // Schedule token refresh
     this.scheduleTokenRefresh();
   }
 
+  /**
+   * Take user, tokens, expiry and scopes from a session object
+   */
+  applySession(session) {
+    this.user = {
+      user_id: session.user_id,
+      email: session.email,
+      name: session.name,
+      picture: session.picture
+    };
+    this.accessToken = session.access_token;
+    this.refreshToken = session.refresh_token;
+    this.expiresAt = new Date(session.expires_at);
+    this.scopes = session.scopes || []; // Store scopes
+  }
+
+  /**
+   * Listen for session changes pushed by the backend
+   * The listener gets 'refresh' or 'logout'; returns an unsubscribe function
+   */
+  subscribe(listener) {
+    this.listeners.add(listener);
+    return () => this.listeners.delete(listener);
+  }
+
+  notify(event) {
+    this.listeners.forEach((listener) => listener(event));
+  }
+
+  /**
+   * Open the server-sent event stream for refresh, expiry and logout events
+   */
+  openEventStream(userId) {
+    if (typeof EventSource === 'undefined') return;
+    this.closeEventStream();
+
+    const source = new EventSource(`${BACKEND_URL}/api/auth/events/${userId}`);
+    let connected = false;
+
+    source.onopen = () => {
+      // After a reconnect, catch up on anything missed; usually a 304
+      if (connected) {
+        this.loadSession(userId).catch((error) => console.error('Failed to reload session:', error));
+      }
+      connected = true;
+      this.scheduleTokenRefresh();
+    };
+
+    source.addEventListener('refresh', (event) => {
+      this.applySession(JSON.parse(event.data));
+      this.sessionEtag = null;
+      this.scheduleTokenRefresh();
+      this.notify('refresh');
+    });
+
+    source.addEventListener('expiry', () => {
+      // The backend could not refresh in time; one tab's refresh reaches the
+      // others as a refresh event, so spread the attempts out
+      if (this.refreshTimer) {
+        clearTimeout(this.refreshTimer);
+      }
+      this.refreshTimer = setTimeout(() => {
+        if (this.isTokenExpired()) {
+          this.refreshAccessToken();
+        }
+      }, Math.random() * 2000);
+    });
+
+    source.addEventListener('logout', () => {
+      this.clearSession();
+      this.notify('logout');
+    });
+
+    source.onerror = () => {
+      // The browser reconnects by itself unless the stream was refused
+      if (source.readyState === EventSource.CLOSED && this.eventSource === source) {
+        this.eventSource = null;
+        this.scheduleTokenRefresh();
+      }
+    };
+
+    this.eventSource = source;
+  }
+
+  closeEventStream() {
+    if (this.eventSource) {
+      this.eventSource.close();
+      this.eventSource = null;
+    }
+  }
+
+  /**
+   * Whether the backend is pushing token refreshes to this tab
+   */
+  isStreaming() {
+    return !!this.eventSource && this.eventSource.readyState === EventSource.OPEN;
+  }
+
   /**
    * Get current access token
    */
@@ -144,6 +253,15 @@ class AuthTokenManager {
         })
       });
 
+      if (response.status === 503 || response.status === 429) {
+        // Backend is shedding load (e.g. Google is down): keep the session
+        // and try again when the server says to, instead of logging out
+        const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 30;
+        console.warn(`Token refresh unavailable, retrying in ${retryAfter}s`);
+        this.scheduleRefreshRetry(retryAfter);
+        return false;
+      }
+
       if (!response.ok) {
         throw new Error('Failed to refresh token');
       }
@@ -185,17 +303,32 @@ class AuthTokenManager {
     }
   }
 
+  /**
+   * Retry a refresh the backend turned away after `seconds` (with jitter)
+   */
+  scheduleRefreshRetry(seconds) {
+    if (this.refreshTimer) {
+      clearTimeout(this.refreshTimer);
+    }
+
+    const delay = seconds * 1000 * (1 + Math.random() * 0.5);
+    this.refreshTimer = setTimeout(() => {
+      this.refreshAccessToken();
+    }, delay);
+  }
+
   /**
    * Schedule automatic token refresh
-   * Refresh 5 minutes before expiry
+   * Refresh 5 minutes before expiry, unless the event stream delivers refreshes
    */
   scheduleTokenRefresh() {
     // Clear existing timer
     if (this.refreshTimer) {
       clearTimeout(this.refreshTimer);
+      this.refreshTimer = null;
     }
 
-    if (!this.expiresAt) return;
+    if (!this.expiresAt || this.isStreaming()) return;
 
     const now = new Date();
     const expiresIn = this.expiresAt.getTime() - now.getTime();
@@ -237,6 +370,8 @@ class AuthTokenManager {
     this.refreshToken = null;
     this.expiresAt = null;
     this.scopes = [];
+    this.sessionEtag = null;
+    this.closeEventStream();
 
     if (this.refreshTimer) {
       clearTimeout(this.refreshTimer);